@@ -1,14 +1,27 @@
 
 import streamlit as st
 import os
-from src.ingestion import load_pdf, process_image, load_template
-from src.analysis import analyze_content, synthesize_report_data
-from src.generation import generate_ddr_markdown
+import io
+import asyncio
+import hashlib
+from src.ingestion import compact_pages, parse_pdf, process_image, load_template
+from src.artifacts import parse_pdf_cached
+from src.analysis import analyze_content_async, stream_polish_report
+from src.cache import get_response_cache
+from src.selection import select_images
+from src.encoding import EncodingConfig
+from src.service_client import download_artifact, submit_job, wait_for_job
+from src.generation import generate_ddr_markdown, normalize_markdown, render_export, start_exports
+from src.tracing import RunTrace, start_run
+from src.warmup import start_warmup
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
+# When set, the UI is a thin client of the DDR job service (see service.py)
+SERVICE_URL = os.getenv("DDR_SERVICE_URL")
+
 st.set_page_config(page_title="AI DDR Generator", layout="wide")
 
 st.title("🏗️ Automated Detailed Diagnostic Report (DDR) Generator")
@@ -36,6 +49,205 @@ with st.sidebar:
         help="Use GPT-4o for best results on complex forms. Tesseract requires local installation."
     )
 
+    # Response Cache
+    use_cache = st.checkbox(
+        "Reuse cached AI responses",
+        value=True,
+        help="Identical documents are answered from the local response cache instead of calling GPT-4o again; "
+             "when only some inputs change, the results for the unchanged pages and images are reused."
+    )
+
+    # Image Budget
+    max_images = st.number_input(
+        "Max images for AI analysis",
+        min_value=1,
+        max_value=100,
+        value=20,
+        help="Duplicates are removed first; the most relevant images (thermal captures first) are kept."
+    )
+
+    # Long Reports
+    chunked_analysis = st.checkbox(
+        "Analyze long reports in chunks",
+        value=True,
+        help="Splits the report by page into token-bounded chunks analyzed in parallel instead of truncating it."
+    )
+
+    # Vision Encoding
+    image_detail = st.selectbox(
+        "Vision image detail",
+        ("auto", "high", "low"),
+        help="'auto' sends small images at low detail. Low detail costs a flat 85 tokens per image."
+    )
+    max_image_tokens = st.number_input(
+        "Image token cap per report (0 = no cap)",
+        min_value=0,
+        value=0,
+        step=1000,
+        help="Large images are downgraded to low detail first when the cap is reached."
+    )
+    local_thermal = st.checkbox(
+        "Read thermal images locally",
+        value=True,
+        help="FLIR-style images with a colour scale bar are measured on this machine; only the rest go to GPT-4o Vision."
+    )
+    compact_text = st.checkbox(
+        "Strip repeated headers and boilerplate",
+        value=True,
+        help="Page headers/footers and disclaimers repeated on every page are sent once, whitespace is collapsed "
+             "and checklist tables are condensed, so more of the report fits into each request."
+    )
+
+    # Report Writing
+    polish_prose = st.checkbox(
+        "Polish report wording with GPT-4o",
+        value=False,
+        help="The report is filled from the template locally; this adds a second AI pass that only rephrases the prose."
+    )
+
+# UI cache limits: entries per stage, shared by all sessions of this server process. Streamlit
+# caches can only be bounded by entry count; the parsed PDFs they hold keep images lazy/spilled.
+UI_CACHE_ENTRIES = int(os.getenv("DDR_UI_CACHE_ENTRIES", "16"))
+UI_CACHE_TTL = int(os.getenv("DDR_UI_CACHE_TTL", "3600"))
+# Largest pre-rendered export (e.g. downloaded from the service) kept in a session
+SESSION_REPORT_MAX_BYTES = int(os.getenv("DDR_SESSION_REPORT_MAX_MB", "50")) * 1024 * 1024
+
+def content_digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+class UncachedResult(Exception):
+    """Carries a result that contains errors out of a cached stage, so st.cache_data does not keep it."""
+    def __init__(self, result):
+        super().__init__("result contains errors")
+        self.result = result
+
+def uncached_on_error(func):
+    """Calls a cached stage, using (but not caching) results that contain errors."""
+    def wrapper(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        except UncachedResult as e:
+            return e.result
+    return wrapper
+
+# Arguments starting with "_" are not hashed by st.cache_data / st.cache_resource: each stage is keyed
+# by the content hash of its inputs only.
+@uncached_on_error
+@st.cache_resource(max_entries=UI_CACHE_ENTRIES, ttl=UI_CACHE_TTL, show_spinner=False)
+def cached_parse_pdf(digest: str, _data: bytes, use_cache: bool = True) -> dict:
+    # A resource, not data: the parsed text is small, but pickling the images on every hit would
+    # copy their sources and spill page renders again. Callers only read the result.
+    # With use_cache, parsed PDFs also persist across server restarts (src.artifacts).
+    doc = (parse_pdf_cached if use_cache else parse_pdf)(io.BytesIO(_data))
+    if doc["text"].startswith("Error"):
+        raise UncachedResult(doc)
+    return doc
+
+@st.cache_data(max_entries=UI_CACHE_ENTRIES * 4, ttl=UI_CACHE_TTL, show_spinner=False)
+def cached_process_image(digest: str, _data: bytes):
+    # Keeps the encoded bytes only; pixels are decoded on demand within the image store's cap
+    return process_image(io.BytesIO(_data))
+
+@uncached_on_error
+@st.cache_data(max_entries=UI_CACHE_ENTRIES, ttl=UI_CACHE_TTL, show_spinner=False)
+def cached_analysis(run_key: str, _api_key: str, _inspection_pages, _thermal_pages, _images: list, _kwargs: dict) -> dict:
+    result = asyncio.run(analyze_content_async(_api_key, _inspection_pages, _thermal_pages, _images, **_kwargs))
+    if result["text_analysis"].startswith("Error") or any(str(obs).startswith("Error") for obs in result["image_analysis"]):
+        raise UncachedResult(result)
+    return result
+
+EXPORT_FORMATS = {
+    "pdf": ("Download PDF", "Generated_DDR.pdf", "application/pdf"),
+    "docx": ("Download Word (DOCX)", "Generated_DDR.docx", "application/vnd.openxmlformats-officedocument.wordprocessingml.document"),
+}
+
+def remember_report(final_output: str, key: str, exports: dict = None):
+    """
+    Stores the finished report in the session. PDF/DOCX are not rendered here: they are produced
+    in the background and memoized by markdown hash (see render_export), unless already
+    available as bytes (service mode).
+    """
+    exports = exports or {}
+    if sum(len(data or b"") for data in exports.values()) > SESSION_REPORT_MAX_BYTES:
+        exports = {}
+    st.session_state["report"] = {"key": key, "markdown": final_output, "exports": exports}
+
+def render_report(final_output: str, exports: dict = None):
+    """Shows the generated report right away; each download button appears as soon as its export is rendered."""
+    exports = exports or {}
+    # Kick off both binary renders concurrently before drawing anything
+    futures = {fmt: render_export(final_output, fmt) for fmt in EXPORT_FORMATS if not exports.get(fmt)}
+
+    st.subheader("Generated Detailed Diagnostic Report")
+    st.markdown(final_output)
+
+    st.subheader("Download Options")
+    col_dl1, col_dl2, col_dl3 = st.columns(3)
+
+    with col_dl1:
+        st.download_button(
+            label="Download Markdown",
+            data=final_output,
+            file_name="Generated_DDR.md",
+            mime="text/markdown"
+        )
+    for col, (fmt, (label, file_name, mime)) in zip((col_dl2, col_dl3), EXPORT_FORMATS.items()):
+        with col:
+            data = exports.get(fmt)
+            if not data:
+                with st.spinner(f"Rendering {fmt.upper()}..."):
+                    try:
+                        data = futures[fmt].result()
+                    except Exception as e:
+                        print(f"{fmt.upper()} rendering failed: {e}")
+                        data = b""
+            if data:
+                st.download_button(label=label, data=data, file_name=file_name, mime=mime)
+            else:
+                st.error(f"{fmt.upper()} generation failed.")
+
+def show_run_summary(summary: dict):
+    """Sidebar breakdown of the last run: time per stage, LLM calls, tokens and estimated cost."""
+    if not summary:
+        return
+    llm = summary.get("llm") or {}
+    with st.sidebar.expander("Last run metrics", expanded=False):
+        st.caption(
+            f"Total: {summary['duration_s']:.1f}s | LLM calls: {llm.get('calls', 0)} "
+            f"(cache hits: {llm.get('llm_cache_hits', 0)}, reused results: {llm.get('artifact_hits', 0)})"
+        )
+        st.caption(
+            f"Tokens: {int(llm.get('prompt_tokens', 0)):,} in / {int(llm.get('completion_tokens', 0)):,} out "
+            f"| est. cost: ${llm.get('cost_usd', 0):.4f}"
+        )
+        # Read after the run, so the totals include it
+        cache_stats = get_response_cache().stats()
+        st.caption(f"Response cache (this server): {cache_stats['hits']} hits | {cache_stats['misses']} misses")
+        st.dataframe(
+            [{"span": name, "count": stage["count"], "seconds": round(stage["duration_s"], 2), "errors": stage["errors"]}
+             for name, stage in summary.get("stages", {}).items()],
+            hide_index=True,
+        )
+
+def show_service_job(job_id: str):
+    """Follows a job on the DDR service and renders its artifacts once it is done."""
+    status_box = st.empty()
+    with st.spinner("Waiting for the DDR service..."):
+        status = wait_for_job(
+            SERVICE_URL, job_id,
+            on_status=lambda s: status_box.info(f"Job {job_id}: {s['status']}")
+        )
+    if status["status"] == "done":
+        status_box.success(f"Job {job_id} finished.")
+        final_output = download_artifact(SERVICE_URL, job_id, "md").decode("utf-8")
+        exports = {fmt: download_artifact(SERVICE_URL, job_id, fmt) for fmt in EXPORT_FORMATS}
+        remember_report(final_output, f"job:{job_id}", exports)
+        st.session_state["run_trace"] = status.get("trace")
+    elif status["status"] == "failed":
+        status_box.error(f"An error occurred during generation: {status.get('error', 'unknown error')}")
+    else:
+        status_box.warning(f"Job {job_id} not found on the service.")
+
 # File Upload Section
 st.header("1. Upload Documents")
 col1, col2 = st.columns(2)
@@ -50,49 +262,88 @@ with col2:
 if st.button("Generate DDR Report"):
     if not uploaded_pdf:
         st.error("Please upload the Sample Inspection Report PDF.")
+    elif SERVICE_URL:
+        # Thin-client mode: hand the bundle to the job service; the job survives reconnects
+        job_id = submit_job(
+            SERVICE_URL,
+            uploaded_pdf.getvalue(),
+            uploaded_thermal_pdf.getvalue() if uploaded_thermal_pdf else None,
+            [(f.name, f.getvalue()) for f in uploaded_images or []],
+            options={
+                "use_tesseract": "Tesseract" in ocr_engine,
+                "use_cache": use_cache,
+                "chunked": chunked_analysis,
+                "max_images": int(max_images),
+                "image_detail": image_detail,
+                "max_image_tokens": int(max_image_tokens) or None,
+                "polish": polish_prose,
+                "local_thermal": local_thermal,
+                "compact_text": compact_text,
+            },
+            api_key=api_key,
+        )
+        st.session_state["job_id"] = job_id
+        st.query_params["job"] = job_id
     else:
-        with st.spinner("Processing documents..."):
+        with st.spinner("Processing documents..."), start_run() as run:
             # 1. Ingestion
-            # -- Extract Text --
-            text_content = load_pdf(uploaded_pdf)
-            st.success(f"Inspection Report Loaded: {len(text_content)} chars.")
+            # -- Parse PDFs (text + images in a single pass), cached by content hash --
+            inspection_bytes = uploaded_pdf.getvalue()
+            inspection_digest = content_digest(inspection_bytes)
+            inspection_doc = cached_parse_pdf(inspection_digest, inspection_bytes, use_cache)
+            text_content = inspection_doc["text"]
+            st.success(f"Inspection Report Loaded: {len(text_content)} chars, {len(inspection_doc['pages'])} pages.")
             
             thermal_text_content = ""
+            thermal_doc = None
+            thermal_digest = ""
             if uploaded_thermal_pdf:
-                thermal_text_content = load_pdf(uploaded_thermal_pdf)
-                st.success(f"Thermal Report Loaded: {len(thermal_text_content)} chars.")
+                thermal_bytes = uploaded_thermal_pdf.getvalue()
+                thermal_digest = content_digest(thermal_bytes)
+                thermal_doc = cached_parse_pdf(thermal_digest, thermal_bytes, use_cache)
+                thermal_text_content = thermal_doc["text"]
+                st.success(f"Thermal Report Loaded: {len(thermal_text_content)} chars, {len(thermal_doc['pages'])} pages.")
             
             # -- Extract Images --
-            # We want to prioritize Manual Uploads -> Thermal PDF -> Inspection PDF
-            # because we limit to 20 images, and Thermal/Manual are most critical.
+            # Images from all sources go through the selection stage, which removes
+            # near-duplicates and keeps the most relevant ones within the image budget.
             
             manual_images = []
             thermal_pdf_images = []
             inspection_pdf_images = []
+            image_digests = []
 
             # 1. From Manual Uploads
             if uploaded_images:
                 for img_file in uploaded_images:
-                    img = process_image(img_file)
+                    img_bytes = img_file.getvalue()
+                    image_digests.append(content_digest(img_bytes))
+                    img = cached_process_image(image_digests[-1], img_bytes)
                     if img:
                         manual_images.append(img)
                 st.success(f"Processed {len(manual_images)} manually uploaded images.")
 
             # 2. From Thermal PDF
-            from src.ingestion import extract_images_from_pdf
-            if uploaded_thermal_pdf:
-                thermal_pdf_images = extract_images_from_pdf(uploaded_thermal_pdf)
+            if thermal_doc:
+                thermal_pdf_images = thermal_doc["images"]
                 if thermal_pdf_images:
                      st.info(f"Extracted {len(thermal_pdf_images)} images from Thermal Report.")
 
             # 3. From Inspection PDF
-            if uploaded_pdf:
-                inspection_pdf_images = extract_images_from_pdf(uploaded_pdf)
-                if inspection_pdf_images:
-                    st.info(f"Extracted {len(inspection_pdf_images)} images from Inspection Report.")
+            inspection_pdf_images = inspection_doc["images"]
+            if inspection_pdf_images:
+                st.info(f"Extracted {len(inspection_pdf_images)} images from Inspection Report.")
 
-            # Combine in priority order
-            processed_images = manual_images + thermal_pdf_images + inspection_pdf_images
+            # Deduplicate, rank and apply the image budget
+            selection = select_images(
+                [("manual", manual_images), ("thermal_pdf", thermal_pdf_images), ("inspection_pdf", inspection_pdf_images)],
+                max_images=int(max_images)
+            )
+            processed_images = selection["images"]
+            st.info(
+                f"Selected {len(processed_images)} of {selection['total']} images for analysis "
+                f"({selection['duplicates_removed']} duplicates removed, {selection['dropped_by_budget']} over budget)."
+            )
 
             # 2. Analysis
             st.info("Analyzing content with AI... (This may take a moment for large reports)")
@@ -101,55 +352,83 @@ if st.button("Generate DDR Report"):
                 # Load template text for style guide
                 template_text = load_template("assets/main_ddr_template.txt")
                 
-                # Analyze docs (Text + Images)
+                # Analyze docs (Text + Images concurrently)
                 use_tesseract = "Tesseract" in ocr_engine
-                analysis_result = analyze_content(api_key, text_content, thermal_text_content, processed_images, use_tesseract=use_tesseract)
-                
-                # Synthesize final report based on template structure
-                final_report_md = synthesize_report_data(api_key, analysis_result, template_text)
-                
-                # 3. Generation (Formatting wrapper)
-                final_output = generate_ddr_markdown({'report_content': final_report_md}, "")
-                
-                # Generate Binary Formats
-                from src.generation import generate_pdf, generate_docx
-                pdf_bytes = generate_pdf(final_output)
-                docx_bytes = generate_docx(final_output)
+                encoding = EncodingConfig(detail=image_detail, max_image_tokens=int(max_image_tokens) or None)
+                inspection_pages = [page["text"] for page in inspection_doc["pages"]] or text_content
+                thermal_pages = [page["text"] for page in thermal_doc["pages"]] if thermal_doc else thermal_text_content
+                if compact_text:
+                    compacted = []
+                    if inspection_doc["pages"]:
+                        compacted.append(compact_pages(inspection_pages))
+                        inspection_pages = compacted[-1]["pages"]
+                    if thermal_doc and thermal_doc["pages"]:
+                        compacted.append(compact_pages(thermal_pages))
+                        thermal_pages = compacted[-1]["pages"]
+                    before = sum(c["chars_before"] for c in compacted)
+                    after = sum(c["chars_after"] for c in compacted)
+                    if before:
+                        st.caption(f"Report text compacted to {after:,} of {before:,} chars ({after / before:.0%}).")
+                analysis_kwargs = dict(use_tesseract=use_tesseract, use_cache=use_cache, encoding=encoding, chunked=chunked_analysis,
+                                       local_thermal=local_thermal)
+                # Same uploads + same settings = same run; reruns are served from the UI cache
+                run_key = content_digest(repr((inspection_digest, thermal_digest, image_digests, int(max_images), use_tesseract, chunked_analysis, encoding, local_thermal, compact_text)).encode("utf-8"))
+                if use_cache:
+                    analysis_result = cached_analysis(run_key, api_key, inspection_pages, thermal_pages, processed_images, analysis_kwargs)
+                else:
+                    analysis_result = asyncio.run(analyze_content_async(api_key, inspection_pages, thermal_pages, processed_images, **analysis_kwargs))
+                if analysis_result.get("image_token_estimate"):
+                    st.caption(f"Estimated image input tokens: {analysis_result['image_token_estimate']:,}")
+                if analysis_result.get("images_local"):
+                    st.caption(f"Thermal images read locally (no Vision call): {analysis_result['images_local']}")
                 
-                # Display Result
-                st.subheader("Generated Detailed Diagnostic Report")
-                st.markdown(final_output)
+                # 3. Generation: fill the template locally from the structured analysis
+                final_output = generate_ddr_markdown(analysis_result, template_text)
                 
-                st.subheader("Download Options")
-                col_dl1, col_dl2, col_dl3 = st.columns(3)
+                # Optional prose polishing (the only second LLM call), streamed as it is written.
+                # The preview is replaced by the full report view; exports use the assembled text.
+                # A stream that breaks off midway is discarded in favour of the unpolished report.
+                polished = False
+                if polish_prose and not final_output.startswith("Error"):
+                    preview = st.empty()
+                    try:
+                        with preview.container():
+                            st.subheader("Generated Detailed Diagnostic Report")
+                            streamed = st.write_stream(stream_polish_report(api_key, final_output, use_cache=use_cache))
+                        final_output = normalize_markdown(streamed if isinstance(streamed, str) else "".join(str(part) for part in streamed))
+                        polished = True
+                    except Exception as e:
+                        st.warning(f"Report polishing failed, showing the unpolished report: {e}")
+                    preview.empty()
                 
-                with col_dl1:
-                    st.download_button(
-                        label="Download Markdown",
-                        data=final_output,
-                        file_name="Generated_DDR.md",
-                        mime="text/markdown"
-                    )
-                with col_dl2:
-                    if pdf_bytes:
-                        st.download_button(
-                            label="Download PDF",
-                            data=pdf_bytes,
-                            file_name="Generated_DDR.pdf",
-                            mime="application/pdf"
-                        )
-                    else:
-                        st.error("PDF generation failed.")
-                with col_dl3:
-                    if docx_bytes:
-                        st.download_button(
-                            label="Download Word (DOCX)",
-                            data=docx_bytes,
-                            file_name="Generated_DDR.docx",
-                            mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-                        )
-                    else:
-                        st.error("DOCX generation failed.")
+                # Keep the result for this session: downloads and widget changes rerun the
+                # script, and the report is shown again from here without any parsing or LLM call.
+                # Binary formats render in the background while the report is displayed.
+                remember_report(final_output, f"{run_key}:polished" if polished else run_key)
+                # Start the exports inside the traced run so their render time shows up in the metrics
+                start_exports(final_output, list(EXPORT_FORMATS))
+                st.session_state["run_trace"] = run
                 
             except Exception as e:
                 st.error(f"An error occurred during generation: {str(e)}")
+
+# Thin-client mode: follow the current job (also after a reconnect, via the ?job= URL parameter)
+if SERVICE_URL:
+    current_job = st.session_state.get("job_id") or st.query_params.get("job")
+    report = st.session_state.get("report")
+    if current_job and not (report and report["key"] == f"job:{current_job}"):
+        show_service_job(current_job)
+
+# Display Result (from the session, so it survives reruns)
+if st.session_state.get("report"):
+    report = st.session_state["report"]
+    render_report(report["markdown"], report["exports"])
+
+# Per-run metrics (local runs keep the live trace, so export render time is included once done)
+run_trace = st.session_state.get("run_trace")
+show_run_summary(run_trace.summary() if isinstance(run_trace, RunTrace) else run_trace)
+
+# The page is rendered: load the PDF/LLM/rendering backends in the background (once per server process),
+# so the first report does not pay for them. Thin clients never run the pipeline locally.
+if not SERVICE_URL:
+    start_warmup()
@@ -0,0 +1,261 @@
+"""
+Headless batch runner for the DDR pipeline.
+
+Processes many report bundles (inspection PDF, optional thermal PDF, optional images)
+through a bounded worker pool with a global LLM concurrency limit.
+
+Usage:
+    python batch.py INPUT_DIR --output out/
+    python batch.py --manifest bundles.jsonl --output out/ --workers 8 --llm-concurrency 16
+
+INPUT_DIR contains one sub-directory per bundle. The thermal PDF is the PDF with "thermal" in its
+name, the inspection PDF is the other one; .png/.jpg/.jpeg files are extra images.
+A manifest is a .jsonl file ({"id", "inspection", "thermal", "images": [...]}) or a .csv file
+with columns id,inspection,thermal,images (images separated by ';').
+
+Each bundle gets OUTPUT/<id>/ with Generated_DDR.md/.pdf/.docx and status.json.
+Bundles whose status is "done" are skipped on the next run, so an interrupted backfill
+can simply be restarted. A summary of all bundles (stage timings, LLM tokens and estimated
+cost) is written to OUTPUT/summary.csv.
+
+--record CASSETTE saves all LLM traffic of a run; --replay CASSETTE plays it back offline, so
+profiling and regression runs on the same bundles see identical responses. Both bypass the
+response cache and stored artifacts, so a recording holds every request of the run.
+"""
+import argparse
+import csv
+import json
+import os
+import re
+import sys
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dotenv import load_dotenv
+from src.analysis import set_llm_backend
+from src.clients import configure_client_pool
+from src.imagestore import configure_image_store
+from src.scheduler import configure_scheduler
+from src.tracing import configure_json_logs, set_tracing
+from src.encoding import EncodingConfig
+from src.pipeline import PipelineOptions, run_pipeline
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+OUTPUT_NAMES = {"md": "Generated_DDR.md", "pdf": "Generated_DDR.pdf", "docx": "Generated_DDR.docx"}
+# Bundle ids name their output folder, so they must stay a single plain path component
+_BUNDLE_ID_RE = re.compile(r"[A-Za-z0-9._-]+")
+
+def discover_bundles(input_dir: str) -> list:
+    """Finds bundles in INPUT_DIR (one sub-directory per bundle)."""
+    bundles = []
+    for name in sorted(os.listdir(input_dir)):
+        path = os.path.join(input_dir, name)
+        if not os.path.isdir(path):
+            continue
+        files = sorted(os.listdir(path))
+        pdfs = [f for f in files if f.lower().endswith(".pdf")]
+        thermal = next((f for f in pdfs if "thermal" in f.lower()), None)
+        inspection = next((f for f in pdfs if f != thermal), None)
+        if not inspection:
+            print(f"Skipping {name}: no inspection PDF found.")
+            continue
+        bundles.append({
+            "id": name,
+            "inspection": os.path.join(path, inspection),
+            "thermal": os.path.join(path, thermal) if thermal else None,
+            "images": [os.path.join(path, f) for f in files if f.lower().endswith(IMAGE_EXTENSIONS)],
+        })
+    return bundles
+
+def load_manifest(manifest_path: str) -> list:
+    """
+    Reads bundles from a .jsonl or .csv manifest. Relative paths are resolved against the manifest's folder.
+    Raises ValueError for ids that are not a plain folder name (letters, digits, ".", "_", "-").
+    """
+    base = os.path.dirname(os.path.abspath(manifest_path))
+
+    def resolve(path):
+        return os.path.join(base, path) if path and not os.path.isabs(path) else path
+
+    rows = []
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        if manifest_path.lower().endswith(".csv"):
+            for row in csv.DictReader(f):
+                row["images"] = [p for p in (row.get("images") or "").split(";") if p]
+                rows.append(row)
+        else:
+            rows = [json.loads(line) for line in f if line.strip()]
+
+    bundles = []
+    for i, row in enumerate(rows):
+        bundle_id = str(row.get("id") or i)
+        if not _BUNDLE_ID_RE.fullmatch(bundle_id) or bundle_id in (".", ".."):
+            raise ValueError(f"Invalid bundle id {bundle_id!r} in {manifest_path} (row {i + 1})")
+        bundles.append({
+            "id": bundle_id,
+            "inspection": resolve(row["inspection"]),
+            "thermal": resolve(row.get("thermal")) or None,
+            "images": [resolve(p) for p in row.get("images") or []],
+        })
+    return bundles
+
+def _write_atomic(path: str, data) -> None:
+    """Writes via a temp file + rename so a crash never leaves a half-written output behind."""
+    tmp_path = f"{path}.tmp"
+    mode = "wb" if isinstance(data, bytes) else "w"
+    with open(tmp_path, mode, **({} if mode == "wb" else {"encoding": "utf-8"})) as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def read_status(output_dir: str, bundle_id: str) -> dict:
+    try:
+        with open(os.path.join(output_dir, bundle_id, "status.json"), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def process_bundle(bundle: dict, output_dir: str, api_key: str, options: PipelineOptions) -> dict:
+    """Runs the pipeline for one bundle and records its status/timings."""
+    bundle_dir = os.path.join(output_dir, bundle["id"])
+    os.makedirs(bundle_dir, exist_ok=True)
+    status = {"id": bundle["id"], "status": "running", "started_at": time.time()}
+    _write_atomic(os.path.join(bundle_dir, "status.json"), json.dumps(status))
+
+    start = time.perf_counter()
+    try:
+        result = run_pipeline(api_key, bundle["inspection"], bundle.get("thermal"), bundle.get("images") or [], options)
+        text_analysis = result["analysis"].get("text_analysis", "")
+        if result["markdown"].startswith("Error") or text_analysis.startswith("Error"):
+            raise RuntimeError((result["markdown"] if result["markdown"].startswith("Error") else text_analysis)[:500])
+
+        outputs = {"md": result["markdown"], "pdf": result["pdf"], "docx": result["docx"]}
+        for fmt in options.formats:
+            if outputs.get(fmt):
+                _write_atomic(os.path.join(bundle_dir, OUTPUT_NAMES[fmt]), outputs[fmt])
+            elif fmt != "md":
+                print(f"[{bundle['id']}] {fmt.upper()} generation failed.")
+        status.update({"status": "done", "timings": result["timings"], "stats": result["stats"], "trace": result["trace"]})
+    except Exception as e:
+        status.update({"status": "failed", "error": str(e), "traceback": traceback.format_exc(limit=5)})
+    status["duration"] = time.perf_counter() - start
+    status["finished_at"] = time.time()
+    # status.json is written last: "done" means every output above is complete
+    _write_atomic(os.path.join(bundle_dir, "status.json"), json.dumps(status, indent=2))
+    return status
+
+def write_summary(output_dir: str, bundles: list) -> str:
+    """Writes OUTPUT/summary.csv with one row per bundle (status, duration, per-stage timings, LLM usage)."""
+    stages = ["ingestion", "selection", "analysis", "synthesis", "generation"]
+    path = os.path.join(output_dir, "summary.csv")
+    rows = []
+    for bundle in bundles:
+        status = read_status(output_dir, bundle["id"])
+        timings = status.get("timings") or {}
+        llm = (status.get("trace") or {}).get("llm") or {}
+        rows.append([bundle["id"], status.get("status", "pending"), f"{status.get('duration', 0):.2f}"]
+                    + [f"{timings.get(stage, 0):.2f}" for stage in stages]
+                    + [llm.get("calls", 0), llm.get("prompt_tokens", 0), llm.get("completion_tokens", 0), f"{llm.get('cost_usd', 0):.4f}"]
+                    + [(status.get("stats") or {}).get("text_compression", ""), status.get("error", "")])
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["id", "status", "duration_s"] + [f"{stage}_s" for stage in stages]
+                        + ["llm_calls", "prompt_tokens", "completion_tokens", "est_cost_usd", "text_compression", "error"])
+        writer.writerows(rows)
+    os.replace(tmp_path, path)
+    return path
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Generate DDR reports for many bundles without the Streamlit UI.")
+    parser.add_argument("input_dir", nargs="?", help="Directory with one sub-directory per bundle.")
+    parser.add_argument("--manifest", help="JSONL or CSV manifest of bundles (instead of input_dir).")
+    parser.add_argument("--output", required=True, help="Output directory.")
+    parser.add_argument("--workers", type=int, default=4, help="Bundles processed in parallel.")
+    parser.add_argument("--llm-concurrency", type=int, default=8, help="Max concurrent LLM requests across all workers.")
+    parser.add_argument("--rpm", type=float, default=None, help="OpenAI requests/minute budget (default: learned from rate-limit headers).")
+    parser.add_argument("--tpm", type=float, default=None, help="OpenAI tokens/minute budget (default: learned from rate-limit headers).")
+    parser.add_argument("--formats", default="md,pdf,docx", help="Comma-separated output formats (md,pdf,docx).")
+    parser.add_argument("--max-images", type=int, default=20, help="Max images sent to Vision per bundle.")
+    parser.add_argument("--image-detail", choices=("auto", "high", "low"), default="auto")
+    parser.add_argument("--image-memory-mb", type=float, default=None,
+                        help="Decoded image pixels kept in memory per process (default: DDR_IMAGE_RESIDENT_MB or 128).")
+    parser.add_argument("--tesseract", action="store_true", help="Use local Tesseract OCR instead of GPT-4o Vision.")
+    parser.add_argument("--no-local-thermal", action="store_true", help="Send thermal images to Vision instead of reading them locally.")
+    parser.add_argument("--no-compact-text", action="store_true", help="Send the report text without stripping repeated headers/footers and checklist tables.")
+    parser.add_argument("--polish", action="store_true", help="Extra LLM pass to polish the report prose.")
+    parser.add_argument("--no-cache", action="store_true", help="Bypass the LLM response cache.")
+    parser.add_argument("--retry-failed", action="store_true", help="Also re-run bundles that failed previously.")
+    parser.add_argument("--record", metavar="CASSETTE", help="Record every LLM request/response to this cassette file.")
+    parser.add_argument("--replay", metavar="CASSETTE", help="Serve LLM responses from a recorded cassette (no network, no API key).")
+    parser.add_argument("--replay-latency", choices=("original", "zero"), default="original",
+                        help="Replay with the recorded latencies or none.")
+    parser.add_argument("--http-max-connections", type=int, default=None,
+                        help="Pooled connections to the OpenAI API (default: DDR_HTTP_MAX_CONNECTIONS or 100).")
+    parser.add_argument("--http-max-keepalive", type=int, default=None,
+                        help="Idle connections kept open (default: DDR_HTTP_MAX_KEEPALIVE or 20).")
+    parser.add_argument("--no-http2", action="store_true", help="Use HTTP/1.1 even when the h2 package is installed.")
+    parser.add_argument("--trace-log", help="Write one JSON log line per span to this file ('-' for stderr).")
+    parser.add_argument("--api-key", help="OpenAI API key (defaults to OPENAI_API_KEY).")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    if args.record and args.replay:
+        parser.error("--record and --replay are mutually exclusive")
+    if args.record or args.replay:
+        set_llm_backend("record" if args.record else "replay", args.record or args.replay, args.replay_latency)
+    # Replays never reach the API, so they need no key
+    api_key = args.api_key or os.getenv("OPENAI_API_KEY") or ("replay" if args.replay else None)
+    if not api_key:
+        print("Error: set OPENAI_API_KEY or pass --api-key.")
+        return 2
+    if not args.manifest and not args.input_dir:
+        parser.error("either input_dir or --manifest is required")
+
+    try:
+        bundles = load_manifest(args.manifest) if args.manifest else discover_bundles(args.input_dir)
+    except ValueError as e:
+        parser.error(str(e))
+    os.makedirs(args.output, exist_ok=True)
+
+    skip = {"done"} | (set() if args.retry_failed else {"failed"})
+    pending = [b for b in bundles if read_status(args.output, b["id"]).get("status") not in skip]
+    print(f"{len(bundles)} bundles, {len(bundles) - len(pending)} already processed, {len(pending)} to run.")
+
+    if args.trace_log:
+        set_tracing(True)
+        configure_json_logs(args.trace_log)
+    configure_scheduler(rpm=args.rpm, tpm=args.tpm, max_concurrency=args.llm_concurrency)
+    if args.http_max_connections is not None or args.http_max_keepalive is not None or args.no_http2:
+        configure_client_pool(max_connections=args.http_max_connections,
+                              max_keepalive_connections=args.http_max_keepalive, http2=False if args.no_http2 else None)
+    if args.image_memory_mb is not None:
+        configure_image_store(args.image_memory_mb)
+    options = PipelineOptions(
+        use_tesseract=args.tesseract,
+        use_cache=not args.no_cache,
+        max_images=args.max_images,
+        encoding=EncodingConfig(detail=args.image_detail),
+        formats=tuple(f.strip() for f in args.formats.split(",") if f.strip()),
+        polish=args.polish,
+        local_thermal=not args.no_local_thermal,
+        compact_text=not args.no_compact_text,
+    )
+
+    failed = 0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        futures = {pool.submit(process_bundle, b, args.output, api_key, options): b for b in pending}
+        for done_count, future in enumerate(as_completed(futures), 1):
+            status = future.result()
+            failed += status["status"] != "done"
+            print(f"[{done_count}/{len(pending)}] {status['id']}: {status['status']} in {status['duration']:.1f}s"
+                  + (f" ({status.get('error')})" if status["status"] != "done" else ""))
+
+    elapsed = time.perf_counter() - start
+    summary_path = write_summary(args.output, bundles)
+    rate = len(pending) / elapsed * 3600 if elapsed and pending else 0
+    print(f"Finished {len(pending)} bundles in {elapsed:.1f}s ({rate:.0f}/hour), {failed} failed. Summary: {summary_path}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+"""
+Benchmark: Markdown -> HTML/DOCX before and after the shared document tree.
+
+Scales the malformed samples from test_advanced_fix.py / test_formatting_fix.py up to a few MB
+and compares the old path (regex fixes + markdown.markdown for the PDF, a second line-based
+parser for the DOCX) with build_document + render_html / render_docx.
+PDF layout (pisa) is not included; it is identical for both paths.
+
+Usage:
+    python benchmarks/bench_markdown.py --mb 3
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import markdown
+from docx import Document
+from src.generation import build_document, render_docx, render_html
+from test_advanced_fix import WORST_CASE_MARKDOWN
+from test_formatting_fix import MALFORMED_MARKDOWN
+
+def legacy_html(markdown_content: str) -> str:
+    """The pre-tree generate_pdf front half: five regex passes + python-markdown."""
+    processed = re.sub(r'([^\n])(#{1,3}\s)', r'\1\n\n\2', markdown_content)
+    processed = re.sub(r'([^\n])(-\s\*\*)', r'\1\n\2', processed)
+    processed = re.sub(r'(^|\n)#\s*\n#', r'\1#', processed)
+    processed = re.sub(r'#\s*#', r'#', processed)
+    processed = re.sub(r'(#[^#\n]+)(#{1,3}\s)', r'\1\n\n\2', processed)
+    return markdown.markdown(processed, extensions=['extra', 'nl2br', 'sane_lists'])
+
+def legacy_docx(markdown_content: str):
+    """The pre-tree generate_docx line parser."""
+    doc = Document()
+    for line in markdown_content.split('\n'):
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith('# '):
+            doc.add_heading(line[2:], level=1)
+        elif line.startswith('## '):
+            doc.add_heading(line[3:], level=2)
+        elif line.startswith('### '):
+            doc.add_heading(line[4:], level=3)
+        elif line.startswith('- ') or line.startswith('* '):
+            doc.add_paragraph(line[2:], style='List Bullet')
+        elif line.startswith('1. '):
+            doc.add_paragraph(line[3:], style='List Number')
+        elif line.startswith('**') and line.endswith('**'):
+            doc.add_paragraph().add_run(line[2:-2]).bold = True
+        else:
+            doc.add_paragraph(line)
+    return doc
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the Markdown export front end.")
+    parser.add_argument("--mb", type=float, default=3.0, help="Approximate size of the scaled document.")
+    parser.add_argument("--skip-docx", action="store_true", help="Only time the HTML path.")
+    args = parser.parse_args(argv)
+
+    sample = WORST_CASE_MARKDOWN + "\n" + MALFORMED_MARKDOWN
+    document = sample * max(1, int(args.mb * 1024 * 1024 / len(sample)))
+    print(f"Document: {len(document) / 1024 / 1024:.2f} MB, {document.count(chr(10))} lines")
+
+    _, old_html = timed(legacy_html, document)
+    build_document.cache_clear()
+    blocks, parse = timed(build_document, document)
+    _, new_html = timed(render_html, blocks)
+    print(f"HTML  old (regex + markdown):  {old_html:8.2f}s")
+    print(f"HTML  new (parse + render):    {parse + new_html:8.2f}s  (parse {parse:.2f}s, render {new_html:.2f}s)")
+
+    if not args.skip_docx:
+        _, old_docx = timed(legacy_docx, document)
+        _, new_docx = timed(render_docx, build_document(document))  # tree is cached, as in start_exports
+        print(f"DOCX  old (line parser):       {old_docx:8.2f}s")
+        print(f"DOCX  new (render from tree):  {new_docx:8.2f}s")
+        print(f"Both  old: {old_html + old_docx:.2f}s, new: {parse + new_html + new_docx:.2f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Benchmark: the full src/ pipeline (ingestion -> selection -> analysis -> synthesis -> generation)
+on a synthetic corpus, offline, with benchmarks/stub_llm.py in place of ChatOpenAI.
+
+Reports throughput (bundles/hour), p50/p90/p99 latency per pipeline stage and in total, LLM
+calls/tokens and the peak RSS of the process. With --baseline the run fails (exit code 1) if
+throughput drops or a stage's p90 grows by more than --max-regression, so it can gate CI.
+
+Usage:
+    python benchmarks/bench_pipeline.py --bundles 20 --pages 8 --images 2 --workers 4 --latency 0.2
+    python benchmarks/bench_pipeline.py --json results.json
+    python benchmarks/bench_pipeline.py --baseline results.json --max-regression 0.25
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from corpus import make_corpus
+from stub_llm import StubChatModel
+from src.analysis import set_llm_factory
+from src.pipeline import PipelineOptions, run_pipeline
+from src.scheduler import configure_scheduler
+
+STAGES = ["ingestion", "selection", "analysis", "synthesis", "generation", "total"]
+
+def percentile(values: list, q: float) -> float:
+    """Nearest-rank percentile (q in 0..100); 0 for no values."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * q // 100))
+    return ordered[int(rank) - 1]
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process in MB (0 where the resource module is unavailable)."""
+    try:
+        import resource
+    except ImportError:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def run_benchmark(bundles: list, options: PipelineOptions, workers: int) -> dict:
+    def run_one(bundle):
+        start = time.perf_counter()
+        result = run_pipeline("stub-key", bundle["inspection"], bundle["thermal"], bundle["images"], options)
+        timings = dict(result["timings"], total=time.perf_counter() - start)
+        failed = result["markdown"].startswith("Error") or (options.formats != ("md",) and not (result["pdf"] or result["docx"]))
+        return timings, result["trace"]["llm"], failed
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        runs = list(pool.map(run_one, bundles))
+    wall = time.perf_counter() - start
+
+    llm_totals = {}
+    for _, llm, _ in runs:
+        for key in ("calls", "prompt_tokens", "completion_tokens"):
+            llm_totals[key] = llm_totals.get(key, 0) + llm.get(key, 0)
+    return {
+        "bundles": len(bundles),
+        "failed": sum(failed for _, _, failed in runs),
+        "wall_s": round(wall, 3),
+        "bundles_per_hour": round(len(bundles) / wall * 3600, 1) if wall else 0.0,
+        "stages": {stage: {f"p{q}": round(percentile([t.get(stage, 0.0) for t, _, _ in runs], q), 4) for q in (50, 90, 99)}
+                   for stage in STAGES},
+        "llm": llm_totals,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+def compare(results: dict, baseline: dict, max_regression: float) -> list:
+    """Regressions of `results` against `baseline` beyond the allowed fraction."""
+    problems = []
+    if results["bundles_per_hour"] < baseline["bundles_per_hour"] * (1 - max_regression):
+        problems.append(f"throughput {results['bundles_per_hour']:.1f}/h < baseline {baseline['bundles_per_hour']:.1f}/h")
+    for stage in STAGES:
+        now, before = results["stages"][stage]["p90"], baseline["stages"].get(stage, {}).get("p90", 0)
+        # Ignore sub-10ms stages; their jitter is larger than any real regression
+        if before >= 0.01 and now > before * (1 + max_regression):
+            problems.append(f"{stage} p90 {now:.3f}s > baseline {before:.3f}s")
+    return problems
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Offline end-to-end DDR pipeline benchmark.")
+    parser.add_argument("--bundles", type=int, default=10)
+    parser.add_argument("--pages", type=int, default=8, help="Inspection report pages per bundle.")
+    parser.add_argument("--images", type=int, default=2, help="Photos per inspection page.")
+    parser.add_argument("--thermal-pages", type=int, default=4, help="Thermal report pages per bundle (0 for none).")
+    parser.add_argument("--corpus-dir", help="Where to write / reuse the synthetic corpus (default: a temp dir).")
+    parser.add_argument("--workers", type=int, default=4, help="Bundles processed in parallel.")
+    parser.add_argument("--llm-concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.05, help="Stub LLM latency per request in seconds.")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Uniform +/- jitter on the stub latency.")
+    parser.add_argument("--echo-tokens", type=int, default=200, help="Tokens the stub echoes back per text response.")
+    parser.add_argument("--max-images", type=int, default=20)
+    parser.add_argument("--formats", default="md,pdf,docx")
+    parser.add_argument("--json", help="Write the results to this JSON file.")
+    parser.add_argument("--baseline", help="Results JSON of an earlier run to compare against.")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="Allowed slowdown vs. the baseline (fraction).")
+    args = parser.parse_args(argv)
+
+    corpus_dir = args.corpus_dir or tempfile.mkdtemp(prefix="ddr_bench_")
+    start = time.perf_counter()
+    bundles = make_corpus(corpus_dir, args.bundles, args.pages, args.images, args.thermal_pages)
+    print(f"Corpus: {len(bundles)} bundles in {corpus_dir} ({time.perf_counter() - start:.1f}s)")
+
+    set_llm_factory(lambda api_key: StubChatModel(args.latency, args.jitter, args.echo_tokens))
+    configure_scheduler(max_concurrency=args.llm_concurrency)
+    options = PipelineOptions(use_cache=False, max_images=args.max_images,
+                              formats=tuple(f.strip() for f in args.formats.split(",") if f.strip()))
+    results = run_benchmark(bundles, options, args.workers)
+    results["config"] = {k: v for k, v in vars(args).items() if k not in ("json", "baseline", "corpus_dir")}
+
+    print(f"{results['bundles']} bundles in {results['wall_s']:.2f}s -> {results['bundles_per_hour']:.0f} bundles/hour, "
+          f"{results['failed']} failed, peak RSS {results['peak_rss_mb']:.0f} MB")
+    print(f"LLM: {results['llm'].get('calls', 0)} calls, {results['llm'].get('prompt_tokens', 0)} prompt / "
+          f"{results['llm'].get('completion_tokens', 0)} completion tokens")
+    print(f"{'stage':<12}{'p50 s':>10}{'p90 s':>10}{'p99 s':>10}")
+    for stage, stats in results["stages"].items():
+        print(f"{stage:<12}{stats['p50']:>10.3f}{stats['p90']:>10.3f}{stats['p99']:>10.3f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if results["failed"]:
+        return 1
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            problems = compare(results, json.load(f), args.max_regression)
+        for problem in problems:
+            print(f"REGRESSION: {problem}")
+        return 1 if problems else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,87 @@
+"""
+Startup check: how long the top-level imports of an entry point take, and which heavy backends they load.
+
+The imports of the target script (default app.py) are run in fresh interpreters; the fastest of
+--runs runs is compared against --budget. The check also fails if any module that src/ loads
+lazily (src.warmup.HEAVY_MODULES plus a few of their dependencies) is imported at startup.
+On failure the slowest modules from `python -X importtime` are listed. Exit code 1 on failure, for CI.
+
+Usage:
+    python benchmarks/check_import_time.py
+    python benchmarks/check_import_time.py --target service.py --budget 0.5
+"""
+import argparse
+import ast
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from src.warmup import HEAVY_MODULES
+
+LAZY_MODULES = sorted({name.split(".")[0] for name in HEAVY_MODULES} | {"openai", "pypdf", "pytesseract", "reportlab", "markdown"})
+
+_MEASURE = """
+import json, sys, time
+start = time.perf_counter()
+exec(compile({source!r}, "<imports>", "exec"))
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "loaded": [m for m in {lazy!r} if m in sys.modules]}}))
+"""
+
+def top_level_imports(path: str) -> str:
+    """The module-level import statements of a script, as source code."""
+    with open(path, "r", encoding="utf-8") as f:
+        source = f.read()
+    tree = ast.parse(source)
+    return "\n".join(ast.get_source_segment(source, node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom)))
+
+def measure(imports: str) -> dict:
+    code = _MEASURE.format(source=imports, lazy=LAZY_MODULES)
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+def slowest_modules(imports: str, count: int = 10) -> list:
+    """(cumulative microseconds, module) of the slowest top-level imports according to -X importtime."""
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", imports], cwd=ROOT, capture_output=True, text=True)
+    rows = []
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # Only modules imported directly by the script, not their internals
+        if not name.startswith("  "):
+            rows.append((int(cumulative), name.strip()))
+    return sorted(rows, reverse=True)[:count]
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Fail if the startup imports of an entry point get slow or heavy.")
+    parser.add_argument("--target", default="app.py", help="Script whose top-level imports are measured.")
+    parser.add_argument("--budget", type=float, default=1.0, help="Allowed import time in seconds.")
+    parser.add_argument("--runs", type=int, default=3, help="Fresh interpreters to try; the fastest counts.")
+    args = parser.parse_args(argv)
+
+    imports = top_level_imports(os.path.join(ROOT, args.target))
+    results = [measure(imports) for _ in range(args.runs)]
+    best = min(r["seconds"] for r in results)
+    loaded = sorted({m for r in results for m in r["loaded"]})
+    print(f"{args.target}: startup imports take {best:.3f}s (budget {args.budget:.3f}s)")
+
+    failed = False
+    if best > args.budget:
+        print("FAIL: import time over budget")
+        failed = True
+    if loaded:
+        print(f"FAIL: lazily loaded backends imported at startup: {', '.join(loaded)}")
+        failed = True
+    if failed:
+        print("Slowest imports (cumulative):")
+        for micros, name in slowest_modules(imports):
+            print(f"  {micros / 1e6:8.3f}s  {name}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
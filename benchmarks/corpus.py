@@ -0,0 +1,141 @@
+"""
+Synthetic inspection / thermal report bundles for the offline benchmarks.
+
+Inspection pages carry a letterhead, "Area: ... - Issue: ..." findings, a checklist and photos
+(JPEG noise, so they neither compress away nor deduplicate). Thermal pages carry a false-colour
+image with a colour scale bar and a "Max / Min" temperature readout, like the FLIR exports the
+app is used with.
+Everything is seeded, so the same arguments always produce the same files.
+
+Usage:
+    python benchmarks/corpus.py OUT_DIR --bundles 10 --pages 8 --images 2 --thermal-pages 4
+The output layout is the one batch.py expects (one sub-directory per bundle).
+"""
+import argparse
+import io
+import os
+import random
+import numpy as np
+from PIL import Image
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen import canvas
+
+AREAS = ["Hall", "Kitchen", "Master Bedroom", "Bedroom 2", "Common Bathroom", "Balcony", "Parking Area", "Terrace"]
+ISSUES = ["Skirting level dampness", "Tile hollowness", "Efflorescence on ceiling", "Plaster cracks",
+          "Gaps in tile joints", "Seepage near window frame", "Leakage below wash basin"]
+CHECKLIST = ["Condition of tile joints", "Paint spots / efflorescence", "Concealed plumbing leakage",
+             "Cracks on external wall", "Loose plaster / hollow sound"]
+
+def _photo(rng: np.random.Generator, width: int, height: int) -> ImageReader:
+    pixels = rng.integers(0, 256, size=(height, width, 3), dtype=np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(pixels).save(buf, "JPEG", quality=80)
+    buf.seek(0)
+    return ImageReader(buf)
+
+def _palette(values: np.ndarray) -> np.ndarray:
+    """Simple blue (cold) -> green -> red (hot) palette for values in 0..1."""
+    return np.stack([values * 255, (1 - np.abs(values - 0.5) * 2) * 255, (1 - values) * 255], axis=-1).astype(np.uint8)
+
+def _thermal(rng: np.random.Generator, width: int, height: int) -> ImageReader:
+    # Smooth temperature field with a cold spot, plus a FLIR-style scale bar on the right (hot at the top)
+    bar_width = max(8, width // 20)
+    scene_width = width - 3 * bar_width
+    y, x = np.mgrid[0:height, 0:scene_width]
+    cy, cx = rng.integers(0, height), rng.integers(0, scene_width)
+    field = np.exp(-((x - cx) ** 2 + (y - cy) ** 2) / (2 * (min(scene_width, height) / 4) ** 2))
+    field = np.clip(1 - field + rng.normal(0, 0.03, field.shape), 0, 1)
+    pixels = np.full((height, width, 3), 255, dtype=np.uint8)
+    pixels[:, :scene_width] = _palette(field)
+    bar_top, bar_bottom = height // 10, height - height // 10
+    bar = _palette(np.linspace(1, 0, bar_bottom - bar_top))
+    pixels[bar_top:bar_bottom, width - 2 * bar_width:width - bar_width] = bar[:, None, :]
+    buf = io.BytesIO()
+    Image.fromarray(pixels).save(buf, "PNG")
+    buf.seek(0)
+    return ImageReader(buf)
+
+def _letterhead(pdf: canvas.Canvas, title: str, page: int) -> None:
+    _, height = A4
+    pdf.setFont("Helvetica-Bold", 12)
+    pdf.drawString(40, height - 40, f"ACME Building Diagnostics - {title}")
+    pdf.setFont("Helvetica", 8)
+    pdf.drawString(40, 30, f"Confidential - prepared for the client only. Page {page}")
+
+def make_inspection_pdf(path: str, pages: int = 8, images_per_page: int = 2, seed: int = 0) -> None:
+    """Writes an inspection report with `pages` pages and `images_per_page` photos per page."""
+    rng = np.random.default_rng(seed)
+    picker = random.Random(seed)
+    _, height = A4
+    pdf = canvas.Canvas(path, pagesize=A4)
+    for page in range(1, pages + 1):
+        _letterhead(pdf, "Inspection Report", page)
+        pdf.setFont("Helvetica", 10)
+        y = height - 80
+        if page == 1:
+            for line in ("Inspection Date: 27.09.2022", "Inspected By: A. Kumar", "Report ID: Not Available"):
+                pdf.drawString(40, y, line)
+                y -= 14
+        for _ in range(3):
+            pdf.drawString(40, y, f"Area: {picker.choice(AREAS)} - Issue: {picker.choice(ISSUES)}")
+            y -= 14
+        y -= 6
+        for item in CHECKLIST:
+            pdf.drawString(40, y, item)
+            pdf.drawString(360, y, picker.choice(["Yes", "No", "N/A"]))
+            y -= 14
+        for i in range(images_per_page):
+            pdf.drawImage(_photo(rng, 480, 360), 40 + (i % 2) * 260, 120 + (i // 2 % 2) * 200, 240, 180)
+        pdf.showPage()
+    pdf.save()
+
+def make_thermal_pdf(path: str, pages: int = 4, seed: int = 0) -> None:
+    """Writes a thermal report with one false-colour image and a Max/Min readout per page."""
+    rng = np.random.default_rng(seed + 10_000)
+    _, height = A4
+    pdf = canvas.Canvas(path, pagesize=A4)
+    for page in range(1, pages + 1):
+        _letterhead(pdf, "Thermal Imaging Report", page)
+        low = round(float(rng.uniform(22, 26)), 1)
+        high = round(low + float(rng.uniform(2, 7)), 1)
+        pdf.setFont("Helvetica", 10)
+        pdf.drawString(40, height - 80, f"Image {page:03d}  Max {high} C  Min {low} C  Emissivity 0.95")
+        pdf.drawImage(_thermal(rng, 320, 240), 40, height - 400, 320, 240)
+        pdf.showPage()
+    pdf.save()
+
+def make_corpus(out_dir: str, bundles: int = 10, pages: int = 8, images_per_page: int = 2,
+                thermal_pages: int = 4, seed: int = 0) -> list:
+    """
+    Writes `bundles` bundles under out_dir (skipping files that already exist) and returns them
+    as batch.py bundle dicts ({"id", "inspection", "thermal", "images"}).
+    """
+    result = []
+    for i in range(bundles):
+        bundle_id = f"bundle_{i:03d}"
+        bundle_dir = os.path.join(out_dir, bundle_id)
+        os.makedirs(bundle_dir, exist_ok=True)
+        inspection = os.path.join(bundle_dir, "inspection.pdf")
+        thermal = os.path.join(bundle_dir, "thermal.pdf") if thermal_pages else None
+        if not os.path.exists(inspection):
+            make_inspection_pdf(inspection, pages, images_per_page, seed + i)
+        if thermal and not os.path.exists(thermal):
+            make_thermal_pdf(thermal, thermal_pages, seed + i)
+        result.append({"id": bundle_id, "inspection": inspection, "thermal": thermal, "images": []})
+    return result
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Generate synthetic DDR report bundles.")
+    parser.add_argument("out_dir")
+    parser.add_argument("--bundles", type=int, default=10)
+    parser.add_argument("--pages", type=int, default=8, help="Inspection report pages per bundle.")
+    parser.add_argument("--images", type=int, default=2, help="Photos per inspection page.")
+    parser.add_argument("--thermal-pages", type=int, default=4, help="Thermal report pages per bundle (0 for none).")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    bundles = make_corpus(args.out_dir, args.bundles, args.pages, args.images, args.thermal_pages, args.seed)
+    print(f"Wrote {len(bundles)} bundles to {args.out_dir}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Offline stand-in for ChatOpenAI used by the benchmarks.
+
+Install it with src.analysis.set_llm_factory(lambda api_key: StubChatModel(...)). It sleeps for a
+configurable latency per request and answers with:
+- structured output: a DDRAnalysis with one observation per "Area: ... - Issue: ..." line of the
+  prompt (the synthetic corpus writes those), so report rendering scales with the input
+- text / Vision requests: the prompt text echoed back, capped at `echo_tokens` tokens
+Usage metadata is filled in, so traces, token totals and the scheduler see realistic numbers.
+"""
+import asyncio
+import random
+import re
+import time
+from langchain_core.messages import AIMessage, AIMessageChunk
+from src.chunking import count_tokens
+from src.scheduler import estimate_request_tokens
+
+_OBSERVATION_RE = re.compile(r"Area:\s*(.+?)\s+-\s+Issue:\s*(.+)")
+# Approximate characters per token when cutting the echoed text
+_CHARS_PER_TOKEN = 4
+
+def payload_text(payload) -> str:
+    """Text parts of a prompt string or a list of messages."""
+    if isinstance(payload, str):
+        return payload
+    parts = []
+    for message in payload if isinstance(payload, (list, tuple)) else [payload]:
+        content = getattr(message, "content", message)
+        if isinstance(content, str):
+            parts.append(content)
+            continue
+        parts.extend(part.get("text", "") for part in content or [] if isinstance(part, dict) and part.get("type") == "text")
+    return "\n".join(parts)
+
+class StubChatModel:
+    """Implements the parts of the ChatOpenAI interface the pipeline uses (invoke/ainvoke/batch/stream/with_structured_output)."""
+
+    def __init__(self, latency: float = 0.05, jitter: float = 0.0, echo_tokens: int = 200, model_name: str = "stub"):
+        self.latency = latency
+        self.jitter = jitter
+        self.echo_tokens = echo_tokens
+        self.model_name = model_name
+        self.temperature = 0
+
+    def _delay(self) -> float:
+        return max(0.0, self.latency + random.uniform(-self.jitter, self.jitter))
+
+    def _usage(self, payload, output_text: str) -> dict:
+        # The request estimate includes the completion allowance; only the prompt part counts as input
+        input_tokens = max(0, estimate_request_tokens(payload) - estimate_request_tokens(""))
+        output_tokens = count_tokens(output_text)
+        return {"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens}
+
+    def _echo(self, payload) -> str:
+        text = " ".join(payload_text(payload).split())
+        return text[: self.echo_tokens * _CHARS_PER_TOKEN]
+
+    def _message(self, payload) -> AIMessage:
+        text = self._echo(payload)
+        return AIMessage(content=text, usage_metadata=self._usage(payload, text))
+
+    def invoke(self, payload, config=None):
+        time.sleep(self._delay())
+        return self._message(payload)
+
+    async def ainvoke(self, payload, config=None):
+        await asyncio.sleep(self._delay())
+        return self._message(payload)
+
+    def batch(self, payloads, config=None, **kwargs):
+        return [self.invoke(payload) for payload in payloads]
+
+    def stream(self, payload, config=None):
+        time.sleep(self._delay())
+        text = self._echo(payload)
+        step = 16 * _CHARS_PER_TOKEN
+        for i in range(0, len(text), step):
+            yield AIMessageChunk(content=text[i:i + step])
+        yield AIMessageChunk(content="", usage_metadata=self._usage(payload, text))
+
+    def with_structured_output(self, schema, **kwargs):
+        return _StubStructured(self, schema)
+
+class _StubStructured:
+    """with_structured_output(..., include_raw=True) counterpart: returns {"raw", "parsed", "parsing_error"}."""
+
+    def __init__(self, llm: StubChatModel, schema):
+        self.llm = llm
+        self.schema = schema
+
+    def _result(self, payload) -> dict:
+        text = payload_text(payload)
+        observations = [{"Area": area.strip(), "Issue": issue.strip(), "Thermal_Delta": "Not Available"}
+                        for area, issue in _OBSERVATION_RE.findall(text)]
+        parsed = self.schema.model_validate({
+            "issue_summary": self.llm._echo(payload),
+            "observations": observations,
+            "root_causes": sorted({o["Issue"] for o in observations})[:5],
+            "severity_assessment": {"score": "50%", "scale": "Moderate", "reasoning": "Synthetic benchmark data."},
+            "recommended_actions": [f"Inspect {o['Area']}" for o in observations[:5]],
+        })
+        raw_text = parsed.model_dump_json()
+        return {"raw": AIMessage(content=raw_text, usage_metadata=self.llm._usage(payload, raw_text)),
+                "parsed": parsed, "parsing_error": None}
+
+    def invoke(self, payload, config=None):
+        time.sleep(self.llm._delay())
+        return self._result(payload)
+
+    async def ainvoke(self, payload, config=None):
+        await asyncio.sleep(self.llm._delay())
+        return self._result(payload)
+
+    def batch(self, payloads, config=None, **kwargs):
+        return [self.invoke(payload) for payload in payloads]
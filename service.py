@@ -0,0 +1,162 @@
+"""
+HTTP job service for the DDR pipeline.
+
+Runs the src/ pipeline on a local job queue and worker pool, independent of any Streamlit session.
+
+Usage:
+    python service.py --port 8600 --workers 4
+
+Endpoints:
+    POST /jobs                          submit a job, returns {"job_id": ...} (202)
+    GET  /jobs/<job_id>                 job status, timings and available artifacts
+    GET  /jobs/<job_id>/artifacts/<fmt> download the md / pdf / docx output
+    GET  /health                        liveness and job counts
+    GET  /metrics                       Prometheus text metrics (stage/LLM durations, tokens, cost)
+
+The POST body is JSON:
+    {"inspection_pdf": "<base64>", "thermal_pdf": "<base64, optional>",
+     "images": [{"name": "photo.jpg", "data": "<base64>"}],
+     "options": {"use_tesseract": false, "use_cache": true, "chunked": true,
+                 "max_images": 20, "image_detail": "auto", "max_image_tokens": null, "polish": false,
+                 "local_thermal": true, "compact_text": true}}
+The OpenAI key is taken from the X-OpenAI-Key header, or OPENAI_API_KEY on the server.
+Set DDR_TRACE_LOG to a file (or "-" for stderr) to also get one JSON log line per span.
+OpenAI connections are pooled and reused across jobs (--http-max-connections / DDR_HTTP_MAX_CONNECTIONS,
+--http-max-keepalive / DDR_HTTP_MAX_KEEPALIVE, DDR_HTTP_KEEPALIVE_EXPIRY; HTTP/2 when the h2 package is
+installed, --no-http2 / DDR_HTTP2=0 disables it).
+The PDF/LLM/rendering backends are imported in the background at startup (DDR_WARMUP=0 disables this).
+"""
+import argparse
+import base64
+import binascii
+import json
+import os
+import re
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from dotenv import load_dotenv
+from src.clients import configure_client_pool
+from src.scheduler import configure_scheduler
+from src.tracing import METRICS, configure_json_logs, set_tracing
+from src.jobs import ARTIFACT_NAMES, JobQueue
+from src.warmup import start_warmup
+
+MAX_BODY_BYTES = int(os.getenv("DDR_SERVICE_MAX_BODY_MB", "200")) * 1024 * 1024
+ARTIFACT_MIME_TYPES = {
+    "md": "text/markdown; charset=utf-8",
+    "pdf": "application/pdf",
+    "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+}
+
+class DDRRequestHandler(BaseHTTPRequestHandler):
+    queue: JobQueue = None  # set by make_server
+
+    def _send_json(self, code: int, payload: dict) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/health":
+            return self._send_json(200, {"status": "ok", "jobs": self.queue.stats()})
+
+        if self.path == "/metrics":
+            body = METRICS.prometheus_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        match = re.fullmatch(r"/jobs/([0-9a-f]+)", self.path)
+        if match:
+            status = self.queue.get(match.group(1))
+            if status is None:
+                return self._send_json(404, {"error": "job not found"})
+            return self._send_json(200, {k: v for k, v in status.items() if k != "traceback"})
+
+        match = re.fullmatch(r"/jobs/([0-9a-f]+)/artifacts/(\w+)", self.path)
+        if match:
+            job_id, fmt = match.groups()
+            path = self.queue.artifact_path(job_id, fmt)
+            if path is None:
+                return self._send_json(404, {"error": "artifact not available"})
+            with open(path, "rb") as f:
+                data = f.read()
+            self.send_response(200)
+            self.send_header("Content-Type", ARTIFACT_MIME_TYPES[fmt])
+            self.send_header("Content-Disposition", f'attachment; filename="{ARTIFACT_NAMES[fmt]}"')
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+
+        self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path != "/jobs":
+            return self._send_json(404, {"error": "not found"})
+        length = int(self.headers.get("Content-Length") or 0)
+        if length <= 0 or length > MAX_BODY_BYTES:
+            return self._send_json(413 if length else 400, {"error": "missing or oversized request body"})
+        try:
+            payload = json.loads(self.rfile.read(length))
+            inspection_pdf = base64.b64decode(payload["inspection_pdf"], validate=True)
+            thermal_pdf = base64.b64decode(payload["thermal_pdf"], validate=True) if payload.get("thermal_pdf") else None
+            images = [(img.get("name", ""), base64.b64decode(img["data"], validate=True)) for img in payload.get("images") or []]
+        except (ValueError, KeyError, TypeError, binascii.Error) as e:
+            return self._send_json(400, {"error": f"invalid request: {e}"})
+
+        job_id = self.queue.submit(inspection_pdf, thermal_pdf, images, payload.get("options"),
+                                   api_key=self.headers.get("X-OpenAI-Key"))
+        self._send_json(202, {"job_id": job_id, "status_url": f"/jobs/{job_id}"})
+
+    def log_message(self, format, *args):
+        print(f"[service] {self.address_string()} {format % args}")
+
+def make_server(host: str, port: int, queue: JobQueue) -> ThreadingHTTPServer:
+    handler = type("BoundDDRRequestHandler", (DDRRequestHandler,), {"queue": queue})
+    return ThreadingHTTPServer((host, port), handler)
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Run the DDR job service.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8600)
+    parser.add_argument("--workers", type=int, default=2, help="Jobs processed in parallel.")
+    parser.add_argument("--llm-concurrency", type=int, default=8, help="Max concurrent LLM requests across all jobs.")
+    parser.add_argument("--rpm", type=float, default=None, help="OpenAI requests/minute budget (default: learned from rate-limit headers).")
+    parser.add_argument("--tpm", type=float, default=None, help="OpenAI tokens/minute budget (default: learned from rate-limit headers).")
+    parser.add_argument("--no-metrics", action="store_true", help="Disable span metrics (/metrics) and JSON span logs.")
+    parser.add_argument("--jobs-dir", default=None, help="Where job inputs/outputs are stored.")
+    parser.add_argument("--http-max-connections", type=int, default=None,
+                        help="Pooled connections to the OpenAI API (default: DDR_HTTP_MAX_CONNECTIONS or 100).")
+    parser.add_argument("--http-max-keepalive", type=int, default=None,
+                        help="Idle connections kept open (default: DDR_HTTP_MAX_KEEPALIVE or 20).")
+    parser.add_argument("--no-http2", action="store_true", help="Use HTTP/1.1 even when the h2 package is installed.")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    set_tracing(not args.no_metrics)
+    configure_json_logs()
+    start_warmup()
+    configure_scheduler(rpm=args.rpm, tpm=args.tpm, max_concurrency=args.llm_concurrency)
+    if args.http_max_connections is not None or args.http_max_keepalive is not None or args.no_http2:
+        configure_client_pool(max_connections=args.http_max_connections,
+                              max_keepalive_connections=args.http_max_keepalive, http2=False if args.no_http2 else None)
+    queue = JobQueue(args.jobs_dir or os.getenv("DDR_JOBS_DIR", ".ddr_jobs"), workers=args.workers,
+                     default_api_key=os.getenv("OPENAI_API_KEY"))
+    server = make_server(args.host, args.port, queue)
+    print(f"DDR service listening on http://{args.host}:{args.port} with {args.workers} workers")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        queue.shutdown(wait=False)
+
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,234 @@
 
-from langchain_openai import ChatOpenAI
-from langchain_core.prompts import PromptTemplate
-from langchain_core.messages import HumanMessage
-import base64
-import io
+import asyncio
+import contextlib
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+from src.artifacts import ArtifactStore, get_artifact_store, image_digest
+from src.cache import ResponseCache, get_response_cache
+from src.chunking import chunk_pages, count_tokens, merge_analyses, parse_json_response, split_pages
+from src.clients import get_client_registry
+from src.encoding import EncodingConfig, encode_image, next_detail, plan_details
+from src.generation import normalize_markdown
+from src.replay import RecordingLLM, ReplayLLM, get_cassette
+from src.scheduler import estimate_request_tokens, get_scheduler
+from src.schema import DDRAnalysis
+from src.thermal import THERMAL_ANALYZER_VERSION, analyze_thermal_image, scale_from_text
+from src.tracing import bind_context, estimate_cost, increment, span
+
+# Optional replacement for the ChatOpenAI construction below (see set_llm_factory)
+_llm_factory = None
+
+def set_llm_factory(factory=None) -> None:
+    """
+    Makes get_llm return factory(api_key) instead of a ChatOpenAI client, e.g. a local stub for
+    offline benchmarks (benchmarks/stub_llm.py). Pass None to restore the default.
+    """
+    global _llm_factory
+    _llm_factory = factory
+
+# Record/replay of LLM traffic (see set_llm_backend); defaults come from DDR_LLM_BACKEND / DDR_LLM_CASSETTE
+_llm_backend = {
+    "mode": os.getenv("DDR_LLM_BACKEND", "live"),
+    "cassette": os.getenv("DDR_LLM_CASSETTE", "ddr_cassette.jsonl"),
+    "latency": os.getenv("DDR_REPLAY_LATENCY", "original"),
+}
+
+def set_llm_backend(mode: str = "live", cassette: str = "ddr_cassette.jsonl", latency: str = "original") -> None:
+    """
+    Selects where LLM responses come from:
+    - "live": the model (ChatOpenAI or the set_llm_factory replacement)
+    - "record": the model, appending every request/response pair to the cassette file
+    - "replay": the cassette only, no network; latency "original" sleeps the recorded time, "zero" does not
+    Images are stored as hashes, so a replay needs the same inputs and encoding settings as the recording.
+    The response cache and the artifact store are bypassed outside "live", so every request is recorded.
+    """
+    if mode not in ("live", "record", "replay"):
+        raise ValueError(f"Unknown LLM backend: {mode}")
+    _llm_backend.update(mode=mode, cassette=cassette, latency=latency)
+
+def _caching(use_cache: bool) -> bool:
+    """Cached responses and artifacts would never reach a cassette being recorded, nor come from one replayed."""
+    return use_cache and _llm_backend["mode"] == "live"
 
 def get_llm(api_key: str):
-    """Initializes the LLM with the provided API key."""
-    return ChatOpenAI(temperature=0, openai_api_key=api_key, model_name="gpt-4o")
+    """
+    Returns the LLM for the provided API key. Live clients come from the process-wide registry
+    (src.clients), so every report, session and worker shares one pooled HTTP transport.
+    """
+    mode = _llm_backend["mode"]
+    if mode == "replay":
+        return ReplayLLM(get_cassette(_llm_backend["cassette"]), latency=_llm_backend["latency"])
+    if _llm_factory is not None:
+        llm = _llm_factory(api_key)
+    else:
+        llm = get_client_registry().chat_model(api_key, "gpt-4o")
+    if mode == "record":
+        return RecordingLLM(llm, get_cassette(_llm_backend["cassette"]))
+    return llm
+
+def _response_meta(resp):
+    """(headers, usage metadata) of a chat response or a structured-output result with include_raw."""
+    raw = resp.get("raw") if isinstance(resp, dict) else resp
+    headers = (getattr(raw, "response_metadata", None) or {}).get("headers")
+    return headers, getattr(raw, "usage_metadata", None) or {}
+
+def _record_usage(llm_span, llm, estimated_tokens: int, usage: dict) -> None:
+    prompt_tokens = usage.get("input_tokens", 0)
+    completion_tokens = usage.get("output_tokens", 0)
+    model = getattr(llm, "model_name", "")
+    llm_span.set(estimated_tokens=estimated_tokens, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                 cost_usd=estimate_cost(model, prompt_tokens, completion_tokens))
+
+def _invoke(llm, payload):
+    scheduler = get_scheduler()
+    tokens = estimate_request_tokens(payload)
+    with span("llm.invoke", model=getattr(llm, "model_name", "")) as llm_span:
+        resp = scheduler.call(lambda: llm.invoke(payload), tokens)
+        headers, usage = _response_meta(resp)
+        scheduler.observe(headers, tokens, usage.get("total_tokens"))
+        _record_usage(llm_span, llm, tokens, usage)
+    return resp
+
+async def _ainvoke(llm, payload):
+    scheduler = get_scheduler()
+    tokens = estimate_request_tokens(payload)
+    with span("llm.invoke", model=getattr(llm, "model_name", "")) as llm_span:
+        resp = await scheduler.acall(lambda: llm.ainvoke(payload), tokens)
+        headers, usage = _response_meta(resp)
+        scheduler.observe(headers, tokens, usage.get("total_tokens"))
+        _record_usage(llm_span, llm, tokens, usage)
+    return resp
 
-def analyze_content(api_key: str, text_content: str, thermal_text_content: str, image_files: list, use_tesseract: bool = False) -> dict:
+def _batch(llm, payloads: list) -> list:
     """
-    Analyzes inspection text, thermal text, and images to extract structured data for the DDR.
-    Returns a dictionary with keys corresponding to DDR sections.
+    Runs the payloads concurrently through the scheduler. Each item is retried on its own;
+    an item that still fails is returned as its exception instead of failing the batch.
     """
-    llm = get_llm(api_key)
-    
-    # 1. Text Analysis (Sample Report + Thermal Report)
-    text_prompt = PromptTemplate(
-        input_variables=["text", "thermal_text"],
-        template="""
+    def run(payload):
+        try:
+            return _invoke(llm, payload)
+        except Exception as e:
+            return e
+
+    if len(payloads) <= 1:
+        return [run(payload) for payload in payloads]
+    with ThreadPoolExecutor(max_workers=min(len(payloads), get_scheduler().max_concurrency)) as pool:
+        return list(pool.map(bind_context(run), payloads))
+
+def _cache_key(llm, payload, schema=None) -> str:
+    if schema is not None:
+        payload = {"schema": schema.model_json_schema(), "payload": payload}
+    return ResponseCache.make_key(getattr(llm, "model_name", ""), getattr(llm, "temperature", None), payload)
+
+def _runnable(llm, schema=None):
+    """The LLM itself, or the LLM bound to a strict JSON schema (pydantic model) for structured output."""
+    if schema is None:
+        return llm
+    return llm.with_structured_output(schema, method="json_schema", strict=True, include_raw=True)
+
+def _content(resp, schema=None) -> str:
+    """Response text; structured responses are validated models, serialized back to JSON."""
+    if isinstance(resp, Exception):
+        return f"Error during LLM request: {str(resp)}"
+    if schema is None:
+        return resp.content
+    if resp.get("parsing_error") or resp.get("parsed") is None:
+        raise ValueError(f"Response does not match {schema.__name__}: {resp.get('parsing_error')}")
+    return resp["parsed"].model_dump_json(indent=2)
+
+def cached_invoke(llm, payload, cache: ResponseCache = None, schema=None) -> str:
+    """
+    Invokes the LLM, serving identical requests (same model, temperature and payload) from the response cache.
+    Pass cache=None to bypass caching. With a pydantic schema the response is schema-enforced
+    structured output, returned as validated JSON text.
+    """
+    if cache is None:
+        return _content(_invoke(_runnable(llm, schema), payload), schema)
+    key = _cache_key(llm, payload, schema)
+    cached = cache.get(key)
+    if cached is not None:
+        increment("llm_cache_hits")
+        return cached
+    content = _content(_invoke(_runnable(llm, schema), payload), schema)
+    cache.set(key, content)
+    return content
+
+def _batch_content(resp, schema=None) -> str:
+    try:
+        return _content(resp, schema)
+    except Exception as e:
+        return _content(e)
+
+def cached_batch(llm, payloads: list, cache: ResponseCache = None, schema=None) -> list:
+    """
+    Batch version of cached_invoke. Only the cache misses are sent to the model; results keep the input order.
+    Items that fail after their retries come back as "Error ..." strings (and are not cached).
+    """
+    if cache is None:
+        return [_batch_content(resp, schema) for resp in _batch(_runnable(llm, schema), payloads)]
+    keys = [_cache_key(llm, payload, schema) for payload in payloads]
+    results = [cache.get(key) for key in keys]
+    missing = [i for i, result in enumerate(results) if result is None]
+    if len(missing) < len(payloads):
+        increment("llm_cache_hits", len(payloads) - len(missing))
+    if missing:
+        responses = _batch(_runnable(llm, schema), [payloads[i] for i in missing])
+        for i, resp in zip(missing, responses):
+            results[i] = _batch_content(resp, schema)
+            if not isinstance(resp, Exception) and not results[i].startswith("Error"):
+                cache.set(keys[i], results[i])
+    return results
+
+async def cached_ainvoke(llm, payload, cache: ResponseCache = None, schema=None) -> str:
+    """Async version of cached_invoke (uses llm.ainvoke)."""
+    if cache is None:
+        return _content(await _ainvoke(_runnable(llm, schema), payload), schema)
+    key = _cache_key(llm, payload, schema)
+    cached = cache.get(key)
+    if cached is not None:
+        increment("llm_cache_hits")
+        return cached
+    content = _content(await _ainvoke(_runnable(llm, schema), payload), schema)
+    cache.set(key, content)
+    return content
+
+def cached_stream(llm, payload, cache: ResponseCache = None):
+    """
+    Streaming version of cached_invoke: yields the response text in chunks as they arrive (llm.stream).
+    A cached response is yielded whole; a completed stream is stored in the cache.
+    """
+    key = _cache_key(llm, payload) if cache is not None else None
+    if key is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            increment("llm_cache_hits")
+            yield cached
+            return
+    scheduler = get_scheduler()
+    tokens = estimate_request_tokens(payload)
+    parts = []
+    usage = {}
+    observed = False
+    with span("llm.stream", model=getattr(llm, "model_name", "")) as llm_span:
+        for chunk in scheduler.stream(lambda: llm.stream(payload), tokens):
+            headers, chunk_usage = _response_meta(chunk)
+            if not observed:
+                scheduler.observe(headers, tokens)
+                observed = True
+            # With stream_usage the token counts arrive on the last chunk
+            usage = chunk_usage or usage
+            if chunk.content:
+                parts.append(chunk.content)
+                yield chunk.content
+        _record_usage(llm_span, llm, tokens, usage)
+    if key is not None:
+        cache.set(key, "".join(parts))
+
+# Text analysis prompt (Sample Report + Thermal Report)
+# Plain str.format template (fields: text, thermal_text); same output as the former PromptTemplate
+TEXT_ANALYSIS_PROMPT = """
         You are an expert structural engineer. Analyze the following inspection and thermal reports.
         
         INSPECTION REPORT TEXT:
@@ -57,76 +266,398 @@ def analyze_content(api_key: str, text_content: str, thermal_text_content: str,
             "missing_info": "Client address not found."
         }}
         """
+
+IMAGE_ANALYSIS_INSTRUCTION = "Analyze this image. If it's a thermal image, read the Max/Min temperatures and calculate the difference. If >4C, note moisture. If normal photo, note cracks/dampness. Return a concise observation string."
+
+# Default per-request token budget for chunked text analysis (prompt + report text)
+DEFAULT_CONTEXT_BUDGET = 8000
+
+# Encoded image payloads waiting for (or in) a Vision request at any time; bounds memory for large image sets
+MAX_PENDING_IMAGE_REQUESTS = int(os.getenv("DDR_MAX_PENDING_IMAGES", "16"))
+
+def _as_text(content) -> str:
+    """Accepts either the full report text or a list of page texts."""
+    if isinstance(content, (list, tuple)):
+        return "\n".join(content)
+    return content or ""
+
+def build_text_analysis_prompt(text_content, thermal_text_content) -> str:
+    """Builds the combined inspection + thermal text prompt."""
+    # Truncate to fit context if needed, but prioritizing both reports
+    return TEXT_ANALYSIS_PROMPT.format(
+        text=_as_text(text_content)[:10000], 
+        thermal_text=_as_text(thermal_text_content)[:5000]
     )
+
+def build_chunked_text_prompts(text_content, thermal_text_content, context_budget: int = DEFAULT_CONTEXT_BUDGET) -> list:
+    """
+    Splits the reports by page into chunks that keep every request within context_budget tokens
+    (counted with tiktoken, prompt included). Nothing is truncated.
+    A short thermal report is included whole in every chunk so deltas can be matched to areas;
+    a long one is chunked on its own.
+    """
+    overhead = count_tokens(TEXT_ANALYSIS_PROMPT.format(text="", thermal_text=""))
+    budget = max(256, context_budget - overhead)
+    thermal_pages = split_pages(thermal_text_content or "")
+    thermal_text = "\n".join(thermal_pages)
+    thermal_tokens = count_tokens(thermal_text)
+
+    if thermal_tokens <= budget // 3:
+        chunks = chunk_pages(split_pages(text_content or ""), budget - thermal_tokens) or [""]
+        return [TEXT_ANALYSIS_PROMPT.format(text=chunk, thermal_text=thermal_text) for chunk in chunks]
+
+    prompts = [TEXT_ANALYSIS_PROMPT.format(text=chunk, thermal_text="") for chunk in chunk_pages(split_pages(text_content or ""), budget)]
+    prompts += [TEXT_ANALYSIS_PROMPT.format(text="", thermal_text=chunk) for chunk in chunk_pages(thermal_pages, budget)]
+    return prompts
+
+def merge_chunk_responses(responses: list) -> str:
+    """Reduces the per-chunk responses into one JSON analysis (observations/causes/actions deduplicated)."""
+    if len(responses) == 1:
+        return responses[0]
+    failed = [response for response in responses if response.startswith("Error")]
+    if len(failed) == len(responses):
+        return failed[0]
+    partials, unparsed = [], []
+    for response in responses:
+        if response.startswith("Error"):
+            continue
+        data = parse_json_response(response)
+        if data is None:
+            unparsed.append(response)
+        else:
+            partials.append(data)
+    merged = merge_analyses(partials)
+    if unparsed:
+        merged["additional_notes"] = (merged["additional_notes"] + " " + " ".join(unparsed)).strip()
+    if failed:
+        # One failed chunk must not sink the whole analysis; flag the gap instead
+        merged["missing_info"] = (merged["missing_info"] + f" {len(failed)} of {len(responses)} report sections could not be analyzed.").strip()
+    return json.dumps(merged, indent=2, ensure_ascii=False)
+
+def build_image_message(img_file, encoding: EncodingConfig, detail: str):
+    """Encodes one image and wraps it in a Vision request. Returns (messages, encoded image info)."""
+    from langchain_core.messages import HumanMessage
+
+    # Downscale to the model's effective resolution and re-encode compactly
+    encoded = encode_image(img_file, encoding, detail)
+    msg = HumanMessage(content=[
+        {"type": "text", "text": IMAGE_ANALYSIS_INSTRUCTION},
+        {"type": "image_url", "image_url": {"url": encoded["url"], "detail": encoded["detail"]}}
+    ])
+    return [msg], encoded
+
+def _text_artifact_key(llm, text_content, thermal_text_content, chunked: bool, context_budget: int) -> str:
+    """Artifact key of a text analysis: model, prompt, schema, both report texts and the chunking settings."""
+    return ArtifactStore.artifact_key("text_analysis", getattr(llm, "model_name", ""), TEXT_ANALYSIS_PROMPT,
+                                      json.dumps(DDRAnalysis.model_json_schema(), sort_keys=True),
+                                      json.dumps([text_content, thermal_text_content]), chunked, context_budget if chunked else "")
+
+def _vision_artifact_key(llm, img_file, encoding: EncodingConfig, detail: str) -> str:
+    """Artifact key of one image observation: model, instruction, image content and how it is encoded."""
+    return ArtifactStore.artifact_key("vision", getattr(llm, "model_name", ""), IMAGE_ANALYSIS_INSTRUCTION,
+                                      image_digest(img_file), repr(encoding), detail)
+
+def _read_thermal(img_file, artifacts: ArtifactStore = None):
+    """
+    analyze_thermal_image, stored in the artifact store (including "not readable") per image content,
+    scale from the source page and analyzer version.
+    """
+    if artifacts is None:
+        return analyze_thermal_image(img_file)
+    scale = scale_from_text(getattr(img_file, "page_text", None))
+    key = ArtifactStore.artifact_key("thermal", THERMAL_ANALYZER_VERSION, image_digest(img_file), repr(scale))
+    stored = artifacts.load(key)
+    if stored is not None:
+        return stored["reading"]
+    reading = analyze_thermal_image(img_file)
+    artifacts.save(key, {"reading": reading})
+    return reading
+
+def _store_observation(artifacts: ArtifactStore, key: str, tokens: int, observation) -> None:
+    """Keeps a successful Vision observation as an image artifact (errors are retried next time)."""
+    if artifacts is not None and key and not str(observation).startswith("Error"):
+        artifacts.save(key, {"observation": observation, "tokens": tokens})
+
+def _send_image_batch(llm, batch_messages: list, batch_keys: list, cache: ResponseCache, artifacts: ArtifactStore) -> list:
+    # Concurrency, rate limits and retries are handled per image by the shared scheduler
+    observations = cached_batch(llm, batch_messages, cache)
+    for (key, tokens), observation in zip(batch_keys, observations):
+        _store_observation(artifacts, key, tokens, observation)
+    return observations
+
+def ocr_images(image_files, max_workers: int = None, timeout: float = None) -> list:
+    """
+    Runs local Tesseract OCR over the images, spread across a process pool.
+    Each image is preprocessed (grayscale, binarize, deskew, crop to text) and has its own timeout.
+    """
+    # The workers import it; here only check that it is installed
+    if importlib.util.find_spec("pytesseract") is None:
+        return ["Error: pytesseract not installed."]
+    # pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe' 
+    from src.ocr import DEFAULT_OCR_TIMEOUT, ocr_images_parallel
+    return ocr_images_parallel(list(image_files), max_workers=max_workers, timeout=timeout or DEFAULT_OCR_TIMEOUT)
+
+def analyze_content(api_key: str, text_content: str, thermal_text_content: str, image_files: list, use_tesseract: bool = False, use_cache: bool = True, encoding: EncodingConfig = None, chunked: bool = False, context_budget: int = DEFAULT_CONTEXT_BUDGET, local_thermal: bool = True) -> dict:
+    """
+    Analyzes inspection text, thermal text, and images to extract structured data for the DDR.
+    The text analysis uses schema-enforced structured output (src.schema.DDRAnalysis) and is returned as JSON.
+    Identical requests are served from the on-disk response cache unless use_cache is False.
+    Images are downscaled/re-encoded according to `encoding`; the estimated image token cost
+    of the request is returned as "image_token_estimate".
+    With chunked=True the text (a string or a list of page texts) is analyzed in page chunks of at most
+    context_budget tokens in parallel and the partial results are merged, instead of being truncated.
+    With local_thermal=True, FLIR-style thermal images are read locally (src.thermal) and only the
+    images it cannot read confidently go to Vision; their count is returned as "images_local".
+    With use_cache, the text analysis and each image observation are also kept as artifacts keyed by
+    their inputs (src.artifacts), so a rerun with one changed input only recomputes what depends on it.
+    """
+    llm = get_llm(api_key)
+    cache = get_response_cache() if _caching(use_cache) else None
+    artifacts = get_artifact_store() if _caching(use_cache) else None
     
+    # 1. Text Analysis (Sample Report + Thermal Report)
     combined_text_analysis = ""
-    try:
-        # Truncate to fit context if needed, but prioritizing both reports
-        response = llm.invoke(text_prompt.format(
-            text=text_content[:10000], 
-            thermal_text=thermal_text_content[:5000]
-        ))
-        combined_text_analysis = response.content
-    except Exception as e:
-        combined_text_analysis = f"Error during text analysis: {str(e)}"
+    text_key = _text_artifact_key(llm, text_content, thermal_text_content, chunked, context_budget) if artifacts else None
+    stored_text = artifacts.load(text_key) if artifacts else None
+    with span("analysis.text", chunked=chunked, stored=stored_text is not None) as text_span:
+        try:
+            if stored_text is not None:
+                combined_text_analysis = stored_text
+            elif chunked:
+                prompts = build_chunked_text_prompts(text_content, thermal_text_content, context_budget)
+                responses = cached_batch(llm, prompts, cache, schema=DDRAnalysis)
+                combined_text_analysis = merge_chunk_responses(responses)
+                if artifacts and not any(r.startswith("Error") for r in responses):
+                    artifacts.save(text_key, combined_text_analysis)
+            else:
+                combined_text_analysis = cached_invoke(llm, build_text_analysis_prompt(text_content, thermal_text_content), cache, schema=DDRAnalysis)
+                if artifacts:
+                    artifacts.save(text_key, combined_text_analysis)
+        except Exception as e:
+            combined_text_analysis = f"Error during text analysis: {str(e)}"
+            text_span.fail(e)
     
     # 2. Image Analysis (Thermal/Site Images)
     image_observations = []
+    image_token_estimate = 0
+    images_skipped = 0
+    images_local = 0
     
-    if image_files:
-        if use_tesseract:
-             # LOCAL OCR (Serial)
-             try:
-                 import pytesseract
-                 # pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe' 
-                 for img_file in image_files:
-                     try:
-                         text = pytesseract.image_to_string(img_file)
-                         image_observations.append(f"[OCR Result]: {text.strip()}")
-                     except Exception as e:
-                         image_observations.append(f"Error analyzing image with Tesseract: {str(e)}")
-             except ImportError:
-                 image_observations.append("Error: pytesseract not installed.")
-        else:
-            # GPT-4o VISION (Parallel Batch)
-            batch_messages = []
-            for img_file in image_files:
-                try:
-                    # Convert PIL Image to base64
-                    buffered = io.BytesIO()
-                    img_file.save(buffered, format="PNG") 
-                    img_str = base64.b64encode(buffered.getvalue()).decode("utf-8")
-                    
-                    msg = HumanMessage(content=[
-                        {"type": "text", "text": "Analyze this image. If it's a thermal image, read the Max/Min temperatures and calculate the difference. If >4C, note moisture. If normal photo, note cracks/dampness. Return a concise observation string."},
-                        {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{img_str}"}}
-                    ])
-                    batch_messages.append([msg])
-                except Exception as e:
-                    image_observations.append(f"Error preparing image: {str(e)}")
-
-            if batch_messages:
-                try:
-                    # Use batch processing with concurrency to speed up analysis
-                    # 5 concurrent requests is a safe default to avoid rate limits
-                    responses = llm.batch(batch_messages, config={"max_concurrency": 5})
-                    for resp in responses:
-                        image_observations.append(resp.content)
-                except Exception as e:
-                    image_observations.append(f"Error during batch analysis: {str(e)}")
+    with span("analysis.images", images=len(image_files or []), ocr=use_tesseract) as images_span:
+        if image_files:
+            if use_tesseract:
+                 # LOCAL OCR (Process pool)
+                 image_observations.extend(ocr_images(image_files))
+            else:
+                # GPT-4o VISION (Parallel Batch), sent in windows so only a window of encoded payloads is held
+                batch_messages, batch_keys = [], []
+                encoding = encoding or EncodingConfig()
+                details = plan_details([img.size for img in image_files], encoding)
+                for img_file, detail in zip(image_files, details):
+                    reading = _read_thermal(img_file, artifacts) if local_thermal else None
+                    if reading:
+                        image_observations.append(reading["observation"])
+                        images_local += 1
+                        continue
+                    if detail is None:
+                        images_skipped += 1
+                        continue
+                    try:
+                        key = _vision_artifact_key(llm, img_file, encoding, detail) if artifacts else None
+                        stored = artifacts.load(key) if artifacts else None
+                        if stored is not None:
+                            image_observations.append(stored["observation"])
+                            image_token_estimate += stored["tokens"]
+                            continue
+                        messages, encoded = build_image_message(img_file, encoding, detail)
+                        image_token_estimate += encoded["tokens"]
+                        batch_messages.append(messages)
+                        batch_keys.append((key, encoded["tokens"]))
+                    except Exception as e:
+                        image_observations.append(f"Error preparing image: {str(e)}")
+                    if len(batch_messages) >= MAX_PENDING_IMAGE_REQUESTS:
+                        image_observations.extend(_send_image_batch(llm, batch_messages, batch_keys, cache, artifacts))
+                        batch_messages, batch_keys = [], []
+
+                if batch_messages:
+                    image_observations.extend(_send_image_batch(llm, batch_messages, batch_keys, cache, artifacts))
+                if images_skipped:
+                    image_observations.append(f"Note: {images_skipped} image(s) not analyzed (image token budget reached).")
+        images_span.set(image_tokens=image_token_estimate, skipped=images_skipped, local=images_local,
+                        failed=sum(1 for obs in image_observations if str(obs).startswith("Error")))
 
     return {
         "text_analysis": combined_text_analysis,
-        "image_analysis": image_observations
+        "image_analysis": image_observations,
+        "image_token_estimate": image_token_estimate,
+        "images_skipped": images_skipped,
+        "images_local": images_local
     }
 
-def synthesize_report_data(api_key: str, analysis_results: dict, template_style: str) -> str:
+async def _aiter_images(image_files):
+    """Iterates a list, a (possibly lazy) sync iterable or an async iterable of images without blocking the event loop."""
+    if hasattr(image_files, "__aiter__"):
+        async for img in image_files:
+            yield img
+        return
+    if isinstance(image_files, (list, tuple)):
+        for img in image_files:
+            yield img
+        return
+    # Lazy generators (e.g. still parsing a PDF) are advanced in a worker thread
+    iterator = iter(image_files)
+    done = object()
+    while True:
+        img = await asyncio.to_thread(next, iterator, done)
+        if img is done:
+            return
+        yield img
+
+async def _analyze_images_async(llm, image_files, cache: ResponseCache, encoding: EncodingConfig, max_concurrency: int = None, local_thermal: bool = True, artifacts: ArtifactStore = None) -> dict:
     """
-    Synthesizes the analyzed data into the final DDR structure using the template as a guide.
+    Sends each image to Vision as soon as it is available, so ingestion of later images
+    overlaps with the analysis of earlier ones. Failures are reported per image.
+    Thermal images that src.thermal reads confidently are answered locally instead.
+    At most MAX_PENDING_IMAGE_REQUESTS encoded payloads exist at a time: reading further images
+    waits for earlier requests to finish, so memory stays flat however many images there are.
+    Observations already in `artifacts` (same image content and encoding) are reused without a request.
+    Observations come back in input order, as in analyze_content.
+    """
+    semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency else contextlib.nullcontext()
+    pending = asyncio.Semaphore(MAX_PENDING_IMAGE_REQUESTS)
+    sized = isinstance(image_files, (list, tuple))
+    planned = plan_details([img.size for img in image_files], encoding) if sized else None
+    # One slot per analyzed image, in input order: an observation or the task that produces it
+    slots = []
+    tasks = []
+    local = 0
+    token_estimate = 0
+    skipped = 0
+
+    async def run(messages, key, tokens):
+        try:
+            async with semaphore:
+                observation = await cached_ainvoke(llm, messages, cache)
+            _store_observation(artifacts, key, tokens, observation)
+            return observation
+        except Exception as e:
+            return f"Error during image analysis: {str(e)}"
+        finally:
+            pending.release()
+
+    index = 0
+    async for img_file in _aiter_images(image_files):
+        detail = planned[index] if sized else None
+        index += 1
+        reading = await asyncio.to_thread(_read_thermal, img_file, artifacts) if local_thermal else None
+        if reading:
+            slots.append(reading["observation"])
+            local += 1
+            continue
+        if not sized:
+            detail = next_detail(img_file.size[0], img_file.size[1], encoding, token_estimate)
+        if detail is None:
+            skipped += 1
+            continue
+        key = None
+        if artifacts is not None:
+            try:
+                key = await asyncio.to_thread(_vision_artifact_key, llm, img_file, encoding, detail)
+            except Exception as e:
+                slots.append(f"Error preparing image: {str(e)}")
+                continue
+            stored = artifacts.load(key)
+            if stored is not None:
+                slots.append(stored["observation"])
+                token_estimate += stored["tokens"]
+                continue
+        await pending.acquire()
+        try:
+            # Encoding is CPU-bound; keep the event loop free for in-flight requests
+            messages, encoded = await asyncio.to_thread(build_image_message, img_file, encoding, detail)
+        except Exception as e:
+            pending.release()
+            slots.append(f"Error preparing image: {str(e)}")
+            continue
+        token_estimate += encoded["tokens"]
+        tasks.append(asyncio.create_task(run(messages, key, encoded["tokens"])))
+        slots.append(tasks[-1])
+
+    await asyncio.gather(*tasks)
+    observations = [slot.result() if isinstance(slot, asyncio.Task) else slot for slot in slots]
+    if skipped:
+        observations.append(f"Note: {skipped} image(s) not analyzed (image token budget reached).")
+    return {"image_analysis": observations, "image_token_estimate": token_estimate, "images_skipped": skipped,
+            "images_local": local}
+
+async def analyze_content_async(api_key: str, text_content: str, thermal_text_content: str, image_files, use_tesseract: bool = False, use_cache: bool = True, encoding: EncodingConfig = None, max_concurrency: int = None, chunked: bool = False, context_budget: int = DEFAULT_CONTEXT_BUDGET, local_thermal: bool = True) -> dict:
+    """
+    Async variant of analyze_content: the text analysis and the image analyses run concurrently,
+    so wall-clock time is roughly that of the slowest branch instead of their sum.
+    image_files may also be a generator or async iterable; each image is analyzed as soon as it arrives.
+    chunked/context_budget behave as in analyze_content; the chunks run concurrently with the images.
+    Requests are paced by the shared scheduler (src.scheduler); max_concurrency optionally caps this call further.
+    Results are reused from and kept in the artifact store as in analyze_content.
+    Returns the same dictionary as analyze_content.
     """
     llm = get_llm(api_key)
-    
-    prompt = f"""
+    cache = get_response_cache() if _caching(use_cache) else None
+    artifacts = get_artifact_store() if _caching(use_cache) else None
+    encoding = encoding or EncodingConfig()
+
+    async def text_branch():
+        text_key = _text_artifact_key(llm, text_content, thermal_text_content, chunked, context_budget) if artifacts else None
+        stored = artifacts.load(text_key) if artifacts else None
+        with span("analysis.text", chunked=chunked, stored=stored is not None) as text_span:
+            if stored is not None:
+                return stored
+            result, complete = await _text_branch()
+            if result.startswith("Error"):
+                text_span.fail(result)
+            elif artifacts and complete:
+                artifacts.save(text_key, result)
+            return result
+
+    async def _text_branch():
+        """(analysis, whether every request succeeded)"""
+        try:
+            if chunked:
+                semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency else contextlib.nullcontext()
+
+                async def run(prompt):
+                    async with semaphore:
+                        try:
+                            return await cached_ainvoke(llm, prompt, cache, schema=DDRAnalysis)
+                        except Exception as e:
+                            return f"Error during text analysis: {str(e)}"
+
+                prompts = build_chunked_text_prompts(text_content, thermal_text_content, context_budget)
+                responses = list(await asyncio.gather(*(run(p) for p in prompts)))
+                return merge_chunk_responses(responses), not any(r.startswith("Error") for r in responses)
+            return await cached_ainvoke(llm, build_text_analysis_prompt(text_content, thermal_text_content), cache, schema=DDRAnalysis), True
+        except Exception as e:
+            return f"Error during text analysis: {str(e)}", False
+
+    async def image_branch():
+        with span("analysis.images", ocr=use_tesseract) as images_span:
+            if use_tesseract:
+                # LOCAL OCR runs in a worker thread while the text request is in flight
+                images = [img async for img in _aiter_images(image_files)]
+                observations = await asyncio.to_thread(ocr_images, images) if images else []
+                result = {"image_analysis": observations, "image_token_estimate": 0, "images_skipped": 0, "images_local": 0}
+            else:
+                result = await _analyze_images_async(llm, image_files or [], cache, encoding, max_concurrency, local_thermal, artifacts)
+            observations = result["image_analysis"]
+            images_span.set(images=sum(1 for obs in observations if not str(obs).startswith("Note:")), image_tokens=result["image_token_estimate"], skipped=result["images_skipped"],
+                            local=result["images_local"], failed=sum(1 for obs in observations if str(obs).startswith("Error")))
+            return result
+
+    text_result, image_result = await asyncio.gather(text_branch(), image_branch())
+    return {"text_analysis": text_result, **image_result}
+
+def build_synthesis_prompt(analysis_results: dict, template_style: str) -> str:
+    """Builds the prompt that fills the DDR template with the analyzed data."""
+    return f"""
     You are a professional report writer for a structural engineering firm.
     Your task is to populate the following DDR TEMPLATE with the ANALYZED DATA.
     
@@ -151,9 +682,87 @@ def synthesize_report_data(api_key: str, analysis_results: dict, template_style:
     OUTPUT:
     Return the fully filled Markdown report. Do not change the Section Headers. Ensure there is no trailing truncated text.
     """
+
+def synthesize_report_data(api_key: str, analysis_results: dict, template_style: str, use_cache: bool = True) -> str:
+    """
+    Synthesizes the analyzed data into the final DDR structure using the template as a guide.
+    """
+    llm = get_llm(api_key)
+    cache = get_response_cache() if _caching(use_cache) else None
+    
+    prompt = build_synthesis_prompt(analysis_results, template_style)
     
     try:
-        response = llm.invoke(prompt)
-        return response.content
+        return cached_invoke(llm, prompt, cache)
     except Exception as e:
         return f"Error synthesizing report: {str(e)}"
+
+def build_polish_prompt(report_markdown: str) -> str:
+    """Builds the optional prose-polishing prompt for a report already rendered from the template."""
+    return f"""
+    You are a professional report writer for a structural engineering firm.
+    Improve the wording of the following DDR (Detailed Diagnostic Report) for a client audience.
+    
+    REPORT (Markdown):
+    {report_markdown}
+    
+    INSTRUCTIONS:
+    1. Only rephrase prose: fix grammar, make sentences clear and professional, no jargon.
+    2. Do NOT add, remove or change facts, areas, temperatures, scores, dates, names or "Not Available" values.
+    3. Keep every header, bullet point and numbered item exactly where it is, each on its own line.
+    
+    OUTPUT:
+    Return only the polished Markdown report.
+    """
+
+def polish_report(api_key: str, report_markdown: str, use_cache: bool = True) -> str:
+    """
+    Optional second LLM pass that polishes the prose of a locally rendered report.
+    Falls back to the unpolished report if the call fails (counted as "polish_failures").
+    """
+    llm = get_llm(api_key)
+    cache = get_response_cache() if _caching(use_cache) else None
+    with span("analysis.polish") as polish_span:
+        try:
+            return normalize_markdown(cached_invoke(llm, build_polish_prompt(report_markdown), cache))
+        except Exception as e:
+            _polish_failed(polish_span, e)
+            return report_markdown
+
+def _polish_failed(polish_span, error) -> None:
+    """Records a failed polish pass; the caller falls back to the unpolished report."""
+    polish_span.fail(error)
+    increment("polish_failures")
+
+def stream_polish_report(api_key: str, report_markdown: str, use_cache: bool = True):
+    """
+    Streaming variant of polish_report: yields the polished report as it is generated (the caller
+    applies normalize_markdown to the assembled text).
+    If the request fails before anything was produced, the unpolished report is yielded instead;
+    a failure after partial output is re-raised, so the caller can discard the partial text.
+    """
+    llm = get_llm(api_key)
+    cache = get_response_cache() if _caching(use_cache) else None
+    produced = False
+    try:
+        for text in cached_stream(llm, build_polish_prompt(report_markdown), cache):
+            produced = True
+            yield text
+    except Exception as e:
+        # Not a span around the loop: the generator is resumed from the caller's context on every chunk
+        with span("analysis.polish", streamed=True, partial=produced) as polish_span:
+            _polish_failed(polish_span, e)
+        if produced:
+            raise
+        yield report_markdown
+
+async def polish_report_async(api_key: str, report_markdown: str, use_cache: bool = True) -> str:
+    """Async variant of polish_report (uses llm.ainvoke)."""
+    llm = get_llm(api_key)
+    cache = get_response_cache() if _caching(use_cache) else None
+    with span("analysis.polish") as polish_span:
+        try:
+            return normalize_markdown(await cached_ainvoke(llm, build_polish_prompt(report_markdown), cache))
+        except Exception as e:
+            _polish_failed(polish_span, e)
+            return report_markdown
@@ -0,0 +1,175 @@
+import hashlib
+import io
+import json
+import os
+import threading
+from typing import Any, Optional
+from PIL import Image
+from src.cache import DEFAULT_MAX_AGE_SECONDS, ResponseCache
+from src.ingestion import PdfImage, SpilledImage, as_pil_image, parse_pdf
+from src.tracing import increment, span
+
+# Bump when the stored formats (or the code producing them) change, so old entries are ignored
+ARTIFACT_VERSION = "2"
+# A sibling of the response cache, so neither store's eviction or clear() touches the other
+DEFAULT_ARTIFACT_DIR = os.getenv("DDR_ARTIFACT_DIR", ".ddr_artifacts")
+DEFAULT_ARTIFACT_MAX_BYTES = int(float(os.getenv("DDR_ARTIFACT_MAX_MB", "1024")) * 1024 * 1024)
+
+class ArtifactStore(ResponseCache):
+    """
+    Disk-backed store of intermediate results keyed by the content hash of their inputs: parsed
+    pages per PDF, the observation per image, the text analysis per report pair. A rerun with one
+    changed input only recomputes the artifacts that depend on it.
+    Values are JSON; binary data (image sources) is kept in separate content-addressed blob files.
+    Eviction (age, size) works as in ResponseCache and covers both.
+    """
+
+    ENTRY_SUFFIXES = (".json", ".bin")
+
+    def __init__(self, cache_dir: str = DEFAULT_ARTIFACT_DIR, max_bytes: int = DEFAULT_ARTIFACT_MAX_BYTES,
+                 max_age_seconds: float = DEFAULT_MAX_AGE_SECONDS, enabled: bool = True):
+        super().__init__(cache_dir, max_bytes, max_age_seconds, enabled)
+
+    @staticmethod
+    def artifact_key(kind: str, *parts) -> str:
+        """Key of one artifact: its kind plus every input it depends on (str or bytes)."""
+        digest = hashlib.sha256(f"{ARTIFACT_VERSION}\0{kind}".encode("utf-8"))
+        for part in parts:
+            data = part if isinstance(part, bytes) else str(part).encode("utf-8")
+            digest.update(b"\0" + hashlib.sha256(data).digest())
+        return digest.hexdigest()
+
+    def load(self, key: str) -> Optional[Any]:
+        """The stored value for the key, or None."""
+        stored = self.get(key)
+        if stored is None:
+            return None
+        increment("artifact_hits")
+        return json.loads(stored)
+
+    def save(self, key: str, value: Any) -> None:
+        self.set(key, json.dumps(value))
+
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self.cache_dir, digest[:2], f"{digest}.bin")
+
+    def save_blob(self, data: bytes) -> Optional[str]:
+        """Stores raw bytes under their SHA-256 and returns it (None if the store is off or the write failed)."""
+        if not self.enabled:
+            return None
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._blob_path(digest)
+        try:
+            # Same content, same file: only mark it as recently used
+            os.utime(path, None)
+            return digest
+        except OSError:
+            pass
+        if not self._write(path, data):
+            return None
+        self.evict()
+        return digest
+
+    def load_blob(self, digest: str) -> Optional[bytes]:
+        """The bytes stored under the digest, or None if missing or not matching it."""
+        if not self.enabled:
+            return None
+        path = self._blob_path(digest)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path, None)
+        except OSError:
+            return None
+        return data if hashlib.sha256(data).hexdigest() == digest else None
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+def get_artifact_store() -> ArtifactStore:
+    """Returns the process-wide artifact store (DDR_ARTIFACT_DIR, DDR_ARTIFACT_MAX_MB; off with DDR_CACHE_DISABLE)."""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = ArtifactStore()
+        return _default_store
+
+def image_digest(img) -> str:
+    """Content hash of an image (its encoded source where there is one, else its pixels)."""
+    if hasattr(img, "content_hash"):
+        return img.content_hash()
+    pil = as_pil_image(img)
+    return hashlib.sha256(f"{pil.mode}{pil.size}".encode("utf-8") + pil.tobytes()).hexdigest()
+
+def _read_bytes(file) -> bytes:
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, "rb") as f:
+            return f.read()
+    if hasattr(file, "getvalue"):
+        return file.getvalue()
+    file.seek(0)
+    data = file.read()
+    file.seek(0)
+    return data
+
+def _image_entry(img, store: ArtifactStore) -> Optional[dict]:
+    """
+    Manifest entry of one parsed image: the PDF stream as extracted (so JPEG passthrough and content
+    hashes match a fresh parse), or else its raw pixels. None if the blob could not be stored.
+    """
+    entry = {"page": getattr(img, "page_number", None)}
+    if isinstance(img, PdfImage):
+        try:
+            # pdfminer decode parameters may hold objects JSON cannot represent; those keep their pixels
+            decode_params = json.loads(json.dumps(img.decode_params))
+        except (TypeError, ValueError):
+            decode_params = None
+        if decode_params is not None:
+            entry.update(kind="stream", format=img.format, width=img.width, height=img.height, filters=img.filters,
+                         decode_params=decode_params, mode=img.mode, bits=img.bits, blob=store.save_blob(img.data))
+            return entry if entry["blob"] else None
+    pil = as_pil_image(img)
+    entry.update(kind="pixels", mode=pil.mode, width=pil.width, height=pil.height, blob=store.save_blob(pil.tobytes()))
+    return entry if entry["blob"] else None
+
+def _image_from_entry(entry: dict, store: ArtifactStore, page_texts: dict):
+    """Rebuilds a parsed image from its manifest entry (None if its blob is gone)."""
+    data = store.load_blob(entry["blob"])
+    if data is None:
+        return None
+    page_text = page_texts.get(entry["page"])
+    if entry["kind"] == "stream":
+        return PdfImage(entry["width"], entry["height"], entry["format"], data, filters=entry["filters"],
+                        decode_params=entry["decode_params"], mode=entry["mode"], bits=entry["bits"],
+                        page_number=entry["page"], page_text=page_text)
+    pixels = Image.frombytes(entry["mode"], (entry["width"], entry["height"]), data)
+    return SpilledImage(pixels, page_number=entry["page"], page_text=page_text)
+
+def parse_pdf_cached(file, image_mode: str = "stream", store: ArtifactStore = None) -> dict:
+    """
+    parse_pdf, served from the artifact store when the same PDF (by content) was parsed before.
+    The entry is a JSON manifest (text, pages, one record per image); image sources are blobs
+    beside it. Results with read errors are not stored.
+    """
+    store = store or get_artifact_store()
+    data = _read_bytes(file)
+    key = ArtifactStore.artifact_key("pdf", data, image_mode)
+    with span("ingestion.parse_pdf_cached", bytes=len(data), image_mode=image_mode) as cached_span:
+        stored = store.load(key)
+        if stored is not None:
+            page_texts = {page["page_number"]: page["text"] for page in stored["pages"]}
+            images = [_image_from_entry(entry, store, page_texts) for entry in stored["images"]]
+            if all(img is not None for img in images):
+                cached_span.set(hit=True, pages=len(stored["pages"]), images=len(images))
+                return {"text": stored["text"], "pages": stored["pages"], "images": images}
+            # An image blob was evicted; parse again
+        cached_span.set(hit=False)
+    result = parse_pdf(io.BytesIO(data), image_mode)
+    if not result["text"].startswith("Error") and store.enabled:
+        try:
+            entries = [_image_entry(img, store) for img in result["images"]]
+            if all(entry is not None for entry in entries):
+                store.save(key, {"text": result["text"], "pages": result["pages"], "images": entries})
+        except Exception as e:
+            print(f"PDF artifact not stored: {e}")
+    return result
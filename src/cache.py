@@ -0,0 +1,195 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from typing import Any, Optional
+
+DEFAULT_CACHE_DIR = os.getenv("DDR_CACHE_DIR", ".ddr_cache")
+DEFAULT_MAX_BYTES = int(float(os.getenv("DDR_CACHE_MAX_MB", "256")) * 1024 * 1024)
+DEFAULT_MAX_AGE_SECONDS = float(os.getenv("DDR_CACHE_MAX_AGE_DAYS", "30")) * 24 * 3600
+# Entries live in <cache_dir>/<first two hex digits of the key>/
+_SHARD_RE = re.compile(r"[0-9a-f]{2}")
+
+
+def _to_jsonable(payload: Any) -> Any:
+    if isinstance(payload, (list, tuple)):
+        return [_to_jsonable(p) for p in payload]
+    if hasattr(payload, "content"):
+        # LangChain message objects
+        return {"type": getattr(payload, "type", ""), "content": payload.content}
+    return payload
+
+
+def _serialize_payload(payload: Any) -> str:
+    """Turns a prompt string or a list of LangChain messages into a stable string."""
+    if isinstance(payload, str):
+        return payload
+    return json.dumps(_to_jsonable(payload), sort_keys=True, default=str)
+
+
+class ResponseCache:
+    """
+    Disk-backed, content-addressed cache for LLM responses.
+    Entries are keyed by a hash of model, temperature and the exact prompt/image payload,
+    and evicted by age (on read) and by total size (least recently used first).
+    """
+
+    # File suffixes of the entries counted by eviction and clear()
+    ENTRY_SUFFIXES = (".json",)
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES,
+                 max_age_seconds: float = DEFAULT_MAX_AGE_SECONDS, enabled: bool = True):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.enabled = enabled and os.getenv("DDR_CACHE_DISABLE", "") not in ("1", "true", "yes")
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._total_bytes = None
+
+    @staticmethod
+    def make_key(model: str, temperature: float, payload: Any) -> str:
+        """Builds the content-addressed key for one LLM request."""
+        digest = hashlib.sha256()
+        digest.update(f"{model}\0{temperature}\0".encode("utf-8"))
+        digest.update(_serialize_payload(payload).encode("utf-8"))
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def get(self, key: str) -> Optional[str]:
+        """Returns the cached response for the key, or None on a miss."""
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            if time.time() - entry["created_at"] > self.max_age_seconds:
+                self._remove(path)
+                raise FileNotFoundError(path)
+            # Touch the file so size eviction drops the least recently used entries first
+            os.utime(path, None)
+        except (OSError, ValueError, KeyError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return entry["response"]
+
+    def set(self, key: str, response: str) -> None:
+        """Stores a response and evicts old entries if the cache exceeds its size limit."""
+        if not self.enabled:
+            return
+        data = json.dumps({"created_at": time.time(), "response": response}).encode("utf-8")
+        if self._write(self._path(key), data):
+            self.evict()
+
+    def _write(self, path: str, data: bytes) -> bool:
+        """Atomically writes one entry file and counts it towards the size limit."""
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Response cache write failed: {e}")
+            return False
+        with self._lock:
+            if self._total_bytes is not None:
+                self._total_bytes += len(data)
+        return True
+
+    def _entries(self) -> list:
+        """(mtime, size, path) of the entries; only the cache's own shard directories are scanned."""
+        entries = []
+        try:
+            shards = [name for name in os.listdir(self.cache_dir) if _SHARD_RE.fullmatch(name)]
+        except OSError:
+            return entries
+        for shard in shards:
+            root = os.path.join(self.cache_dir, shard)
+            try:
+                names = os.listdir(root)
+            except OSError:
+                continue
+            for name in names:
+                if name.endswith(self.ENTRY_SUFFIXES):
+                    path = os.path.join(root, name)
+                    try:
+                        st = os.stat(path)
+                        entries.append((st.st_mtime, st.st_size, path))
+                    except OSError:
+                        continue
+        return entries
+
+    def _remove(self, path: str) -> None:
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            return
+        with self._lock:
+            if self._total_bytes is not None:
+                self._total_bytes -= size
+
+    def evict(self) -> None:
+        """Drops expired entries, then least recently used ones until under max_bytes."""
+        with self._lock:
+            if self._total_bytes is not None and self._total_bytes <= self.max_bytes:
+                return
+        entries = self._entries()
+        now = time.time()
+        total = 0
+        live = []
+        for mtime, size, path in entries:
+            if now - mtime > self.max_age_seconds:
+                self._remove(path)
+            else:
+                live.append((mtime, size, path))
+                total += size
+        live.sort()
+        for mtime, size, path in live:
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+        with self._lock:
+            self._total_bytes = total
+
+    def clear(self) -> None:
+        """Removes every cached entry."""
+        for _, _, path in self._entries():
+            self._remove(path)
+        with self._lock:
+            self._total_bytes = 0
+
+    def stats(self) -> dict:
+        """Returns hit/miss counters for the current process."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / total) if total else 0.0,
+                "enabled": self.enabled,
+            }
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """Returns the process-wide response cache."""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ResponseCache()
+        return _default_cache
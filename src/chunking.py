@@ -0,0 +1,163 @@
+import json
+import re
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Union
+
+@lru_cache(maxsize=4)
+def _get_encoding(model: str):
+    try:
+        import tiktoken
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        # tiktoken downloads its BPE files on first use; offline we fall back to an estimate
+        print(f"tiktoken unavailable, estimating token counts: {e}")
+        return None
+
+def count_tokens(text: str, model: str = "gpt-4o") -> int:
+    """Counts tokens with tiktoken (falls back to ~4 characters per token if the encoding is unavailable)."""
+    encoding = _get_encoding(model)
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+def split_pages(text: Union[str, List[str]]) -> List[str]:
+    """Returns the report as a list of pages (form feeds mark page breaks in extracted text)."""
+    if isinstance(text, (list, tuple)):
+        return [p for p in text if p and p.strip()]
+    if "\f" in text:
+        return [p for p in text.split("\f") if p.strip()]
+    return [text] if text.strip() else []
+
+def _split_oversized(text: str, max_tokens: int, model: str) -> List[str]:
+    """Splits a single page that is over budget on section/paragraph/line boundaries."""
+    pieces = []
+    current = ""
+    for line in re.split(r"(?<=\n)", text):
+        if count_tokens(line, model) > max_tokens:
+            # Pathological single line: hard split by characters
+            step = max(1, max_tokens * 3)
+            parts = [line[i:i + step] for i in range(0, len(line), step)]
+        else:
+            parts = [line]
+        for part in parts:
+            if current and count_tokens(current + part, model) > max_tokens:
+                pieces.append(current)
+                current = ""
+            current += part
+    if current.strip():
+        pieces.append(current)
+    return pieces
+
+def chunk_pages(pages: List[str], max_tokens: int, model: str = "gpt-4o") -> List[str]:
+    """
+    Packs consecutive pages into chunks of at most max_tokens (real token counts),
+    never splitting a page unless the page alone exceeds the budget.
+    """
+    chunks = []
+    current, current_tokens = [], 0
+    for page in pages:
+        tokens = count_tokens(page, model)
+        if tokens > max_tokens:
+            if current:
+                chunks.append("\n".join(current))
+                current, current_tokens = [], 0
+            chunks.extend(_split_oversized(page, max_tokens, model))
+            continue
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append("\n".join(current))
+            current, current_tokens = [], 0
+        current.append(page)
+        current_tokens += tokens
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+def parse_json_response(text: str) -> Optional[Dict[str, Any]]:
+    """Extracts the JSON object from a model response (tolerates ```json fences and surrounding prose)."""
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end <= start:
+        return None
+    try:
+        data = json.loads(text[start:end + 1])
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+_PLACEHOLDERS = {"", "not available", "n/a", "na", "none", "unknown", "dd.mm.yyyy", "name", "id or 'not available'"}
+
+def _is_placeholder(value) -> bool:
+    return value is None or (isinstance(value, str) and value.strip().lower() in _PLACEHOLDERS)
+
+def _norm(value) -> str:
+    return re.sub(r"\W+", " ", str(value)).strip().lower()
+
+def _unique(items) -> list:
+    seen, out = set(), []
+    for item in items:
+        if _is_placeholder(item):
+            continue
+        key = _norm(item)
+        if key not in seen:
+            seen.add(key)
+            out.append(item)
+    return out
+
+def merge_analyses(partials: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Merges the partial JSON results of several chunks into one analysis:
+    header fields and severity take the first real value, observations are deduplicated
+    by (Area, Issue), list sections are deduplicated, free-text sections are concatenated.
+    """
+    merged = {
+        "report_header": {},
+        "issue_summary": "",
+        "observations": [],
+        "root_causes": [],
+        "severity_assessment": {},
+        "recommended_actions": [],
+        "additional_notes": "",
+        "missing_info": "",
+    }
+    observations = {}
+    summaries, root_causes, actions, notes, missing = [], [], [], [], []
+
+    for part in partials:
+        for key, value in (part.get("report_header") or {}).items():
+            if _is_placeholder(merged["report_header"].get(key)) and not _is_placeholder(value):
+                merged["report_header"][key] = value
+            merged["report_header"].setdefault(key, value)
+
+        for obs in part.get("observations") or []:
+            if not isinstance(obs, dict):
+                continue
+            key = (_norm(obs.get("Area", "")), _norm(obs.get("Issue", "")))
+            if key in observations:
+                # Keep the first occurrence but fill in fields other chunks found (e.g. the thermal delta)
+                for field, value in obs.items():
+                    if _is_placeholder(observations[key].get(field)) and not _is_placeholder(value):
+                        observations[key][field] = value
+            else:
+                observations[key] = dict(obs)
+
+        severity = part.get("severity_assessment") or {}
+        if isinstance(severity, dict) and _is_placeholder(merged["severity_assessment"].get("score")) and not _is_placeholder(severity.get("score")):
+            merged["severity_assessment"] = severity
+
+        summaries.append(part.get("issue_summary"))
+        root_causes.extend(part.get("root_causes") or [])
+        actions.extend(part.get("recommended_actions") or [])
+        notes.append(part.get("additional_notes"))
+        missing.append(part.get("missing_info"))
+
+    merged["observations"] = list(observations.values())
+    merged["issue_summary"] = " ".join(_unique(summaries))
+    merged["root_causes"] = _unique(root_causes)
+    merged["recommended_actions"] = _unique(actions)
+    merged["additional_notes"] = " ".join(_unique(notes))
+    merged["missing_info"] = " ".join(_unique(missing))
+    if not merged["severity_assessment"]:
+        merged["severity_assessment"] = {"score": "Not Available", "scale": "Not Available", "reasoning": ""}
+    return merged
@@ -0,0 +1,144 @@
+import hashlib
+import importlib.util
+import os
+import threading
+import weakref
+from dataclasses import dataclass, field
+
+def http2_available() -> bool:
+    """HTTP/2 needs the optional `h2` package (pip install httpx[http2])."""
+    return importlib.util.find_spec("h2") is not None
+
+def _http2_default() -> bool:
+    setting = os.getenv("DDR_HTTP2", "auto").lower()
+    if setting in ("0", "false", "no"):
+        return False
+    return http2_available()
+
+@dataclass
+class PoolConfig:
+    """Connection pool of the shared OpenAI HTTP clients (defaults from DDR_HTTP_* env vars)."""
+    max_connections: int = field(default_factory=lambda: int(os.getenv("DDR_HTTP_MAX_CONNECTIONS", "100")))
+    max_keepalive_connections: int = field(default_factory=lambda: int(os.getenv("DDR_HTTP_MAX_KEEPALIVE", "20")))
+    keepalive_expiry: float = field(default_factory=lambda: float(os.getenv("DDR_HTTP_KEEPALIVE_EXPIRY", "60")))
+    http2: bool = field(default_factory=_http2_default)
+
+    def limits(self):
+        import httpx
+
+        return httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_keepalive_connections,
+                            keepalive_expiry=self.keepalive_expiry)
+
+def _loop_local_transport(config: PoolConfig):
+    """
+    An async transport with one connection pool per event loop. Async connections cannot outlive
+    the loop they were opened on, and every report runs in its own asyncio.run(), so a single
+    shared pool would hand out dead connections; this keeps one client object for all of them.
+    """
+    import asyncio
+    import httpx
+
+    class LoopLocalTransport(httpx.AsyncBaseTransport):
+        def __init__(self):
+            self._pools = weakref.WeakKeyDictionary()
+            self._lock = threading.Lock()
+
+        def _pool(self):
+            loop = asyncio.get_running_loop()
+            with self._lock:
+                pool = self._pools.get(loop)
+                if pool is None:
+                    pool = self._pools[loop] = httpx.AsyncHTTPTransport(http2=config.http2, limits=config.limits())
+                return pool
+
+        async def handle_async_request(self, request):
+            return await self._pool().handle_async_request(request)
+
+        async def aclose(self):
+            pool = self._pools.pop(asyncio.get_running_loop(), None)
+            if pool is not None:
+                await pool.aclose()
+
+    return LoopLocalTransport()
+
+class ClientRegistry:
+    """
+    Process-wide ChatOpenAI clients, one per (API key, model, temperature), all sharing one
+    pooled HTTP transport (keep-alive, HTTP/2 when available). Thread-safe, so Streamlit
+    sessions and batch workers reuse the same connections instead of a TLS handshake per report.
+    """
+
+    def __init__(self, config: PoolConfig = None):
+        self.config = config or PoolConfig()
+        self._lock = threading.Lock()
+        self._models = {}
+        self._http_client = None
+        self._http_async_client = None
+
+    def _http_clients(self):
+        if self._http_client is None:
+            import httpx
+
+            self._http_client = httpx.Client(http2=self.config.http2, limits=self.config.limits())
+            self._http_async_client = httpx.AsyncClient(transport=_loop_local_transport(self.config))
+        return self._http_client, self._http_async_client
+
+    def chat_model(self, api_key: str, model: str = "gpt-4o", temperature: float = 0):
+        """The shared ChatOpenAI client for this key and model (created on first use)."""
+        # The key itself is not kept as a dict key
+        key = (hashlib.sha256((api_key or "").encode("utf-8")).hexdigest(), model, temperature)
+        with self._lock:
+            llm = self._models.get(key)
+            if llm is None:
+                # langchain_openai (and openai) take about a second to import; load them with the first client
+                from langchain_openai import ChatOpenAI
+
+                http_client, http_async_client = self._http_clients()
+                # Retries are done per request by the shared scheduler; the headers feed its rate-limit budgets
+                llm = self._models[key] = ChatOpenAI(
+                    temperature=temperature, openai_api_key=api_key, model_name=model, max_retries=0,
+                    include_response_headers=True, stream_usage=True,
+                    http_client=http_client, http_async_client=http_async_client)
+            return llm
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"clients": len(self._models), "http2": self.config.http2,
+                    "max_connections": self.config.max_connections,
+                    "max_keepalive_connections": self.config.max_keepalive_connections}
+
+    def close(self) -> None:
+        """Drops the clients and closes the pooled sync connections."""
+        with self._lock:
+            self._models.clear()
+            if self._http_client is not None:
+                self._http_client.close()
+            self._http_client = self._http_async_client = None
+
+_registry = None
+_registry_lock = threading.Lock()
+
+def get_client_registry() -> ClientRegistry:
+    """The process-wide client registry (pool settings from the DDR_HTTP_* env vars)."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ClientRegistry()
+        return _registry
+
+def configure_client_pool(max_connections: int = None, max_keepalive_connections: int = None,
+                          keepalive_expiry: float = None, http2: bool = None) -> ClientRegistry:
+    """Replaces the process-wide registry with new pool settings (unset values keep their env defaults)."""
+    global _registry
+    config = PoolConfig()
+    for name, value in (("max_connections", max_connections), ("max_keepalive_connections", max_keepalive_connections),
+                        ("keepalive_expiry", keepalive_expiry), ("http2", http2)):
+        if value is not None:
+            setattr(config, name, value)
+    if config.http2 and not http2_available():
+        raise ValueError("HTTP/2 requires the h2 package (pip install httpx[http2])")
+    with _registry_lock:
+        old, _registry = _registry, ClientRegistry(config)
+    if old is not None:
+        old.close()
+    return _registry
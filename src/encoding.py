@@ -0,0 +1,128 @@
+import base64
+import io
+import math
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+from PIL import Image
+from src.ingestion import PdfImage, as_pil_image
+
+# GPT-4o image token accounting
+LOW_DETAIL_TOKENS = 85
+TILE_TOKENS = 170
+TILE_SIZE = 512
+
+@dataclass
+class EncodingConfig:
+    """Controls how images are prepared for Vision requests."""
+    format: str = "JPEG"  # "JPEG", "WEBP" or "PNG"
+    quality: int = 85
+    detail: str = "auto"  # "low", "high" or "auto" (low for small images, high otherwise)
+    max_side: int = 2048  # the model fits images into 2048x2048 ...
+    short_side: int = 768  # ... and then scales the shortest side down to 768
+    low_detail_max_side: int = 512
+    max_image_tokens: Optional[int] = None  # token cap for all images of one request
+
+def _high_detail_size(width: int, height: int, config: EncodingConfig) -> Tuple[int, int]:
+    """The resolution the model actually looks at in high detail mode."""
+    scale = min(1.0, config.max_side / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, config.short_side / min(width, height))
+    return max(1, int(width * scale)), max(1, int(height * scale))
+
+def _low_detail_size(width: int, height: int, config: EncodingConfig) -> Tuple[int, int]:
+    scale = min(1.0, config.low_detail_max_side / max(width, height))
+    return max(1, int(width * scale)), max(1, int(height * scale))
+
+def estimate_image_tokens(width: int, height: int, detail: str = "high", config: EncodingConfig = None) -> int:
+    """Estimated input tokens for one image at the given detail level."""
+    if detail == "low":
+        return LOW_DETAIL_TOKENS
+    width, height = _high_detail_size(width, height, config or EncodingConfig())
+    tiles = math.ceil(width / TILE_SIZE) * math.ceil(height / TILE_SIZE)
+    return TILE_TOKENS * tiles + LOW_DETAIL_TOKENS
+
+def choose_detail(width: int, height: int, config: EncodingConfig) -> str:
+    """Picks the detail level for an image: small images gain nothing from high detail."""
+    if config.detail in ("low", "high"):
+        return config.detail
+    return "low" if max(width, height) <= config.low_detail_max_side else "high"
+
+def encode_image(img, config: EncodingConfig = None, detail: str = None) -> Dict[str, Any]:
+    """
+    Downscales an image to the model's effective resolution and re-encodes it.
+    Returns {"url": data URL, "detail", "tokens", "bytes", "width", "height"}.
+    Embedded RGB / grayscale JPEG streams that are already small enough are passed through without
+    decoding; CMYK / YCCK ones are re-encoded, as most clients cannot show them.
+    """
+    config = config or EncodingConfig()
+    width, height = img.size
+    detail = detail or choose_detail(width, height, config)
+    if detail == "low":
+        target = _low_detail_size(width, height, config)
+    else:
+        target = _high_detail_size(width, height, config)
+
+    if (isinstance(img, PdfImage) and img.format == "JPEG" and img.mode in ("RGB", "L")
+            and target == (width, height) and config.format == "JPEG"):
+        data, mime = img.data, "jpeg"
+    else:
+        pil = as_pil_image(img)
+        if pil.size != target:
+            pil = pil.resize(target, Image.LANCZOS)
+        fmt = config.format.upper()
+        if fmt in ("JPEG", "WEBP") and pil.mode not in ("RGB", "L"):
+            pil = pil.convert("RGB")
+        buffered = io.BytesIO()
+        if fmt == "PNG":
+            pil.save(buffered, format="PNG", optimize=True)
+        else:
+            pil.save(buffered, format=fmt, quality=config.quality)
+        data, mime = buffered.getvalue(), fmt.lower()
+
+    return {
+        "url": f"data:image/{mime};base64,{base64.b64encode(data).decode('utf-8')}",
+        "detail": detail,
+        "tokens": estimate_image_tokens(target[0], target[1], detail, config),
+        "bytes": len(data),
+        "width": target[0],
+        "height": target[1],
+    }
+
+def plan_details(sizes: List[Tuple[int, int]], config: EncodingConfig) -> List[Optional[str]]:
+    """
+    Chooses a detail level per image so the request stays within config.max_image_tokens.
+    Largest images are downgraded to low detail first; if even that is over budget,
+    trailing images get None (not sent).
+    """
+    details = [choose_detail(w, h, config) for w, h in sizes]
+    if config.max_image_tokens is None:
+        return details
+
+    def total():
+        return sum(estimate_image_tokens(w, h, d, config) for (w, h), d in zip(sizes, details) if d)
+
+    by_cost = sorted(range(len(sizes)), key=lambda i: estimate_image_tokens(*sizes[i], "high", config), reverse=True)
+    for i in by_cost:
+        if total() <= config.max_image_tokens:
+            break
+        details[i] = "low"
+    for i in reversed(range(len(details))):
+        if total() <= config.max_image_tokens:
+            break
+        details[i] = None
+    return details
+
+def next_detail(width: int, height: int, config: EncodingConfig, spent_tokens: int) -> Optional[str]:
+    """
+    Streaming counterpart of plan_details for when images arrive one at a time:
+    picks the detail level for the next image given the tokens already spent,
+    falling back to low detail and then to None (not sent) when over config.max_image_tokens.
+    """
+    detail = choose_detail(width, height, config)
+    if config.max_image_tokens is None:
+        return detail
+    if spent_tokens + estimate_image_tokens(width, height, detail, config) <= config.max_image_tokens:
+        return detail
+    if spent_tokens + LOW_DETAIL_TOKENS <= config.max_image_tokens:
+        return "low"
+    return None
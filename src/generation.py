@@ -1,38 +1,329 @@
 
+import hashlib
+import html
 import io
-import markdown
+import multiprocessing
+import os
 import re
-from xhtml2pdf import pisa
-from docx import Document
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
+from src.schema import NOT_AVAILABLE, DDRAnalysis, parse_analysis
+from src.tracing import bind_context, span
+
+_TEMPLATE_SECTION_RE = re.compile(r'^##\s+(\d+)\.')
+_TEMPLATE_FIELD_RE = re.compile(r'^\*\*(.+?):\*\*\s*Not Available(\s*)$')
+
+def _is_missing(value) -> bool:
+    return not value or str(value).strip().lower() in ("not available", "n/a", "none", "unknown")
+
+def _or_not_available(value) -> str:
+    return NOT_AVAILABLE if _is_missing(value) else str(value).strip()
+
+def _render_sections(analysis: DDRAnalysis, image_observations: list) -> dict:
+    """Markdown body of each numbered template section."""
+    observations = []
+    for obs in analysis.observations:
+        line = f"- **{_or_not_available(obs.Area)}:** {obs.Issue.strip()}"
+        if not _is_missing(obs.Thermal_Delta):
+            line += f", Thermal Delta: {obs.Thermal_Delta.strip()}"
+        observations.append(line)
+    usable_images = [str(o).strip() for o in image_observations if o and not str(o).startswith(("Error", "Note:"))]
+    if usable_images:
+        observations += ["", "**Image Observations:**"] + [f"- {' '.join(o.split())}" for o in usable_images]
+
+    severity = analysis.severity_assessment
+    assessment = " - ".join(part for part in (severity.scale, severity.reasoning) if not _is_missing(part))
+
+    missing = [analysis.missing_info.strip()] if not _is_missing(analysis.missing_info) else []
+    failed_images = sum(1 for o in image_observations if str(o).startswith("Error"))
+    if failed_images:
+        missing.append(f"{failed_images} image(s) could not be analyzed.")
+    missing += [str(o) for o in image_observations if str(o).startswith("Note:")]
+
+    return {
+        1: _or_not_available(analysis.issue_summary),
+        2: "\n".join(observations) or NOT_AVAILABLE,
+        3: "\n".join(f"- {cause}" for cause in analysis.root_causes) or NOT_AVAILABLE,
+        4: f"**Score:** {_or_not_available(severity.score)}  \n**Assessment:** {assessment or NOT_AVAILABLE}",
+        5: "\n".join(f"{i}. {action}" for i, action in enumerate(analysis.recommended_actions, 1)) or NOT_AVAILABLE,
+        6: _or_not_available(analysis.additional_notes),
+        7: " ".join(missing) or NOT_AVAILABLE,
+    }
+
+def render_report_markdown(analysis: DDRAnalysis, image_observations: list, template_style: str) -> str:
+    """
+    Fills the DDR template locally from the structured analysis (no LLM call).
+    "**Field:** Not Available" lines before the first section take header values, and the body of
+    each "## N." section is replaced by the rendered data; everything else in the template is kept.
+    """
+    header = analysis.report_header
+    fields = {
+        "date": header.Date,
+        "report id": header.Report_ID,
+        "inspected by": header.Inspected_By,
+    }
+    sections = _render_sections(analysis, image_observations)
+
+    lines = []
+    skipping = False
+    for line in template_style.split('\n'):
+        section = _TEMPLATE_SECTION_RE.match(line)
+        if section:
+            lines.append(line)
+            number = int(section.group(1))
+            skipping = number in sections
+            if skipping:
+                lines.append(sections[number])
+                lines.append("")
+            continue
+        if skipping:
+            # Drop the template's placeholder body up to the next section or rule
+            if not (line.startswith('#') or _HR_RE.match(line.strip())):
+                continue
+            skipping = False
+        field = _TEMPLATE_FIELD_RE.match(line)
+        if field and field.group(1).strip().lower() in fields:
+            line = f"**{field.group(1)}:** {_or_not_available(fields[field.group(1).strip().lower()])}{field.group(2)}"
+        lines.append(line)
+    return "\n".join(lines)
 
 def generate_ddr_markdown(structured_data: dict, template_style: str) -> str:
     """
     Formats the structured data into the final Markdown report.
+    structured_data is either {'report_content': markdown} (already written, e.g. by the LLM; its
+    formatting glitches are repaired here) or the analysis result ('text_analysis' JSON + 'image_analysis'),
+    rendered locally into template_style.
+    """
+    if 'report_content' in structured_data:
+        report = structured_data.get('report_content')
+        return normalize_markdown(report) if report else "Error: No report content generated."
+    text_analysis = structured_data.get('text_analysis') or ""
+    if text_analysis.startswith("Error"):
+        return text_analysis
+    analysis = parse_analysis(text_analysis)
+    if analysis is None:
+        # Free-text response: keep it rather than lose it
+        analysis = DDRAnalysis(additional_notes=text_analysis.strip())
+    return render_report_markdown(analysis, structured_data.get('image_analysis') or [], template_style)
+
+# Fixes for common LLM formatting glitches, compiled once
+_MARKDOWN_FIXES = [
+    # 1. Remove redundant empty headers like #\n# or # # (a '## ' marker is kept as it is)
+    (re.compile(r'(?m)^#[ \t]*\n(?=#)'), r''),
+    (re.compile(r'[ \t]+#[ \t]*(?=\n#)'), r''),
+    (re.compile(r'(?m)^(#{1,3})[ \t]+#{1,3}(?=[ \t])'), r'\1'),
+    # 2. Put headers merged into the previous line on their own line (never inside a '##' marker)
+    (re.compile(r'([^\n#])(#{1,3}[ \t])'), r'\1\n\n\2'),
+    # 3. Fix merged bullet points (e.g. text- **Area**), leaving '---' rules alone
+    (re.compile(r'([^\n-])(-[ \t]\*\*)'), r'\1\n\2'),
+    # 4. Fix headers merged with previous headers (e.g. # Header## SubHeader)
+    (re.compile(r'(#[^#\n]+)(#{1,3}[ \t])'), r'\1\n\n\2'),
+]
+
+_HEADING_RE = re.compile(r'^(#{1,6})\s+(.*?)\s*#*\s*$')
+_HR_RE = re.compile(r'^(?:(?:\*\s*){3,}|(?:-\s*){3,}|(?:_\s*){3,})$')
+_LIST_ITEM_RE = re.compile(r'^(\s*)([-*+]|\d+[.)])\s+(.*)$')
+_TABLE_SEPARATOR_RE = re.compile(r'^\|?\s*:?-+:?\s*(\|\s*:?-+:?\s*)*\|?$')
+_INLINE_RE = re.compile(r'(\*\*|__)(.+?)\1(?!\*)|(?<![\w*])\*(?![\s*])(.+?)(?<![\s*])\*(?!\*)|(?<!\w)_(?![\s_])(.+?)(?<![\s_])_(?!\w)|`([^`]+)`')
+
+def normalize_markdown(markdown_content: str) -> str:
+    """
+    Repairs merged headers/bullets and duplicate '#' markers produced by the LLM.
+    Only for text the LLM wrote freely; reports rendered from the template are already well-formed.
+    """
+    processed = markdown_content
+    for pattern, replacement in _MARKDOWN_FIXES:
+        processed = pattern.sub(replacement, processed)
+    return processed
+
+def parse_inlines(text: str, bold: bool = False, italic: bool = False) -> list:
+    """Splits text into runs: list of (text, bold, italic, code) tuples."""
+    runs = []
+    pos = 0
+    for match in _INLINE_RE.finditer(text):
+        if match.start() > pos:
+            runs.append((text[pos:match.start()], bold, italic, False))
+        if match.group(2) is not None:
+            runs.extend(parse_inlines(match.group(2), True, italic))
+        elif match.group(3) is not None or match.group(4) is not None:
+            runs.extend(parse_inlines(match.group(3) or match.group(4), bold, True))
+        else:
+            runs.append((match.group(5), bold, italic, True))
+        pos = match.end()
+    if pos < len(text):
+        runs.append((text[pos:], bold, italic, False))
+    return runs
+
+def _split_table_row(line: str) -> list:
+    line = line.strip()
+    if line.startswith('|'):
+        line = line[1:]
+    if line.endswith('|'):
+        line = line[:-1]
+    return [parse_inlines(cell.strip()) for cell in line.split('|')]
+
+def _parse_blocks(text: str) -> list:
+    """Single pass over the (normalized) lines, producing the block tree."""
+    blocks = []
+    lines = text.split('\n')
+    paragraph = None
+    list_stack = []  # [(indent, list block)]
+    i = 0
+
+    def close_lists():
+        list_stack.clear()
+
+    while i < len(lines):
+        raw = lines[i].rstrip()
+        stripped = raw.strip()
+
+        if not stripped:
+            paragraph = None
+            # A blank line ends a list unless the next non-blank line continues it
+            j = i + 1
+            while j < len(lines) and not lines[j].strip():
+                j += 1
+            if j >= len(lines) or not _LIST_ITEM_RE.match(lines[j]):
+                close_lists()
+            i += 1
+            continue
+
+        if stripped.startswith('```'):
+            paragraph = None
+            close_lists()
+            code_lines = []
+            i += 1
+            while i < len(lines) and not lines[i].strip().startswith('```'):
+                code_lines.append(lines[i])
+                i += 1
+            blocks.append({"type": "code", "text": "\n".join(code_lines)})
+            i += 1
+            continue
+
+        heading = _HEADING_RE.match(stripped)
+        if heading:
+            paragraph = None
+            close_lists()
+            if heading.group(2):
+                blocks.append({"type": "heading", "level": len(heading.group(1)), "inlines": parse_inlines(heading.group(2))})
+            i += 1
+            continue
+
+        if _HR_RE.match(stripped):
+            paragraph = None
+            close_lists()
+            blocks.append({"type": "hr"})
+            i += 1
+            continue
+
+        if stripped.startswith('|') and i + 1 < len(lines) and _TABLE_SEPARATOR_RE.match(lines[i + 1].strip()):
+            paragraph = None
+            close_lists()
+            table = {"type": "table", "header": _split_table_row(stripped), "rows": []}
+            i += 2
+            while i < len(lines) and lines[i].strip().startswith('|'):
+                table["rows"].append(_split_table_row(lines[i]))
+                i += 1
+            blocks.append(table)
+            continue
+
+        item = _LIST_ITEM_RE.match(raw)
+        if item:
+            paragraph = None
+            indent = len(item.group(1).expandtabs(4))
+            ordered = item.group(2)[0].isdigit()
+            while list_stack and list_stack[-1][0] > indent:
+                list_stack.pop()
+            if list_stack and list_stack[-1][0] == indent and list_stack[-1][1]["ordered"] != ordered:
+                list_stack.pop()
+            if not list_stack or list_stack[-1][0] < indent:
+                new_list = {"type": "list", "ordered": ordered, "items": []}
+                if list_stack and list_stack[-1][1]["items"]:
+                    # Nested list: attach to the last item of the parent list
+                    list_stack[-1][1]["items"][-1]["children"].append(new_list)
+                else:
+                    blocks.append(new_list)
+                list_stack.append((indent, new_list))
+            list_stack[-1][1]["items"].append({"inlines": parse_inlines(item.group(3).strip()), "children": []})
+            i += 1
+            continue
+
+        if list_stack:
+            # Continuation line of the last list item
+            last_item = list_stack[-1][1]["items"][-1]
+            last_item["inlines"] = last_item["inlines"] + [(" ", False, False, False)] + parse_inlines(stripped)
+            i += 1
+            continue
+
+        if paragraph is None:
+            paragraph = {"type": "paragraph", "lines": []}
+            blocks.append(paragraph)
+        paragraph["lines"].append(parse_inlines(stripped))
+        i += 1
+
+    return blocks
+
+@lru_cache(maxsize=8)
+def build_document(markdown_content: str) -> tuple:
+    """
+    Parses the markdown once into a document tree shared by all renderers.
+    Blocks are dicts: heading (level, inlines), paragraph (lines of inlines), list (ordered, items with
+    inlines and nested children lists), table (header, rows), code (text) and hr.
+    Inlines are (text, bold, italic, code) runs. Cached, so the PDF and DOCX renders parse only once.
     """
-    return structured_data.get('report_content', "Error: No report content generated.")
+    return tuple(_parse_blocks(markdown_content))
+
+def _inlines_to_html(runs: list) -> str:
+    parts = []
+    for text, bold, italic, code in runs:
+        text = html.escape(text, quote=False)
+        if code:
+            text = f"<code>{text}</code>"
+        if italic:
+            text = f"<em>{text}</em>"
+        if bold:
+            text = f"<strong>{text}</strong>"
+        parts.append(text)
+    return "".join(parts)
+
+def _list_to_html(block: dict) -> str:
+    tag = "ol" if block["ordered"] else "ul"
+    items = []
+    for item in block["items"]:
+        children = "".join(_list_to_html(child) for child in item["children"])
+        items.append(f"<li>{_inlines_to_html(item['inlines'])}{children}</li>")
+    return f"<{tag}>{''.join(items)}</{tag}>"
+
+def render_html(blocks) -> str:
+    """Renders the document tree to an HTML fragment."""
+    parts = []
+    for block in blocks:
+        kind = block["type"]
+        if kind == "heading":
+            parts.append(f"<h{block['level']}>{_inlines_to_html(block['inlines'])}</h{block['level']}>")
+        elif kind == "paragraph":
+            parts.append("<p>" + "<br />\n".join(_inlines_to_html(line) for line in block["lines"]) + "</p>")
+        elif kind == "list":
+            parts.append(_list_to_html(block))
+        elif kind == "table":
+            header = "".join(f"<th>{_inlines_to_html(cell)}</th>" for cell in block["header"])
+            rows = "".join("<tr>" + "".join(f"<td>{_inlines_to_html(cell)}</td>" for cell in row) + "</tr>" for row in block["rows"])
+            parts.append(f"<table><thead><tr>{header}</tr></thead><tbody>{rows}</tbody></table>")
+        elif kind == "code":
+            parts.append(f"<pre><code>{html.escape(block['text'], quote=False)}</code></pre>")
+        elif kind == "hr":
+            parts.append("<hr />")
+    return "\n".join(parts)
 
 def generate_pdf(markdown_content: str) -> bytes:
     """
     Converts Markdown content to PDF bytes using xhtml2pdf.
     Uses CSS for professional layout and alignment.
     """
-    processed = re.sub(r'([^\n])(#{1,3}\s)', r'\1\n\n\2', markdown_content)
-    
-    # 2. Fix merged bullet points (e.g. text- **Area**)
-    processed = re.sub(r'([^\n])(-\s\*\*)', r'\1\n\2', processed)
-    
-    # 3. Remove redundant empty headers like #\n# or # #
-    processed = re.sub(r'(^|\n)#\s*\n#', r'\1#', processed)
-    processed = re.sub(r'#\s*#', r'#', processed)
-    
-    # 4. Fix headers merged with previous headers (e.g. # Header## SubHeader)
-    processed = re.sub(r'(#[^#\n]+)(#{1,3}\s)', r'\1\n\n\2', processed)
-
-    # Convert Markdown to HTML
-    html_content = markdown.markdown(
-        processed, 
-        extensions=['extra', 'nl2br', 'sane_lists']
-    )
+    # Convert Markdown to HTML via the shared document tree
+    html_content = render_html(build_document(markdown_content))
     
     # Define CSS for professional alignment and styling
     css = """
@@ -55,6 +346,10 @@ def generate_pdf(markdown_content: str) -> bytes:
     li { margin-bottom: 4pt; }
     hr { border: 0.5pt solid #ccc; margin: 15pt 0; }
     b, strong { color: #000; font-weight: bold; }
+    table { border: 0.5pt solid #ccc; margin-bottom: 10pt; }
+    th, td { padding: 3pt; text-align: left; }
+    th { background-color: #f0f0f0; }
+    pre { font-size: 8pt; }
     """
     
     # Wrap HTML in a full document structure
@@ -72,62 +367,147 @@ def generate_pdf(markdown_content: str) -> bytes:
     """
     
     buffer = io.BytesIO()
-    try:
-        # Create PDF
-        pisa_status = pisa.CreatePDF(
-            full_html,
-            dest=buffer
-        )
-        
-        if pisa_status.err:
-            print(f"PDF Generation Error (pisa): {pisa_status.err}")
-            return b""
+    with span("generation.pdf") as pdf_span:
+        try:
+            # xhtml2pdf pulls in reportlab & co.; it is only loaded once a PDF is rendered
+            from xhtml2pdf import pisa
+
+            pisa_status = pisa.CreatePDF(
+                full_html,
+                dest=buffer
+            )
             
-        return buffer.getvalue()
-    except Exception as e:
-        print(f"PDF Generation Exception: {e}")
-        return b""
+            if pisa_status.err:
+                print(f"PDF Generation Error (pisa): {pisa_status.err}")
+                pdf_span.fail(f"pisa: {pisa_status.err}")
+                return b""
+                
+            pdf_span.set(bytes=buffer.tell())
+            return buffer.getvalue()
+        except Exception as e:
+            print(f"PDF Generation Exception: {e}")
+            pdf_span.fail(e)
+            return b""
+
+def _add_runs(paragraph, runs: list) -> None:
+    for text, bold, italic, code in runs:
+        run = paragraph.add_run(text)
+        if bold:
+            run.bold = True
+        if italic:
+            run.italic = True
+        if code:
+            run.font.name = "Courier New"
+
+class _DocxStyles:
+    """Resolves style names to ids once; python-docx scans every style on each by-name lookup."""
+
+    def __init__(self, doc):
+        self.doc = doc
+        self._ids = {}
+
+    def paragraph(self, name: str):
+        if name not in self._ids:
+            self._ids[name] = self.doc.styles[name].style_id
+        paragraph = self.doc.add_paragraph()
+        paragraph._p.style = self._ids[name]
+        return paragraph
+
+def _add_docx_list(styles: _DocxStyles, block: dict, level: int = 1) -> None:
+    base = "List Number" if block["ordered"] else "List Bullet"
+    # The default template has "List Bullet", "List Bullet 2", "List Bullet 3" (same for numbers)
+    style = base if level == 1 else f"{base} {min(level, 3)}"
+    for item in block["items"]:
+        _add_runs(styles.paragraph(style), item["inlines"])
+        for child in item["children"]:
+            _add_docx_list(styles, child, level + 1)
+
+def render_docx(blocks):
+    """Renders the document tree into a python-docx Document."""
+    from docx import Document
+
+    doc = Document()
+    styles = _DocxStyles(doc)
+    for block in blocks:
+        kind = block["type"]
+        if kind == "heading":
+            _add_runs(styles.paragraph(f"Heading {min(block['level'], 9)}"), block["inlines"])
+        elif kind == "paragraph":
+            paragraph = doc.add_paragraph()
+            for n, line in enumerate(block["lines"]):
+                if n:
+                    paragraph.add_run().add_break()
+                _add_runs(paragraph, line)
+        elif kind == "list":
+            _add_docx_list(styles, block)
+        elif kind == "table":
+            columns = max([len(block["header"])] + [len(row) for row in block["rows"]])
+            table = doc.add_table(rows=1 + len(block["rows"]), cols=columns)
+            table.style = "Table Grid"
+            for r, row in enumerate([block["header"]] + block["rows"]):
+                for c, cell in enumerate(row[:columns]):
+                    paragraph = table.cell(r, c).paragraphs[0]
+                    _add_runs(paragraph, [(t, b or r == 0, i, code) for t, b, i, code in cell])
+        elif kind == "code":
+            _add_runs(doc.add_paragraph(), [(block["text"], False, False, True)])
+        elif kind == "hr":
+            doc.add_paragraph("_" * 40)
+    return doc
 
 def generate_docx(markdown_content: str) -> bytes:
     """
     Converts Markdown content to a Word Document (bytes).
-    Uses a simple custom parser to map Markdown syntax to Word styles.
+    Uses the same document tree as the PDF, so inline bold/italic, nested lists and tables carry over.
     """
-    doc = Document()
-    
-    # Basic Markdown parsing
-    lines = markdown_content.split('\n')
-    
-    for line in lines:
-        line = line.strip()
-        if not line:
-            continue
-            
-        if line.startswith('# '):
-            # Heading 1
-            doc.add_heading(line[2:], level=1)
-        elif line.startswith('## '):
-            # Heading 2
-            doc.add_heading(line[3:], level=2)
-        elif line.startswith('### '):
-            # Heading 3
-            doc.add_heading(line[4:], level=3)
-        elif line.startswith('- ') or line.startswith('* '):
-            # List item
-            doc.add_paragraph(line[2:], style='List Bullet')
-        elif line.startswith('1. '):
-            # Numbered list (simple check)
-            doc.add_paragraph(line[3:], style='List Number')
-        elif line.startswith('**') and line.endswith('**'):
-            # Bold paragraph
-            p = doc.add_paragraph()
-            p.add_run(line[2:-2]).bold = True
-        else:
-            # Regular paragraph
-            doc.add_paragraph(line)
-            
-    # Save to buffer
-    docx_buffer = io.BytesIO()
-    doc.save(docx_buffer)
+    with span("generation.docx") as docx_span:
+        doc = render_docx(build_document(markdown_content))
+                
+        # Save to buffer
+        docx_buffer = io.BytesIO()
+        doc.save(docx_buffer)
+        docx_span.set(bytes=docx_buffer.tell())
     
     return docx_buffer.getvalue()
+
+EXPORT_RENDERERS = {"pdf": generate_pdf, "docx": generate_docx}
+
+# "thread" (default) or "process": a process pool renders PDF and DOCX truly in parallel
+RENDER_EXECUTOR = os.getenv("DDR_RENDER_EXECUTOR", "thread")
+RENDER_MEMO_SIZE = int(os.getenv("DDR_RENDER_MEMO_SIZE", "32"))
+
+_render_pool = None
+_render_memo = OrderedDict()
+_render_lock = threading.Lock()
+
+def _get_render_pool():
+    global _render_pool
+    if _render_pool is None:
+        if RENDER_EXECUTOR == "process":
+            _render_pool = ProcessPoolExecutor(max_workers=len(EXPORT_RENDERERS), mp_context=multiprocessing.get_context("spawn"))
+        else:
+            _render_pool = ThreadPoolExecutor(max_workers=len(EXPORT_RENDERERS), thread_name_prefix="ddr-render")
+    return _render_pool
+
+def render_export(markdown_content: str, fmt: str) -> Future:
+    """
+    Renders one export format ("pdf" or "docx") in the background and returns a Future with the bytes.
+    Results are memoized by markdown hash, so asking again (e.g. on a Streamlit rerun) returns the same
+    Future instead of rendering twice. Failed renders are not memoized.
+    """
+    key = (hashlib.sha256(markdown_content.encode("utf-8")).hexdigest(), fmt)
+    with _render_lock:
+        future = _render_memo.get(key)
+        if future is not None and not (future.done() and (future.exception() or not future.result())):
+            _render_memo.move_to_end(key)
+            return future
+        renderer = EXPORT_RENDERERS[fmt]
+        # Thread workers inherit the caller's trace run; process workers only report their own spans
+        future = _get_render_pool().submit(renderer if RENDER_EXECUTOR == "process" else bind_context(renderer), markdown_content)
+        _render_memo[key] = future
+        while len(_render_memo) > RENDER_MEMO_SIZE:
+            _render_memo.popitem(last=False)
+        return future
+
+def start_exports(markdown_content: str, formats=("pdf", "docx")) -> dict:
+    """Starts rendering all requested formats concurrently. Returns {fmt: Future}."""
+    return {fmt: render_export(markdown_content, fmt) for fmt in formats}
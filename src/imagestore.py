@@ -0,0 +1,127 @@
+import atexit
+import mmap
+import os
+import shutil
+import tempfile
+import threading
+import weakref
+from collections import OrderedDict, deque
+from typing import Optional
+from PIL import Image
+
+DEFAULT_RESIDENT_BYTES = int(float(os.getenv("DDR_IMAGE_RESIDENT_MB", "128")) * 1024 * 1024)
+DEFAULT_SPILL_DIR = os.getenv("DDR_IMAGE_SPILL_DIR") or None
+
+class ImageStore:
+    """
+    Bounds the decoded pixels held in memory by lazily decoded images (src.ingestion.LazyImage).
+
+    Decoded images are admitted in least-recently-used order; once their total size exceeds
+    max_resident_bytes, the oldest are released and decoded again on their next use (from the
+    compressed PDF stream / upload bytes, or from a memory-mapped spill file). Images that exist only
+    as pixels (page renders) are spilled to disk right away, so they never count against memory.
+
+    Images that are garbage collected are only queued by their weakref callback and dropped on the
+    next call: the callback can run inside any allocation, including one made under the lock.
+    """
+
+    def __init__(self, max_resident_bytes: int = DEFAULT_RESIDENT_BYTES, spill_dir: Optional[str] = DEFAULT_SPILL_DIR):
+        self.max_resident_bytes = max_resident_bytes
+        self._spill_root = spill_dir
+        self._spill_dir = None
+        self._resident = OrderedDict()  # id(image) -> (weakref, nbytes)
+        self._collected = deque()  # ids of collected images, appended by the weakref callbacks
+        self._lock = threading.Lock()
+        self.resident_bytes = 0
+        self.peak_resident_bytes = 0
+        self.evictions = 0
+        self.spilled = 0
+
+    def admit(self, img, pil: Image.Image) -> None:
+        """Registers freshly decoded pixels of `img` and releases older images beyond the cap."""
+        nbytes = pil.width * pil.height * len(pil.getbands())
+        key = id(img)
+        victims = []
+        with self._lock:
+            self._drop_collected()
+            self._remove(key)
+            self._resident[key] = (weakref.ref(img, lambda _, key=key: self._collected.append(key)), nbytes)
+            self.resident_bytes += nbytes
+            self.peak_resident_bytes = max(self.peak_resident_bytes, self.resident_bytes)
+            # The image just admitted is in use and is never released here
+            while self.resident_bytes > self.max_resident_bytes and len(self._resident) > 1:
+                old_key, (ref, _) = next(iter(self._resident.items()))
+                self._remove(old_key)
+                self.evictions += 1
+                victims.append(ref())
+        for victim in victims:
+            if victim is not None:
+                victim.release()
+
+    def touch(self, img) -> None:
+        """Marks an image as recently used."""
+        with self._lock:
+            if id(img) in self._resident:
+                self._resident.move_to_end(id(img))
+
+    def _drop_collected(self) -> None:
+        """Removes the entries of collected images (called with the lock held)."""
+        while self._collected:
+            key = self._collected.popleft()
+            entry = self._resident.get(key)
+            # The id may already belong to a newly admitted image
+            if entry is not None and entry[0]() is None:
+                self._remove(key)
+
+    def _remove(self, key: int) -> None:
+        entry = self._resident.pop(key, None)
+        if entry is not None:
+            self.resident_bytes -= entry[1]
+
+    def _spill_path(self) -> str:
+        with self._lock:
+            if self._spill_dir is None:
+                self._spill_dir = tempfile.mkdtemp(prefix="ddr_spill_", dir=self._spill_root)
+                atexit.register(shutil.rmtree, self._spill_dir, True)
+            self.spilled += 1
+        fd, path = tempfile.mkstemp(suffix=".raw", dir=self._spill_dir)
+        os.close(fd)
+        return path
+
+    def spill(self, pil: Image.Image) -> str:
+        """Writes the raw pixels of an image to a spill file and returns its path."""
+        path = self._spill_path()
+        with open(path, "wb") as f:
+            f.write(pil.tobytes())
+        return path
+
+    @staticmethod
+    def load(path: str, mode: str, size) -> Image.Image:
+        """Reads a spilled image back through a memory map (no intermediate bytes copy)."""
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return Image.frombytes(mode, size, mapped)
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._drop_collected()
+            return {"resident_images": len(self._resident), "resident_bytes": self.resident_bytes,
+                    "peak_resident_bytes": self.peak_resident_bytes, "evictions": self.evictions, "spilled": self.spilled}
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_image_store() -> ImageStore:
+    """The process-wide image store (cap from DDR_IMAGE_RESIDENT_MB, spill files under DDR_IMAGE_SPILL_DIR)."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ImageStore()
+        return _store
+
+def configure_image_store(max_resident_mb: float = None, spill_dir: str = None) -> ImageStore:
+    """Replaces the process-wide image store, e.g. with a smaller cap for memory-limited batch workers."""
+    global _store
+    with _store_lock:
+        _store = ImageStore(int(max_resident_mb * 1024 * 1024) if max_resident_mb is not None else DEFAULT_RESIDENT_BYTES,
+                            spill_dir or DEFAULT_SPILL_DIR)
+        return _store
@@ -1,60 +1,509 @@
 
+import hashlib
 import io
-from typing import List, Union
-import pypdf
+import math
+import os
+import re
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List
 from PIL import Image
+from src.tracing import span
+
+def _input_size(file):
+    """Size in bytes of a path or in-memory file, for tracing (None if unknown)."""
+    try:
+        if isinstance(file, (str, os.PathLike)):
+            return os.path.getsize(file)
+        if hasattr(file, "getbuffer"):
+            return file.getbuffer().nbytes
+    except (OSError, ValueError):
+        pass
+    return None
 
 def load_pdf(file) -> str:
     """Extracts text from a PDF file-like object."""
+    with span("ingestion.load_pdf", bytes=_input_size(file)) as load_span:
+        try:
+            import pypdf
+
+            reader = pypdf.PdfReader(file)
+            text = ""
+            for page in reader.pages:
+                text += page.extract_text() + "\n"
+            load_span.set(pages=len(reader.pages))
+            return text
+        except Exception as e:
+            load_span.fail(e)
+            return f"Error reading PDF: {str(e)}"
+
+# Filters whose output is an encoded image file we can hand on unchanged
+_PASSTHROUGH_FILTERS = {"DCTDecode": "JPEG", "JPXDecode": "JPEG2000"}
+# Filters pdfminer can fully decode to raw pixel data
+_PIXEL_FILTERS = {"FlateDecode", "Fl", "LZWDecode", "LZW", "ASCII85Decode", "A85", "ASCIIHexDecode", "AHx", "RunLengthDecode", "RL"}
+_COLORSPACE_MODES = {"DeviceRGB": "RGB", "RGB": "RGB", "DeviceGray": "L", "G": "L", "DeviceCMYK": "CMYK", "CMYK": "CMYK"}
+_ICC_COMPONENT_MODES = {1: "L", 3: "RGB", 4: "CMYK"}
+
+def _literal_name(obj) -> str:
+    return getattr(obj, "name", obj) if not isinstance(obj, bytes) else obj.decode("latin-1")
+
+def _stream_color_mode(stream):
+    """Maps the stream's ColorSpace to a PIL mode, or None if it needs the rasterizer (Indexed, Separation, ...)."""
+    from pdfminer.pdftypes import resolve1
+
+    colorspace = resolve1(stream.get("ColorSpace"))
+    if isinstance(colorspace, list) and colorspace:
+        if _literal_name(resolve1(colorspace[0])) == "ICCBased" and len(colorspace) > 1:
+            icc = resolve1(colorspace[1])
+            return _ICC_COMPONENT_MODES.get(resolve1(icc.get("N")))
+        return None
+    return _COLORSPACE_MODES.get(_literal_name(colorspace))
+
+def _encoded_mode(data: bytes):
+    """PIL mode of an encoded image, read from its header only (None if unreadable)."""
     try:
-        reader = pypdf.PdfReader(file)
-        text = ""
-        for page in reader.pages:
-            text += page.extract_text() + "\n"
-        return text
-    except Exception as e:
-        return f"Error reading PDF: {str(e)}"
+        with Image.open(io.BytesIO(data)) as img:
+            return img.mode
+    except Exception:
+        return None
 
-def extract_images_from_pdf(file) -> List[Image.Image]:
-    """Extracts images embedded in a PDF file."""
-    images = []
+def _has_decode_array(stream) -> bool:
+    """True if the stream remaps its samples with a non-default /Decode array (e.g. [1 0] inverts)."""
+    from pdfminer.pdftypes import resolve1
+
+    decode = resolve1(stream.get("Decode"))
+    if not isinstance(decode, list) or not decode:
+        return False
     try:
-        # Use pdfplumber for better image extraction
-        import pdfplumber
-        
-        # Reset file pointer if needed, but pdfplumber handles bytes/file objects
-        # We might need to copy the file to a temporary buffer if it's a stream
-        if hasattr(file, 'seek'):
-            file.seek(0)
+        values = [float(resolve1(v)) for v in decode]
+    except (TypeError, ValueError):
+        return True
+    return values != [0.0, 1.0] * (len(values) // 2)
+
+class LazyImage(ABC):
+    """
+    Base for images that keep a compact source (encoded bytes, a spill file) and decode pixels
+    only on `to_pil()`. Decoded pixels are registered with the shared image store
+    (src.imagestore), which releases the least recently used ones beyond its resident cap;
+    they are decoded again on next use. Pickling never includes decoded pixels.
+    """
+
+    width: int
+    height: int
+    _image = None
+
+    @property
+    def size(self):
+        return (self.width, self.height)
+
+    def to_pil(self) -> Image.Image:
+        """Decodes the image (or returns the still resident pixels)."""
+        from src.imagestore import get_image_store
+
+        image = self._image
+        if image is None:
+            image = self._image = self._decode()
+            get_image_store().admit(self, image)
+        else:
+            get_image_store().touch(self)
+        return image
+
+    def release(self) -> None:
+        """Drops the decoded pixels; the next to_pil() decodes them again."""
+        self._image = None
+
+    def content_hash(self) -> str:
+        """SHA-256 of the image content (computed once), e.g. for src.artifacts keys."""
+        digest = self.__dict__.get("_digest")
+        if digest is None:
+            digest = self._digest = self._hash().hexdigest()
+        return digest
+
+    def _hash(self):
+        pil = self.to_pil()
+        return hashlib.sha256(f"{pil.mode}{pil.size}".encode("utf-8") + pil.tobytes())
+
+    @abstractmethod
+    def _decode(self) -> Image.Image:
+        """Decodes the pixels from the compact source."""
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop("_image", None)
+        return state
+
+class PdfImage(LazyImage):
+    """
+    An image XObject taken straight from the PDF stream instead of re-rendering the page.
+    JPEG / JPEG 2000 streams keep their original encoded bytes (`data`) so they can be passed
+    through untouched; anything else is decoded to a PIL image only when `to_pil()` is called.
+    """
+
+    def __init__(self, width: int, height: int, format: str, data: bytes, filters: list = None,
+                 decode_params: list = None, mode: str = None, bits: int = 8, page_number: int = None,
+                 page_text: str = None):
+        self.width = width
+        self.height = height
+        self.format = format  # "JPEG", "JPEG2000" or "RAW"
+        self.data = data
+        self.filters = filters or []
+        self.decode_params = decode_params or []
+        self.mode = mode  # pixel mode; for JPEG the mode of its header ("CMYK" needs re-encoding)
+        self.bits = bits
+        self.page_number = page_number
+        self.page_text = page_text  # text of the source page (e.g. a thermal image's Max/Min readout)
+
+    def _hash(self):
+        # The stream bytes plus everything needed to decode them
+        header = repr((self.format, self.size, self.filters, self.mode, self.bits))
+        return hashlib.sha256(header.encode("utf-8") + self.data)
+
+    def _decode(self) -> Image.Image:
+        if self.format in ("JPEG", "JPEG2000"):
+            img = Image.open(io.BytesIO(self.data))
+            img.load()
+        else:
+            from pdfminer.pdftypes import PDFStream
+            from pdfminer.psparser import LIT
+
+            attrs = {"Filter": [LIT(f) for f in self.filters]}
+            if self.decode_params:
+                attrs["DecodeParms"] = self.decode_params
+            pixels = PDFStream(attrs, self.data).get_data()
+            if self.bits == 1:
+                img = Image.frombytes("1", self.size, pixels)
+            else:
+                img = Image.frombytes(self.mode, self.size, pixels)
+        if img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        return img
+
+class EncodedImage(LazyImage):
+    """An uploaded image file kept as its encoded bytes; only the header is read up front."""
+
+    def __init__(self, data: bytes):
+        header = Image.open(io.BytesIO(data))
+        self.width, self.height = header.size
+        self.format = header.format
+        self.mode = header.mode
+        self.data = data
+
+    def _hash(self):
+        return hashlib.sha256(self.data)
+
+    def _decode(self) -> Image.Image:
+        img = Image.open(io.BytesIO(self.data))
+        img.load()
+        return img
+
+class SpilledImage(LazyImage):
+    """
+    A rendered image (no encoded source to go back to) whose raw pixels live in a spill file of
+    the image store; they are memory-mapped back on to_pil(). The file is removed with the object.
+    """
+
+    def __init__(self, image: Image.Image, page_number: int = None, page_text: str = None):
+        import weakref
+        from src.imagestore import get_image_store
+
+        self.width, self.height = image.size
+        self.mode = image.mode
+        self.page_number = page_number
+        self.page_text = page_text
+        self.path = get_image_store().spill(image)
+        weakref.finalize(self, _remove_file, self.path)
+
+    def _decode(self) -> Image.Image:
+        from src.imagestore import ImageStore
+
+        return ImageStore.load(self.path, self.mode, self.size)
+
+    def __getstate__(self):
+        # Another process (or a later run) cannot rely on the spill file; carry the pixels instead
+        state = super().__getstate__()
+        state["pixels"] = self._decode().tobytes()
+        return state
+
+    def __setstate__(self, state):
+        pixels = state.pop("pixels")
+        self.__dict__.update(state)
+        self.__init__(Image.frombytes(self.mode, self.size, pixels), self.page_number, self.page_text)
+
+def _remove_file(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+def as_pil_image(img) -> Image.Image:
+    """Returns a PIL image for either a PIL image or a lazily decoded image (PdfImage, EncodedImage, ...)."""
+    if isinstance(img, LazyImage):
+        return img.to_pil()
+    return img
+
+def _pdf_image_from_stream(img_obj, page_number: int):
+    """
+    Builds a PdfImage from a pdfplumber image object without decoding any pixels.
+    Returns None when the image has to go through the rasterizer instead
+    (inline images, masks, /Decode arrays, unsupported filters or color spaces).
+    """
+    from pdfminer.pdftypes import resolve1
+
+    stream = img_obj.get("stream")
+    if stream is None or img_obj.get("imagemask") or _literal_name(resolve1(stream.get("Subtype"))) != "Image":
+        return None
+
+    if _has_decode_array(stream):
+        return None  # The rasterizer applies the sample remapping; neither the raw data nor the JPEG has it
+    width, height = img_obj["srcsize"]
+    filters = [(_literal_name(f), params) for f, params in stream.get_filters()]
+    filter_names = [name for name, _ in filters]
+
+    if filter_names and filter_names[-1] in _PASSTHROUGH_FILTERS:
+        # get_data() only strips transport encodings (ASCII85, Flate, ...) and leaves the image codec alone
+        data = stream.get_data()
+        return PdfImage(width, height, _PASSTHROUGH_FILTERS[filter_names[-1]], data, mode=_encoded_mode(data),
+                        page_number=page_number)
+
+    if not all(name in _PIXEL_FILTERS for name in filter_names):
+        return None  # CCITT, JBIG2, ...
+    bits = img_obj.get("bits") or 8
+    mode = _stream_color_mode(stream)
+    if mode is None or bits not in (1, 8) or (bits == 1 and mode != "L"):
+        return None
+    # Keep the still-compressed bytes; pixels are only inflated on to_pil()
+    return PdfImage(width, height, "RAW", stream.get_rawdata(), filters=filter_names,
+                    decode_params=[params for _, params in filters], mode=mode, bits=bits, page_number=page_number)
+
+def _extract_page_images(page, mode: str = "raster") -> list:
+    """
+    Extracts the images of a single pdfplumber page, skipping icons and logos.
+
+    mode="raster" re-renders each image's bounding box at 300 DPI (SpilledImage objects, so the
+    renders wait on disk instead of in memory).
+    mode="stream" pulls the embedded image XObjects out directly (PdfImage objects) and only
+    rasterizes vector/inline content; the >200px filter runs on the stream dimensions before decoding.
+    """
+    images = []
+    for img_obj in page.images:
+        try:
+            if mode == "stream":
+                pdf_img = _pdf_image_from_stream(img_obj, page.page_number)
+                if pdf_img is not None:
+                    # Filter small images (likely icons/logos)
+                    if pdf_img.width > 200 and pdf_img.height > 200:
+                        images.append(pdf_img)
+                    continue
+
+            # Extract the image bytes
+            # pdfplumber provides coordinates and object IDs
+            # We need to use the page's .to_image() cropped, OR extract raw bytes
+            # A robust way is to use page.crop(bbox).to_image().original
             
-        with pdfplumber.open(file) as pdf:
-            for page in pdf.pages:
-                for img_obj in page.images:
-                    try:
-                        # Extract the image bytes
-                        # pdfplumber provides coordinates and object IDs
-                        # We need to use the page's .to_image() cropped, OR extract raw bytes
-                        # A robust way is to use page.crop(bbox).to_image().original
-                        
-                        bbox = (img_obj['x0'], img_obj['top'], img_obj['x1'], img_obj['bottom'])
-                        cropped_page = page.crop(bbox)
-                        img = cropped_page.to_image(resolution=300).original
-                        
-                        # Filter small images (likely icons/logos)
-                        if img.width > 200 and img.height > 200:
-                            images.append(img)
-                    except Exception as img_err:
-                        print(f"Skipping an image: {img_err}")
-        return images
-    except Exception as e:
-        print(f"Error extracting images from PDF: {e}")
-        return []
+            bbox = (img_obj['x0'], img_obj['top'], img_obj['x1'], img_obj['bottom'])
+            cropped_page = page.crop(bbox)
+            img = cropped_page.to_image(resolution=300).original
+            
+            # Filter small images (likely icons/logos)
+            if img.width > 200 and img.height > 200:
+                images.append(SpilledImage(img, page_number=page.page_number))
+        except Exception as img_err:
+            print(f"Skipping an image: {img_err}")
+    return images
+
+def extract_images_from_pdf(file, mode: str = "raster") -> list:
+    """
+    Extracts images embedded in a PDF file.
+    mode="stream" returns PdfImage objects taken from the embedded streams (see _extract_page_images).
+    """
+    images = []
+    with span("ingestion.extract_images", bytes=_input_size(file), mode=mode) as extract_span:
+        try:
+            # Use pdfplumber for better image extraction
+            import pdfplumber
+            
+            # Reset file pointer if needed, but pdfplumber handles bytes/file objects
+            # We might need to copy the file to a temporary buffer if it's a stream
+            if hasattr(file, 'seek'):
+                file.seek(0)
+                
+            with pdfplumber.open(file) as pdf:
+                for page in pdf.pages:
+                    images.extend(_extract_page_images(page, mode))
+                extract_span.set(pages=len(pdf.pages), images=len(images))
+            return images
+        except Exception as e:
+            print(f"Error extracting images from PDF: {e}")
+            extract_span.fail(e)
+            return []
 
-def process_image(file) -> Image.Image:
-    """Loads an image file-like object for further processing."""
+def _iter_pages(file, image_mode: str):
+    """
+    Yields ({"page_number", "width", "height", "text", "image_count"}, images) for each page of a PDF.
+    Each page is laid out once and its cached objects are released before the next page.
+    """
+    import pdfplumber
+
+    if hasattr(file, 'seek'):
+        file.seek(0)
+
+    with pdfplumber.open(file) as pdf:
+        for page in pdf.pages:
+            page_text = page.extract_text() or ""
+            page_images = _extract_page_images(page, image_mode)
+            for img in page_images:
+                img.page_text = page_text
+            info = {
+                "page_number": page.page_number,
+                "width": float(page.width),
+                "height": float(page.height),
+                "text": page_text,
+                "image_count": len(page_images),
+            }
+            # Drop the parsed layout of this page before moving on
+            page.close()
+            yield info, page_images
+
+def parse_pdf(file, image_mode: str = "stream") -> Dict[str, Any]:
+    """
+    Parses a PDF in a single pass, returning page text, images and page metadata together.
+    Each page is laid out once and its cached objects are released before the next page,
+    so the document is never held in memory twice.
+
+    Returns a dict with:
+      - "text": full text, pages separated by newlines (same shape as load_pdf)
+      - "pages": list of {"page_number", "width", "height", "text", "image_count"}
+      - "images": images larger than 200x200 px; PdfImage objects taken from the embedded
+        streams for image_mode="stream", or 300 DPI renders (SpilledImage) for image_mode="raster".
+        Both decode on demand, within the resident cap of src.imagestore.
+    """
+    result = {"text": "", "pages": [], "images": []}
+    with span("ingestion.parse_pdf", bytes=_input_size(file), image_mode=image_mode) as parse_span:
+        try:
+            text_parts = []
+            for info, page_images in _iter_pages(file, image_mode):
+                text_parts.append(info["text"] + "\n")
+                result["images"].extend(page_images)
+                result["pages"].append(info)
+            result["text"] = "".join(text_parts)
+        except Exception as e:
+            result["text"] = f"Error reading PDF: {str(e)}"
+            parse_span.fail(e)
+        parse_span.set(pages=len(result["pages"]), images=len(result["images"]))
+    return result
+
+# Status values that mark a line as a checklist row ("Condition of tile joints    Yes")
+_CHECKLIST_VALUES = r"yes|no|n/?a|ok|not ok|good|fair|poor|satisfactory|unsatisfactory|present|absent|✓|✔|✗|✘"
+# Item and status must be separated by a real column separator (tab, 2+ spaces, ":" or "|"), so prose
+# ending in "good" or "no" is left alone; the key is a single bounded class to keep matching linear
+_CHECKLIST_RE = re.compile(rf"^(?P<key>[^\t:|]{{3,80}}?)(?:\t[\t ]*| {{2,}}| *[:|] *)(?P<value>{_CHECKLIST_VALUES})$", re.IGNORECASE)
+# Longer lines are prose or flattened tables, never a single checklist row
+MAX_CHECKLIST_LINE = 160
+# Only the first / last lines of a page can be running headers or footers, and only short ones
+HEADER_FOOTER_LINES = 3
+MAX_BOILERPLATE_LINE = 120
+_SPACE_RE = re.compile(r"[ \t\u00a0\u2000-\u200b\u3000]+")
+# Page numbers ("Page 3 of 8", "- 3 -") are ignored when comparing lines; other numbers are content
+_PAGE_NUMBER_RE = re.compile(r"\b(?:page|pg\.?)\s*\d+(?:\s*(?:of|/)\s*\d+)?|^[-\s]*\d+(?:\s*(?:of|/)\s*\d+)?[-\s]*$", re.IGNORECASE)
+
+def _checklist_row(line: str):
+    """(item, status) if the (whitespace-stripped, not yet collapsed) line is a checklist row, else None."""
+    if len(line) > MAX_CHECKLIST_LINE:
+        return None
+    match = _CHECKLIST_RE.match(line)
+    if match is None:
+        return None
+    key = _SPACE_RE.sub(" ", match.group("key")).strip(" .:-|")
+    if len(key) < 3 or not any(c.isalpha() for c in key):
+        return None
+    return key, match.group("value")
+
+def compact_pages(pages: List[str], min_repeat_share: float = 0.5) -> Dict[str, Any]:
+    """
+    Strips boilerplate from page texts before they are sent to the model:
+    1. whitespace runs are collapsed and blank lines dropped;
+    2. checklist rows become "item: status", and consecutive rows are joined on one line;
+    3. short lines in the header/footer zone (first / last HEADER_FOOTER_LINES lines of a page) that
+       recur there on at least min_repeat_share of the pages (page numbers ignored) are kept only
+       where they first appear.
+    Lines in the body of a page and checklist rows are never dropped: a finding repeated on
+    several pages is content.
+
+    Returns {"pages", "chars_before", "chars_after", "ratio" (after / before), "repeated_lines", "checklist_rows"}.
+    """
+    with span("ingestion.compact_text", pages=len(pages)) as compact_span:
+        result = _compact_pages(pages, min_repeat_share)
+        compact_span.set(chars_before=result["chars_before"], chars_after=result["chars_after"], ratio=round(result["ratio"], 3))
+    return result
+
+def _compact_pages(pages: List[str], min_repeat_share: float) -> Dict[str, Any]:
+    cleaned = []
+    checklist_rows = 0
+    for page in pages:
+        lines = []
+        for raw in (page or "").splitlines():
+            line = _SPACE_RE.sub(" ", raw).strip()
+            if not line:
+                continue
+            # Column separators are only visible before whitespace is collapsed
+            row = _checklist_row(raw.strip())
+            if row is None:
+                lines.append((line, False))
+                continue
+            checklist_rows += 1
+            entry = f"{row[0]}: {row[1]}"
+            if lines and lines[-1][1]:
+                lines[-1] = (f"{lines[-1][0]}; {entry}", True)
+            else:
+                lines.append((entry, True))
+        cleaned.append(lines)
+
+    def zone_keys(lines):
+        """Comparison keys of the boilerplate candidates of a page, by line index."""
+        return {i: _PAGE_NUMBER_RE.sub("#", line) for i, (line, is_checklist) in enumerate(lines)
+                if (i < HEADER_FOOTER_LINES or i >= len(lines) - HEADER_FOOTER_LINES)
+                and not is_checklist and len(line) <= MAX_BOILERPLATE_LINE}
+
+    # Candidates on enough different pages are running headers/footers; only worth checking with 3+ pages
+    candidates = [zone_keys(lines) for lines in cleaned]
+    counts = {}
+    for keys in candidates:
+        for key in set(keys.values()):
+            counts[key] = counts.get(key, 0) + 1
+    threshold = max(2, math.ceil(min_repeat_share * len(cleaned)))
+    repeated = {key for key, count in counts.items() if count >= threshold} if len(cleaned) >= 3 else set()
+
+    seen = set()
+    result = []
+    removed = 0
+    for lines, keys in zip(cleaned, candidates):
+        kept = []
+        for i, (line, _) in enumerate(lines):
+            key = keys.get(i)
+            if key in repeated:
+                if key in seen:
+                    removed += 1
+                    continue
+                seen.add(key)
+            kept.append(line)
+        result.append("\n".join(kept))
+
+    before = sum(len(page or "") for page in pages)
+    after = sum(len(page) for page in result)
+    return {"pages": result, "chars_before": before, "chars_after": after, "ratio": after / before if before else 1.0,
+            "repeated_lines": removed, "checklist_rows": checklist_rows}
+
+def process_image(file) -> EncodedImage:
+    """
+    Loads an image file (path or file-like object) for further processing.
+    Only the header is parsed; pixels are decoded on demand (see EncodedImage).
+    """
     try:
-        image = Image.open(file)
-        return image
+        if isinstance(file, (str, os.PathLike)):
+            with open(file, "rb") as f:
+                return EncodedImage(f.read())
+        if hasattr(file, 'seek'):
+            file.seek(0)
+        return EncodedImage(file.read())
     except Exception as e:
         print(f"Error processing image: {e}")
         return None
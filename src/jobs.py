@@ -0,0 +1,168 @@
+import json
+import os
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+from src.encoding import EncodingConfig
+from src.pipeline import PipelineOptions, run_pipeline
+
+DEFAULT_JOBS_DIR = os.getenv("DDR_JOBS_DIR", ".ddr_jobs")
+ARTIFACT_NAMES = {"md": "Generated_DDR.md", "pdf": "Generated_DDR.pdf", "docx": "Generated_DDR.docx"}
+
+def options_from_dict(data: Optional[dict]) -> PipelineOptions:
+    """Builds PipelineOptions from the JSON options of a job submission."""
+    data = data or {}
+    max_image_tokens = data.get("max_image_tokens")
+    return PipelineOptions(
+        use_tesseract=bool(data.get("use_tesseract", False)),
+        use_cache=bool(data.get("use_cache", True)),
+        chunked=bool(data.get("chunked", True)),
+        max_images=int(data.get("max_images", 20)),
+        polish=bool(data.get("polish", False)),
+        local_thermal=bool(data.get("local_thermal", True)),
+        compact_text=bool(data.get("compact_text", True)),
+        encoding=EncodingConfig(detail=data.get("image_detail", "auto"), max_image_tokens=int(max_image_tokens) if max_image_tokens else None),
+    )
+
+class JobQueue:
+    """
+    Local job queue + worker pool around run_pipeline.
+    Inputs, outputs and status live on disk under jobs_dir/<job_id>/, so jobs outlive browser
+    sessions, and queued/running jobs are resumed when the service restarts.
+    API keys are kept in memory only and never written to disk.
+    """
+
+    def __init__(self, jobs_dir: str = DEFAULT_JOBS_DIR, workers: int = 2, default_api_key: Optional[str] = None):
+        self.jobs_dir = jobs_dir
+        self.default_api_key = default_api_key
+        self._api_keys = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="ddr-job")
+        os.makedirs(jobs_dir, exist_ok=True)
+        self._resume()
+
+    def _job_dir(self, job_id: str) -> str:
+        # Job ids are uuid hex strings; reject anything else so ids can't escape jobs_dir
+        if not job_id or not all(c in "0123456789abcdef" for c in job_id):
+            raise KeyError(job_id)
+        return os.path.join(self.jobs_dir, job_id)
+
+    def _write_status(self, job_id: str, status: Dict[str, Any]) -> None:
+        path = os.path.join(self._job_dir(job_id), "status.json")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(status, f, indent=2)
+        os.replace(tmp_path, path)
+
+    def _update_status(self, job_id: str, **changes) -> Dict[str, Any]:
+        with self._lock:
+            status = self.get(job_id) or {}
+            status.update(changes)
+            self._write_status(job_id, status)
+            return status
+
+    def submit(self, inspection_pdf: bytes, thermal_pdf: Optional[bytes] = None, images: Optional[List[tuple]] = None,
+               options: Optional[dict] = None, api_key: Optional[str] = None) -> str:
+        """Stores the inputs and queues a job. images: list of (filename, bytes). Returns the job id."""
+        job_id = uuid.uuid4().hex
+        job_dir = self._job_dir(job_id)
+        inputs_dir = os.path.join(job_dir, "inputs")
+        os.makedirs(inputs_dir)
+        with open(os.path.join(inputs_dir, "inspection.pdf"), "wb") as f:
+            f.write(inspection_pdf)
+        if thermal_pdf:
+            with open(os.path.join(inputs_dir, "thermal.pdf"), "wb") as f:
+                f.write(thermal_pdf)
+        image_names = []
+        for i, (name, data) in enumerate(images or []):
+            ext = os.path.splitext(name or "")[1].lower() or ".png"
+            image_name = f"image_{i:03d}{ext}"
+            with open(os.path.join(inputs_dir, image_name), "wb") as f:
+                f.write(data)
+            image_names.append(image_name)
+
+        if api_key:
+            self._api_keys[job_id] = api_key
+        with self._lock:
+            self._write_status(job_id, {
+                "job_id": job_id,
+                "status": "queued",
+                "created_at": time.time(),
+                "options": options or {},
+                "has_thermal": bool(thermal_pdf),
+                "images": image_names,
+                "artifacts": [],
+            })
+        self._pool.submit(self._run, job_id)
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Returns the job status dict, or None for unknown jobs."""
+        try:
+            with open(os.path.join(self._job_dir(job_id), "status.json"), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (KeyError, OSError, ValueError):
+            return None
+
+    def artifact_path(self, job_id: str, fmt: str) -> Optional[str]:
+        """Path of a finished artifact ("md", "pdf" or "docx"), or None if it does not exist."""
+        if fmt not in ARTIFACT_NAMES:
+            return None
+        try:
+            path = os.path.join(self._job_dir(job_id), "outputs", ARTIFACT_NAMES[fmt])
+        except KeyError:
+            return None
+        return path if os.path.isfile(path) else None
+
+    def stats(self) -> Dict[str, int]:
+        """Counts jobs by status."""
+        counts = {}
+        for job_id in os.listdir(self.jobs_dir):
+            status = self.get(job_id)
+            if status:
+                counts[status["status"]] = counts.get(status["status"], 0) + 1
+        return counts
+
+    def _run(self, job_id: str) -> None:
+        status = self._update_status(job_id, status="running", started_at=time.time())
+        job_dir = self._job_dir(job_id)
+        inputs_dir = os.path.join(job_dir, "inputs")
+        try:
+            api_key = self._api_keys.pop(job_id, None) or self.default_api_key
+            if not api_key:
+                raise RuntimeError("No OpenAI API key available for this job.")
+            result = run_pipeline(
+                api_key,
+                os.path.join(inputs_dir, "inspection.pdf"),
+                os.path.join(inputs_dir, "thermal.pdf") if status.get("has_thermal") else None,
+                [os.path.join(inputs_dir, name) for name in status.get("images", [])],
+                options_from_dict(status.get("options")),
+            )
+            outputs_dir = os.path.join(job_dir, "outputs")
+            os.makedirs(outputs_dir, exist_ok=True)
+            artifacts = []
+            for fmt, data in (("md", result["markdown"].encode("utf-8")), ("pdf", result["pdf"]), ("docx", result["docx"])):
+                if data:
+                    with open(os.path.join(outputs_dir, ARTIFACT_NAMES[fmt]), "wb") as f:
+                        f.write(data)
+                    artifacts.append(fmt)
+            self._update_status(job_id, status="done", finished_at=time.time(), artifacts=artifacts,
+                                timings=result["timings"], stats=result["stats"], trace=result["trace"])
+        except Exception as e:
+            print(f"Job {job_id} failed: {e}")
+            self._update_status(job_id, status="failed", finished_at=time.time(), error=str(e),
+                                traceback=traceback.format_exc(limit=5))
+
+    def _resume(self) -> None:
+        """Re-queues jobs that were queued or running when the service stopped."""
+        for job_id in sorted(os.listdir(self.jobs_dir)):
+            status = self.get(job_id)
+            if status and status.get("status") in ("queued", "running"):
+                self._update_status(job_id, status="queued")
+                self._pool.submit(self._run, job_id)
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._pool.shutdown(wait=wait)
@@ -0,0 +1,117 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Optional
+from PIL import Image
+from src.ingestion import as_pil_image
+
+DEFAULT_OCR_TIMEOUT = float(os.getenv("DDR_OCR_TIMEOUT", "60"))
+
+def _deskew(binary):
+    """Rotates a binarized (text = white) image so text lines are horizontal."""
+    import cv2
+    import numpy as np
+
+    coords = np.column_stack(np.where(binary > 0))
+    if len(coords) < 50:
+        return binary
+    angle = cv2.minAreaRect(coords.astype(np.float32))[-1]
+    # minAreaRect reports angles in [0, 90); map to the smallest correction
+    if angle > 45:
+        angle -= 90
+    if abs(angle) < 0.5 or abs(angle) > 30:
+        return binary
+    height, width = binary.shape
+    matrix = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+    return cv2.warpAffine(binary, matrix, (width, height), flags=cv2.INTER_NEAREST, borderValue=0)
+
+def _crop_to_text(binary, padding: int = 10):
+    """Crops to the bounding box of the text-like regions (dilated blobs that look like lines of glyphs)."""
+    import cv2
+
+    height, width = binary.shape
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (max(15, width // 50), 3))
+    dilated = cv2.dilate(binary, kernel, iterations=1)
+    contours, _ = cv2.findContours(dilated, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    boxes = []
+    for contour in contours:
+        x, y, w, h = cv2.boundingRect(contour)
+        # Skip specks and shapes that are too tall to be text lines
+        if w < 8 or h < 5 or h > height * 0.5:
+            continue
+        boxes.append((x, y, x + w, y + h))
+    if not boxes:
+        return binary
+    x0 = max(0, min(b[0] for b in boxes) - padding)
+    y0 = max(0, min(b[1] for b in boxes) - padding)
+    x1 = min(width, max(b[2] for b in boxes) + padding)
+    y1 = min(height, max(b[3] for b in boxes) + padding)
+    return binary[y0:y1, x0:x1]
+
+def preprocess_for_ocr(img) -> Image.Image:
+    """
+    Prepares an image for Tesseract: grayscale, Otsu binarization, deskew and crop to text regions.
+    Returns black text on a white background.
+    """
+    import cv2
+    import numpy as np
+
+    gray = np.array(as_pil_image(img).convert("L"))
+    # Text becomes white (255) so geometry operations work on the glyph pixels
+    _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    binary = _deskew(binary)
+    binary = _crop_to_text(binary)
+    return Image.fromarray(255 - binary)
+
+def ocr_image(img, preprocess: bool = True, timeout: float = DEFAULT_OCR_TIMEOUT) -> str:
+    """OCRs a single image. Runs inside the worker processes, so it must stay a top-level function."""
+    import pytesseract
+
+    try:
+        pil = preprocess_for_ocr(img) if preprocess else as_pil_image(img)
+        # pytesseract kills the tesseract subprocess itself once the timeout expires
+        return pytesseract.image_to_string(pil, timeout=timeout)
+    except Exception as e:
+        # Some pytesseract exceptions cannot be unpickled in the parent, which would break the pool
+        raise RuntimeError(str(e)) from None
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_ocr_pool(max_workers: Optional[int] = None) -> ProcessPoolExecutor:
+    """Returns the shared OCR process pool (sized to the available cores by default)."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None and getattr(_pool, "_broken", False):
+            # A worker died (e.g. killed by the OOM killer); start a fresh pool
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+        if _pool is None:
+            if max_workers is None:
+                max_workers = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+            # "spawn" avoids forking the threaded Streamlit server
+            _pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+def ocr_images_parallel(images: list, max_workers: Optional[int] = None, timeout: float = DEFAULT_OCR_TIMEOUT, preprocess: bool = True) -> List[str]:
+    """
+    OCRs images across a process pool. Results keep the input order; a failing or timed-out
+    image yields an error string instead of stalling or failing the whole report.
+    """
+    pool = get_ocr_pool(max_workers)
+    futures = [pool.submit(ocr_image, img, preprocess, timeout) for img in images]
+    results = []
+    for future in futures:
+        try:
+            # Backstop in case the worker hangs outside of tesseract itself
+            results.append(f"[OCR Result]: {future.result(timeout=timeout + 5).strip()}")
+        except BrokenProcessPool:
+            results.append("Error analyzing image with Tesseract: OCR worker crashed")
+        except FutureTimeoutError:
+            future.cancel()
+            results.append("Error analyzing image with Tesseract: timed out")
+        except Exception as e:
+            results.append(f"Error analyzing image with Tesseract: {str(e)}")
+    return results
@@ -0,0 +1,126 @@
+import asyncio
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, Optional
+from src.analysis import DEFAULT_CONTEXT_BUDGET, analyze_content_async, polish_report_async
+from src.artifacts import parse_pdf_cached
+from src.encoding import EncodingConfig
+from src.generation import generate_ddr_markdown, start_exports
+from src.ingestion import compact_pages, load_template, parse_pdf, process_image
+from src.selection import select_images
+from src.tracing import RunTrace, current_run, span, start_run
+
+DEFAULT_TEMPLATE_PATH = "assets/main_ddr_template.txt"
+
+@dataclass
+class PipelineOptions:
+    """Settings for one end-to-end DDR run (mirrors the Streamlit sidebar)."""
+    use_tesseract: bool = False
+    use_cache: bool = True
+    chunked: bool = True
+    context_budget: int = DEFAULT_CONTEXT_BUDGET
+    max_images: int = 20
+    encoding: EncodingConfig = field(default_factory=EncodingConfig)
+    template_path: str = DEFAULT_TEMPLATE_PATH
+    formats: tuple = ("md", "pdf", "docx")
+    polish: bool = False  # second LLM pass to polish the prose of the locally rendered report
+    local_thermal: bool = True  # read FLIR-style thermal images locally, Vision only for the rest
+    compact_text: bool = True  # strip repeated headers/footers, whitespace and checklist tables before prompting
+
+@contextmanager
+def _stage(timings: dict, name: str):
+    """Times one pipeline stage into `timings` and as a "stage.<name>" trace span."""
+    start = time.perf_counter()
+    with span(f"stage.{name}"):
+        yield
+    timings[name] = time.perf_counter() - start
+
+def _page_texts(doc: Dict[str, Any], compact: bool):
+    """Page texts of a parsed PDF for the prompts (its full text if it has no pages) and the compaction result, if any."""
+    pages = [page["text"] for page in doc["pages"]]
+    if not pages:
+        return doc["text"], None
+    if not compact:
+        return pages, None
+    compacted = compact_pages(pages)
+    return compacted["pages"], compacted
+
+def run_pipeline(api_key: str, inspection_pdf, thermal_pdf=None, image_files: Iterable = (), options: Optional[PipelineOptions] = None) -> Dict[str, Any]:
+    """
+    Runs ingestion -> image selection -> analysis -> synthesis -> generation for one report bundle.
+    PDFs and images may be paths or file-like objects.
+
+    Returns a dict with "markdown", "pdf" and "docx" (bytes, empty if not requested or failed),
+    "analysis", per-stage "timings" in seconds, input "stats" and a "trace" summary
+    (per-span durations, tokens and estimated cost, see src.tracing).
+    """
+    options = options or PipelineOptions()
+    run = current_run()
+    if run is None:
+        # Collect a trace summary for this bundle unless the caller already started a run
+        with start_run() as run:
+            return _run_pipeline(api_key, inspection_pdf, thermal_pdf, image_files, options, run)
+    return _run_pipeline(api_key, inspection_pdf, thermal_pdf, image_files, options, run)
+
+def _run_pipeline(api_key: str, inspection_pdf, thermal_pdf, image_files: Iterable, options: PipelineOptions, run: RunTrace) -> Dict[str, Any]:
+    timings = {}
+    with _stage(timings, "ingestion"):
+        # With use_cache, PDFs parsed before (same content) come from the artifact store
+        parse = parse_pdf_cached if options.use_cache else parse_pdf
+        inspection_doc = parse(inspection_pdf)
+        thermal_doc = parse(thermal_pdf) if thermal_pdf else None
+        manual_images = [img for img in (process_image(f) for f in image_files or []) if img]
+        inspection_pages, inspection_compacted = _page_texts(inspection_doc, options.compact_text)
+        thermal_pages, thermal_compacted = _page_texts(thermal_doc, options.compact_text) if thermal_doc else ("", None)
+        compacted = [c for c in (inspection_compacted, thermal_compacted) if c]
+        chars_before = sum(c["chars_before"] for c in compacted)
+        chars_after = sum(c["chars_after"] for c in compacted)
+
+    with _stage(timings, "selection"):
+        selection = select_images(
+            [("manual", manual_images),
+             ("thermal_pdf", thermal_doc["images"] if thermal_doc else []),
+             ("inspection_pdf", inspection_doc["images"])],
+            max_images=options.max_images
+        )
+
+    with _stage(timings, "analysis"):
+        analysis = asyncio.run(analyze_content_async(
+            api_key, inspection_pages, thermal_pages, selection["images"],
+            use_tesseract=options.use_tesseract, use_cache=options.use_cache, encoding=options.encoding,
+            chunked=options.chunked, context_budget=options.context_budget, local_thermal=options.local_thermal
+        ))
+
+    with _stage(timings, "synthesis"):
+        template_text = load_template(options.template_path)
+        # The template is filled locally from the structured analysis; the LLM only (optionally) polishes prose
+        final_output = generate_ddr_markdown(analysis, template_text)
+        if options.polish and not final_output.startswith("Error"):
+            final_output = asyncio.run(polish_report_async(api_key, final_output, use_cache=options.use_cache))
+
+    with _stage(timings, "generation"):
+        # PDF and DOCX render concurrently
+        exports = start_exports(final_output, [fmt for fmt in ("pdf", "docx") if fmt in options.formats])
+        pdf_bytes = exports["pdf"].result() if "pdf" in exports else b""
+        docx_bytes = exports["docx"].result() if "docx" in exports else b""
+
+    return {
+        "markdown": final_output,
+        "pdf": pdf_bytes,
+        "docx": docx_bytes,
+        "analysis": analysis,
+        "timings": timings,
+        "trace": run.summary(),
+        "stats": {
+            "inspection_pages": len(inspection_doc["pages"]),
+            "thermal_pages": len(thermal_doc["pages"]) if thermal_doc else 0,
+            "images_total": selection["total"],
+            "images_selected": len(selection["images"]),
+            "duplicates_removed": selection["duplicates_removed"],
+            "image_token_estimate": analysis.get("image_token_estimate", 0),
+            "images_local": analysis.get("images_local", 0),
+            # Report text after / before boilerplate stripping (1.0 when compact_text is off)
+            "text_compression": round(chars_after / chars_before, 3) if chars_before else 1.0,
+        },
+    }
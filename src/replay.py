@@ -0,0 +1,200 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Optional
+
+class CassetteMiss(LookupError):
+    """Replay mode got a request that was never recorded."""
+
+def _compact(payload: Any) -> Any:
+    """The request as JSON with every image replaced by the SHA-256 of its data URL (keeps cassettes small)."""
+    if isinstance(payload, str):
+        return payload
+    if isinstance(payload, (list, tuple)):
+        return [_compact(p) for p in payload]
+    if isinstance(payload, dict):
+        if payload.get("type") == "image_url":
+            image = payload.get("image_url") or {}
+            url = image.get("url", "") if isinstance(image, dict) else str(image)
+            return {"type": "image_url", "image_sha256": hashlib.sha256(url.encode("utf-8")).hexdigest(),
+                    "detail": image.get("detail") if isinstance(image, dict) else None}
+        return {k: _compact(v) for k, v in payload.items()}
+    if hasattr(payload, "content"):
+        return {"type": getattr(payload, "type", ""), "content": _compact(payload.content)}
+    return payload
+
+class Cassette:
+    """
+    Recorded LLM traffic in a JSON-lines file: one {"key", "model", "request", "response", "usage", "latency"} line per call.
+    Requests are keyed by call kind (invoke/stream/structured schema) and the compacted payload.
+    Identical requests are replayed in recording order; the last response is reused once they run out.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._served = {}
+        self.model = None
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._entries.setdefault(entry["key"], []).append(entry)
+                        self.model = self.model or entry.get("model")
+
+    def __len__(self) -> int:
+        return sum(len(entries) for entries in self._entries.values())
+
+    @staticmethod
+    def make_key(kind: str, payload: Any) -> tuple:
+        request = _compact(payload)
+        digest = hashlib.sha256(f"{kind}\0".encode("utf-8"))
+        digest.update(json.dumps(request, sort_keys=True, default=str).encode("utf-8"))
+        return digest.hexdigest(), request
+
+    def record(self, key: str, model: str, request: Any, response: Any, usage: Optional[dict], latency: float) -> None:
+        entry = {"key": key, "model": model, "request": request, "response": response, "usage": usage or {}, "latency": round(latency, 4)}
+        with self._lock:
+            self._entries.setdefault(key, []).append(entry)
+            self.model = self.model or model
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, separators=(",", ":"), default=str) + "\n")
+
+    def lookup(self, key: str) -> dict:
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                raise CassetteMiss(f"No recorded response for request {key[:12]} in {self.path}")
+            index = self._served.get(key, 0)
+            self._served[key] = index + 1
+        return entries[min(index, len(entries) - 1)]
+
+class _Recorder:
+    """Cassette and request-key handling shared by the recording and replaying wrappers."""
+
+    def __init__(self, cassette: Cassette, model_name: str, kind: str):
+        self.cassette = cassette
+        self.model_name = model_name
+        self.kind = kind
+
+    def _key(self, payload, kind: Optional[str] = None):
+        return Cassette.make_key(kind or self.kind, payload)
+
+class RecordingLLM(_Recorder):
+    """Wraps a live chat model and appends every successful request/response pair to the cassette."""
+
+    def __init__(self, llm, cassette: Cassette, schema=None):
+        super().__init__(cassette, getattr(llm, "model_name", ""), f"structured:{schema.__name__}" if schema else "invoke")
+        self.llm = llm
+        self.schema = schema
+        self.temperature = getattr(llm, "temperature", None)
+
+    def __getattr__(self, name):
+        return getattr(self.llm, name)
+
+    def _store(self, payload, resp, latency: float) -> None:
+        key, request = self._key(payload)
+        if self.schema is None:
+            self.cassette.record(key, self.model_name, request, resp.content, getattr(resp, "usage_metadata", None), latency)
+            return
+        if resp.get("parsed") is None:
+            return
+        raw = resp.get("raw")
+        self.cassette.record(key, self.model_name, request, resp["parsed"].model_dump(), getattr(raw, "usage_metadata", None), latency)
+
+    def invoke(self, payload, config=None):
+        start = time.perf_counter()
+        resp = self.llm.invoke(payload)
+        self._store(payload, resp, time.perf_counter() - start)
+        return resp
+
+    async def ainvoke(self, payload, config=None):
+        start = time.perf_counter()
+        resp = await self.llm.ainvoke(payload)
+        self._store(payload, resp, time.perf_counter() - start)
+        return resp
+
+    def batch(self, payloads, config=None, **kwargs):
+        return [self.invoke(payload) for payload in payloads]
+
+    def stream(self, payload, config=None):
+        start = time.perf_counter()
+        latency = None
+        parts = []
+        usage = None
+        for chunk in self.llm.stream(payload):
+            # Replay waits the time to first token, then yields the text at once
+            latency = latency if latency is not None else time.perf_counter() - start
+            parts.append(chunk.content or "")
+            usage = getattr(chunk, "usage_metadata", None) or usage
+            yield chunk
+        key, request = self._key(payload, "stream")
+        self.cassette.record(key, self.model_name, request, "".join(parts), usage, latency or 0.0)
+
+    def with_structured_output(self, schema, **kwargs):
+        return RecordingLLM(self.llm.with_structured_output(schema, **kwargs), self.cassette, schema)
+
+class ReplayLLM(_Recorder):
+    """
+    Serves recorded responses without network access. latency="original" sleeps the recorded time, "zero" does not.
+    Reports the recorded model's name, so token costs match the recording.
+    """
+
+    def __init__(self, cassette: Cassette, model_name: Optional[str] = None, latency: str = "original", schema=None):
+        super().__init__(cassette, model_name or cassette.model or "gpt-4o", f"structured:{schema.__name__}" if schema else "invoke")
+        self.schema = schema
+        self.latency = latency
+        self.temperature = 0
+
+    def _entry(self, payload, kind: Optional[str] = None) -> dict:
+        return self.cassette.lookup(self._key(payload, kind)[0])
+
+    def _delay(self, entry: dict) -> float:
+        return entry.get("latency", 0.0) if self.latency == "original" else 0.0
+
+    def _response(self, entry: dict):
+        from langchain_core.messages import AIMessage
+
+        usage = entry.get("usage") or None
+        if self.schema is None:
+            return AIMessage(content=entry["response"], usage_metadata=usage)
+        parsed = self.schema.model_validate(entry["response"])
+        return {"raw": AIMessage(content=json.dumps(entry["response"]), usage_metadata=usage), "parsed": parsed, "parsing_error": None}
+
+    def invoke(self, payload, config=None):
+        entry = self._entry(payload)
+        time.sleep(self._delay(entry))
+        return self._response(entry)
+
+    async def ainvoke(self, payload, config=None):
+        entry = self._entry(payload)
+        await asyncio.sleep(self._delay(entry))
+        return self._response(entry)
+
+    def batch(self, payloads, config=None, **kwargs):
+        return [self.invoke(payload) for payload in payloads]
+
+    def stream(self, payload, config=None):
+        from langchain_core.messages import AIMessageChunk
+
+        entry = self._entry(payload, "stream")
+        time.sleep(self._delay(entry))
+        yield AIMessageChunk(content=entry["response"], usage_metadata=entry.get("usage") or None)
+
+    def with_structured_output(self, schema, **kwargs):
+        return ReplayLLM(self.cassette, self.model_name, self.latency, schema)
+
+_cassettes = {}
+_cassettes_lock = threading.Lock()
+
+def get_cassette(path: str) -> Cassette:
+    """One Cassette per file per process, so concurrent runs share the replay order and the append lock."""
+    with _cassettes_lock:
+        if path not in _cassettes:
+            _cassettes[path] = Cassette(path)
+        return _cassettes[path]
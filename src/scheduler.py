@@ -0,0 +1,398 @@
+import asyncio
+import os
+import random
+import re
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional
+from src.chunking import count_tokens
+
+# Completion allowance added to every request's token estimate (OpenAI counts max output tokens against TPM)
+DEFAULT_COMPLETION_TOKENS = 500
+# Image token estimates when the exact size is not known from the payload
+LOW_DETAIL_IMAGE_TOKENS = 85
+HIGH_DETAIL_IMAGE_TOKENS = 765
+
+_END = object()
+
+class TokenBucket:
+    """
+    Continuously refilling budget of `rate_per_minute` units (requests or tokens).
+    reserve() takes units immediately and returns how long the caller must wait before using them,
+    so concurrent callers queue up in order instead of all retrying at once.
+    """
+
+    def __init__(self, rate_per_minute: float):
+        self.rate_per_minute = rate_per_minute
+        self.capacity = rate_per_minute
+        self._level = rate_per_minute
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._level = min(self.capacity, self._level + (now - self._updated) * self.rate_per_minute / 60.0)
+        self._updated = now
+
+    def reserve(self, amount: float) -> float:
+        with self._lock:
+            self._refill()
+            # A single request larger than the whole bucket can never fit; let it through at a full bucket
+            amount = min(amount, self.capacity)
+            self._level -= amount
+            if self._level >= 0:
+                return 0.0
+            return -self._level * 60.0 / self.rate_per_minute
+
+    def refund(self, amount: float) -> None:
+        with self._lock:
+            self._refill()
+            self._level = min(self.capacity, self._level + amount)
+
+    def update(self, limit: Optional[float] = None, remaining: Optional[float] = None) -> None:
+        """Syncs the bucket with the server's view (x-ratelimit-limit-* / x-ratelimit-remaining-*)."""
+        with self._lock:
+            self._refill()
+            if limit:
+                self.rate_per_minute = self.capacity = float(limit)
+            if remaining is not None:
+                self._level = min(self._level, float(remaining))
+
+def _parse_duration(value: str) -> Optional[float]:
+    """Parses OpenAI reset durations such as "1s", "6m0s", "250ms" into seconds."""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = re.findall(r"(\d+(?:\.\d+)?)(ms|h|m|s)", value)
+    if not parts:
+        return None
+    scale = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+    return sum(float(number) * scale[unit] for number, unit in parts)
+
+def _header(headers, name: str) -> Optional[str]:
+    if not headers:
+        return None
+    return headers.get(name) or headers.get(name.title())
+
+def _to_float(value) -> Optional[float]:
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+def retry_after(exc: BaseException) -> Optional[float]:
+    """Seconds the server asked us to wait (Retry-After / x-ratelimit-reset-*), if any."""
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    if not headers:
+        return None
+    retry_ms = _to_float(_header(headers, "retry-after-ms"))
+    if retry_ms is not None:
+        return retry_ms / 1000.0
+    delays = [_parse_duration(_header(headers, name)) for name in ("retry-after", "x-ratelimit-reset-requests", "x-ratelimit-reset-tokens")]
+    delays = [d for d in delays if d is not None]
+    return max(delays) if delays else None
+
+def _openai_errors(*names) -> tuple:
+    # openai is slow to import; if it is not loaded yet, no openai exception can exist either
+    openai = sys.modules.get("openai")
+    return tuple(getattr(openai, name) for name in names) if openai else ()
+
+def is_rate_limit(exc: BaseException) -> bool:
+    return isinstance(exc, _openai_errors("RateLimitError")) or getattr(exc, "status_code", None) == 429
+
+def is_retryable(exc: BaseException) -> bool:
+    """Rate limits, timeouts, connection errors and 5xx are retried; an exhausted quota or bad request is not."""
+    if getattr(exc, "code", None) == "insufficient_quota":
+        return False
+    if is_rate_limit(exc):
+        return True
+    if isinstance(exc, _openai_errors("APITimeoutError", "APIConnectionError", "InternalServerError") + (TimeoutError, ConnectionError)):
+        return True
+    return getattr(exc, "status_code", None) in (408, 409, 500, 502, 503, 504)
+
+def estimate_request_tokens(payload) -> int:
+    """Rough prompt + completion token count of an LLM payload (a prompt string or a list of messages)."""
+    if isinstance(payload, str):
+        return count_tokens(payload) + DEFAULT_COMPLETION_TOKENS
+    tokens = DEFAULT_COMPLETION_TOKENS
+    for message in payload if isinstance(payload, (list, tuple)) else [payload]:
+        content = getattr(message, "content", message)
+        if isinstance(content, str):
+            tokens += count_tokens(content)
+            continue
+        for part in content or []:
+            if not isinstance(part, dict):
+                continue
+            if part.get("type") == "text":
+                tokens += count_tokens(part.get("text", ""))
+            elif part.get("type") == "image_url":
+                detail = (part.get("image_url") or {}).get("detail")
+                tokens += LOW_DETAIL_IMAGE_TOKENS if detail == "low" else HIGH_DETAIL_IMAGE_TOKENS
+    return tokens
+
+class RequestScheduler:
+    """
+    Shared gate for all LLM requests of the process (every thread, worker and event loop).
+
+    - Requests/minute and tokens/minute token buckets (configured, or learned from rate-limit headers).
+    - Adaptive concurrency (AIMD): +1/limit per success, halved on a 429, reduced when the
+      headers show the remaining quota running low; never above max_concurrency.
+    - Each request is retried on its own with jittered exponential backoff (or the server's
+      Retry-After), so one 429 does not fail a whole batch.
+    """
+
+    def __init__(self, rpm: Optional[float] = None, tpm: Optional[float] = None, max_concurrency: int = 8,
+                 min_concurrency: int = 1, max_retries: int = 6, base_delay: float = 1.0, max_delay: float = 60.0):
+        self.max_concurrency = max(1, max_concurrency)
+        self.min_concurrency = max(1, min(min_concurrency, self.max_concurrency))
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._request_bucket = TokenBucket(rpm) if rpm else None
+        self._token_bucket = TokenBucket(tpm) if tpm else None
+        self._fixed_rpm = bool(rpm)
+        self._fixed_tpm = bool(tpm)
+        self._limit = float(self.max_concurrency)
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        self._async_waiters = []
+        self._stats = {"requests": 0, "retries": 0, "rate_limited": 0, "failures": 0}
+
+    # -- concurrency slots -------------------------------------------------
+
+    def _try_acquire(self) -> bool:
+        # Caller holds self._lock
+        if self._in_flight < max(self.min_concurrency, int(self._limit)):
+            self._in_flight += 1
+            return True
+        return False
+
+    def _acquire(self) -> None:
+        with self._available:
+            while not self._try_acquire():
+                self._available.wait()
+
+    async def _acquire_async(self) -> None:
+        # Waits on a future instead of a thread, so thousands of queued coroutines cost nothing
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._lock:
+                if self._try_acquire():
+                    return
+                waiter = loop.create_future()
+                self._async_waiters.append((loop, waiter))
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                with self._lock:
+                    if (loop, waiter) in self._async_waiters:
+                        self._async_waiters.remove((loop, waiter))
+                    else:
+                        # We were woken and cancelled at the same time: pass the wake-up on
+                        self._wake()
+                raise
+
+    def _wake(self) -> None:
+        # Caller holds self._lock
+        self._available.notify()
+        while self._async_waiters:
+            loop, waiter = self._async_waiters.pop(0)
+            if not loop.is_closed() and not waiter.done():
+                loop.call_soon_threadsafe(lambda w=waiter: w.done() or w.set_result(None))
+                break
+
+    def _release(self, success: Optional[bool]) -> None:
+        with self._lock:
+            self._in_flight -= 1
+            if success:
+                self._limit = min(float(self.max_concurrency), self._limit + 1.0 / max(1.0, self._limit))
+            elif success is False:
+                self._limit = max(float(self.min_concurrency), self._limit / 2)
+            self._wake()
+
+    def set_max_concurrency(self, limit: int) -> None:
+        with self._lock:
+            self.max_concurrency = max(1, limit)
+            self.min_concurrency = min(self.min_concurrency, self.max_concurrency)
+            self._limit = min(self._limit, float(self.max_concurrency)) if self._limit else float(self.max_concurrency)
+            self._wake()
+
+    # -- budgets ------------------------------------------------------------
+
+    def _budget_delay(self, tokens: int) -> float:
+        delay = 0.0
+        if self._request_bucket:
+            delay = max(delay, self._request_bucket.reserve(1))
+        if self._token_bucket:
+            delay = max(delay, self._token_bucket.reserve(tokens))
+        return delay
+
+    def _backoff(self, attempt: int, exc: BaseException) -> float:
+        server_delay = retry_after(exc)
+        # Full jitter spreads the retries of many concurrent callers
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        return min(self.max_delay, max(delay, server_delay or 0.0))
+
+    def _on_error(self, exc: BaseException, attempt: int) -> Optional[float]:
+        """Records a failed attempt; returns the delay before retrying, or None to give up."""
+        rate_limited = is_rate_limit(exc)
+        self._release(False if rate_limited else None)
+        with self._lock:
+            self._stats["rate_limited"] += rate_limited
+            if attempt >= self.max_retries or not is_retryable(exc):
+                self._stats["failures"] += 1
+                return None
+            self._stats["retries"] += 1
+        return self._backoff(attempt, exc)
+
+    def observe(self, headers: Optional[Dict[str, Any]], estimated_tokens: int = 0, used_tokens: Optional[int] = None) -> None:
+        """Feeds rate-limit response headers and actual token usage back into the budgets."""
+        if used_tokens is not None and self._token_bucket and estimated_tokens > used_tokens:
+            self._token_bucket.refund(estimated_tokens - used_tokens)
+        if not headers:
+            return
+        limit_requests = _to_float(_header(headers, "x-ratelimit-limit-requests"))
+        remaining_requests = _to_float(_header(headers, "x-ratelimit-remaining-requests"))
+        limit_tokens = _to_float(_header(headers, "x-ratelimit-limit-tokens"))
+        remaining_tokens = _to_float(_header(headers, "x-ratelimit-remaining-tokens"))
+
+        with self._lock:
+            if limit_requests and self._request_bucket is None:
+                self._request_bucket = TokenBucket(limit_requests)
+            if limit_tokens and self._token_bucket is None:
+                self._token_bucket = TokenBucket(limit_tokens)
+        if self._request_bucket:
+            self._request_bucket.update(None if self._fixed_rpm else limit_requests, remaining_requests)
+        if self._token_bucket:
+            self._token_bucket.update(None if self._fixed_tpm else limit_tokens, remaining_tokens)
+
+        # Back off before the server starts refusing: less than 10% of either quota left
+        low = [remaining / limit for remaining, limit in ((remaining_requests, limit_requests), (remaining_tokens, limit_tokens))
+               if remaining is not None and limit]
+        if low and min(low) < 0.1:
+            with self._lock:
+                self._limit = max(float(self.min_concurrency), self._limit * 0.75)
+
+    # -- entry points -------------------------------------------------------
+
+    def call(self, fn: Callable[[], Any], tokens: int = 0) -> Any:
+        """Runs fn() within the budgets, retrying retryable errors. Raises the last error when giving up."""
+        attempt = 0
+        while True:
+            time.sleep(self._budget_delay(tokens))
+            self._acquire()
+            try:
+                result = fn()
+            except Exception as e:
+                delay = self._on_error(e, attempt)
+                if delay is None:
+                    raise
+                attempt += 1
+                time.sleep(delay)
+                continue
+            with self._lock:
+                self._stats["requests"] += 1
+            self._release(True)
+            return result
+
+    async def acall(self, fn: Callable[[], Any], tokens: int = 0) -> Any:
+        """Async version of call; fn returns an awaitable."""
+        attempt = 0
+        while True:
+            await asyncio.sleep(self._budget_delay(tokens))
+            await self._acquire_async()
+            try:
+                result = await fn()
+            except asyncio.CancelledError:
+                self._release(None)
+                raise
+            except Exception as e:
+                delay = self._on_error(e, attempt)
+                if delay is None:
+                    raise
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+            with self._lock:
+                self._stats["requests"] += 1
+            self._release(True)
+            return result
+
+    def stream(self, fn: Callable[[], Iterable], tokens: int = 0) -> Iterator:
+        """
+        Streaming version of call: yields the items of fn()'s iterator while holding a slot.
+        Errors before the first item are retried like call(); a stream that breaks midway is not
+        (its items were already handed out) and the error is raised to the consumer.
+        """
+        attempt = 0
+        while True:
+            time.sleep(self._budget_delay(tokens))
+            self._acquire()
+            try:
+                iterator = iter(fn())
+                first = next(iterator, _END)
+            except Exception as e:
+                delay = self._on_error(e, attempt)
+                if delay is None:
+                    raise
+                attempt += 1
+                time.sleep(delay)
+                continue
+            break
+
+        success = None
+        try:
+            if first is not _END:
+                yield first
+            for item in iterator:
+                yield item
+            success = True
+        except Exception as e:
+            success = False if is_rate_limit(e) else None
+            raise
+        finally:
+            if success:
+                with self._lock:
+                    self._stats["requests"] += 1
+            self._release(success)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self._stats,
+                "concurrency_limit": round(self._limit, 2),
+                "in_flight": self._in_flight,
+                "rpm": self._request_bucket.rate_per_minute if self._request_bucket else None,
+                "tpm": self._token_bucket.rate_per_minute if self._token_bucket else None,
+            }
+
+_default_scheduler = None
+_default_scheduler_lock = threading.Lock()
+
+def get_scheduler() -> RequestScheduler:
+    """
+    Process-wide scheduler shared by all LLM calls. Limits come from DDR_LLM_RPM, DDR_LLM_TPM and
+    DDR_LLM_CONCURRENCY; without RPM/TPM the budgets are learned from the response headers.
+    """
+    global _default_scheduler
+    with _default_scheduler_lock:
+        if _default_scheduler is None:
+            _default_scheduler = RequestScheduler(
+                rpm=_to_float(os.getenv("DDR_LLM_RPM")),
+                tpm=_to_float(os.getenv("DDR_LLM_TPM")),
+                max_concurrency=int(os.getenv("DDR_LLM_CONCURRENCY", "8")),
+            )
+        return _default_scheduler
+
+def configure_scheduler(rpm: Optional[float] = None, tpm: Optional[float] = None, max_concurrency: Optional[int] = None) -> RequestScheduler:
+    """Replaces the process-wide scheduler (e.g. from batch/service command-line options)."""
+    global _default_scheduler
+    current = get_scheduler()
+    with _default_scheduler_lock:
+        _default_scheduler = RequestScheduler(rpm=rpm, tpm=tpm, max_concurrency=max_concurrency or current.max_concurrency)
+        return _default_scheduler
@@ -0,0 +1,60 @@
+from typing import List, Optional
+from pydantic import BaseModel, ConfigDict, Field, ValidationError
+from src.chunking import parse_json_response
+
+NOT_AVAILABLE = "Not Available"
+
+def _strip_defaults(schema: dict) -> None:
+    # OpenAI strict mode rejects "default"; defaults only matter when validating partial data locally
+    for prop in schema.get("properties", {}).values():
+        prop.pop("default", None)
+
+class _Section(BaseModel):
+    model_config = ConfigDict(json_schema_extra=_strip_defaults)
+
+class ReportHeader(_Section):
+    Date: str = Field(NOT_AVAILABLE, description="Inspection date as DD.MM.YYYY, or 'Not Available'.")
+    Inspected_By: str = Field(NOT_AVAILABLE, description="Inspector name, or 'Not Available'.")
+    Report_ID: str = Field(NOT_AVAILABLE, description="Report ID, or 'Not Available'.")
+
+class Observation(_Section):
+    Area: str = Field("", description="Impacted area, e.g. 'Master Bedroom'.")
+    Issue: str = Field("", description="Finding, e.g. 'Wall dampness (Negative Side)'.")
+    Thermal_Delta: str = Field(NOT_AVAILABLE, description="Hotspot - Coldspot, e.g. '5.0C (Moisture Confirmed)', or 'Not Available'.")
+
+class SeverityAssessment(_Section):
+    score: str = Field(NOT_AVAILABLE, description="Overall score, e.g. '85.71%'.")
+    scale: str = Field(NOT_AVAILABLE, description="Severity, e.g. 'Moderate'.")
+    reasoning: str = Field("", description="Why this severity was assigned.")
+
+class DDRAnalysis(_Section):
+    """Structured result of the text analysis; one field per DDR section."""
+    report_header: ReportHeader = Field(default_factory=ReportHeader)
+    issue_summary: str = Field("", description="High-level summary of dampness, cracks, etc.")
+    observations: List[Observation] = Field(default_factory=list)
+    root_causes: List[str] = Field(default_factory=list)
+    severity_assessment: SeverityAssessment = Field(default_factory=SeverityAssessment)
+    recommended_actions: List[str] = Field(default_factory=list)
+    additional_notes: str = ""
+    missing_info: str = Field("", description="Missing data points or conflicts between the reports.")
+
+def parse_analysis(text: str) -> Optional[DDRAnalysis]:
+    """
+    Validates a text-analysis response into a DDRAnalysis.
+    Returns None for errors and responses without a usable JSON object.
+    """
+    if not text or text.startswith("Error"):
+        return None
+    data = parse_json_response(text)
+    if data is None:
+        return None
+    # Older free-text responses sometimes used null or a bare string where a list is expected
+    for key in ("observations", "root_causes", "recommended_actions"):
+        if data.get(key) is None:
+            data.pop(key, None)
+        elif isinstance(data[key], str):
+            data[key] = [data[key]]
+    try:
+        return DDRAnalysis.model_validate(data)
+    except ValidationError:
+        return None
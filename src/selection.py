@@ -0,0 +1,116 @@
+import io
+from typing import Any, Dict, List, Tuple
+from PIL import Image, ImageStat
+from src.ingestion import EncodedImage, PdfImage, as_pil_image
+
+# Source weights used as a tie-breaker: manual uploads and thermal reports are the most critical
+SOURCE_WEIGHTS = {"manual": 0.3, "thermal_pdf": 0.2, "inspection_pdf": 0.0}
+
+def _thumbnail(img, size: int = 64) -> Image.Image:
+    """Returns a small RGB copy of the image, decoding embedded / uploaded JPEGs at reduced scale when possible."""
+    if isinstance(img, (PdfImage, EncodedImage)) and img.format == "JPEG" and img._image is None:
+        thumb = Image.open(io.BytesIO(img.data))
+        # Let the JPEG decoder skip most of the DCT work instead of decoding full resolution
+        thumb.draft("RGB", (size, size))
+    else:
+        thumb = as_pil_image(img).copy()
+    thumb = thumb.convert("RGB")
+    thumb.thumbnail((size, size))
+    return thumb
+
+def perceptual_hash(img) -> int:
+    """64-bit difference hash (dHash): robust to rescaling and re-compression of the same photo."""
+    gray = _thumbnail(img).convert("L").resize((9, 8), Image.BILINEAR)
+    pixels = list(gray.getdata())
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            value = (value << 1) | (1 if left > right else 0)
+    return value
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+def thermal_likelihood(img) -> float:
+    """
+    Estimates (0..1) how likely an image is a false-colour thermal capture rather than a plain photo.
+    Thermal palettes (ironbow, rainbow) are strongly saturated across a wide range of hues.
+    """
+    hsv = _thumbnail(img).convert("HSV")
+    hues, sats, _ = hsv.split()
+    sat_values = list(sats.getdata())
+    saturated = [h for h, s in zip(hues.getdata(), sat_values) if s > 128]
+    saturated_ratio = len(saturated) / max(len(sat_values), 1)
+    if not saturated:
+        return 0.0
+    # Hue diversity: how many of 12 hue buckets the saturated pixels fall into
+    buckets = {h * 12 // 256 for h in saturated}
+    hue_spread = len(buckets) / 12
+    return min(1.0, saturated_ratio * 1.5) * min(1.0, hue_spread * 2)
+
+def information_score(img) -> float:
+    """Scores (0..1) how much visual content an image carries; logos and flat legend panels score low."""
+    thumb = _thumbnail(img)
+    entropy = thumb.convert("L").entropy()  # 0..8 bits
+    stddev = sum(ImageStat.Stat(thumb).stddev) / 3
+    width, height = thumb.size
+    aspect = max(width, height) / max(min(width, height), 1)
+    score = min(1.0, entropy / 7) * min(1.0, stddev / 40)
+    if aspect > 3:
+        # Very elongated images are usually colour scale bars or banners
+        score *= 0.5
+    return score
+
+def score_image(img, source: str = "inspection_pdf") -> Dict[str, float]:
+    """Relevance score for Vision analysis: thermal captures first, then content-rich photos."""
+    thermal = thermal_likelihood(img)
+    info = information_score(img)
+    return {
+        "thermal": thermal,
+        "information": info,
+        "score": thermal + info + SOURCE_WEIGHTS.get(source, 0.0),
+    }
+
+def select_images(groups: List[Tuple[str, list]], max_images: int = 20, hash_distance: int = 6) -> Dict[str, Any]:
+    """
+    Selects the images worth sending to Vision analysis.
+
+    groups: list of (source, images) pairs, e.g. [("manual", [...]), ("thermal_pdf", [...])].
+    1. Computes a perceptual hash per image and collapses near-duplicates
+       (Hamming distance <= hash_distance), keeping the best-scoring copy.
+    2. Ranks the remaining images by relevance (thermal colormap likelihood, content, source).
+    3. Keeps at most max_images.
+
+    Returns a dict with the selected "images" (best first) and counters for the UI.
+    """
+    candidates = []
+    errors = 0
+    for source, images in groups:
+        for img in images or []:
+            try:
+                info = score_image(img, source)
+                info.update({"image": img, "source": source, "hash": perceptual_hash(img)})
+                candidates.append(info)
+            except Exception as e:
+                print(f"Skipping an image during selection: {e}")
+                errors += 1
+
+    candidates.sort(key=lambda c: c["score"], reverse=True)
+
+    unique = []
+    for cand in candidates:
+        if any(hamming_distance(cand["hash"], kept["hash"]) <= hash_distance for kept in unique):
+            continue
+        unique.append(cand)
+
+    selected = unique[:max_images] if max_images is not None else unique
+    return {
+        "images": [c["image"] for c in selected],
+        "details": [{k: v for k, v in c.items() if k != "image"} for c in selected],
+        "total": len(candidates) + errors,
+        "duplicates_removed": len(candidates) - len(unique),
+        "dropped_by_budget": len(unique) - len(selected),
+        "errors": errors,
+    }
@@ -0,0 +1,58 @@
+import base64
+import json
+import time
+import urllib.error
+import urllib.request
+from typing import Any, Dict, List, Optional, Tuple
+
+def _request(url: str, data: Optional[bytes] = None, headers: Optional[dict] = None, timeout: float = 30) -> bytes:
+    req = urllib.request.Request(url, data=data, headers=headers or {}, method="POST" if data is not None else "GET")
+    with urllib.request.urlopen(req, timeout=timeout) as resp:
+        return resp.read()
+
+def submit_job(service_url: str, inspection_pdf: bytes, thermal_pdf: Optional[bytes] = None,
+               images: Optional[List[Tuple[str, bytes]]] = None, options: Optional[dict] = None,
+               api_key: Optional[str] = None) -> str:
+    """Submits a report bundle to the DDR service and returns the job id."""
+    payload = {
+        "inspection_pdf": base64.b64encode(inspection_pdf).decode("ascii"),
+        "thermal_pdf": base64.b64encode(thermal_pdf).decode("ascii") if thermal_pdf else None,
+        "images": [{"name": name, "data": base64.b64encode(data).decode("ascii")} for name, data in images or []],
+        "options": options or {},
+    }
+    headers = {"Content-Type": "application/json"}
+    if api_key:
+        headers["X-OpenAI-Key"] = api_key
+    body = _request(f"{service_url.rstrip('/')}/jobs", json.dumps(payload).encode("utf-8"), headers)
+    return json.loads(body)["job_id"]
+
+def get_job(service_url: str, job_id: str) -> Optional[Dict[str, Any]]:
+    """Returns the job status, or None if the service does not know the job."""
+    try:
+        return json.loads(_request(f"{service_url.rstrip('/')}/jobs/{job_id}"))
+    except urllib.error.HTTPError as e:
+        if e.code == 404:
+            return None
+        raise
+
+def download_artifact(service_url: str, job_id: str, fmt: str) -> bytes:
+    """Downloads a finished artifact ("md", "pdf" or "docx"); returns b"" if it is not available."""
+    try:
+        return _request(f"{service_url.rstrip('/')}/jobs/{job_id}/artifacts/{fmt}", timeout=120)
+    except urllib.error.HTTPError as e:
+        if e.code == 404:
+            return b""
+        raise
+
+def wait_for_job(service_url: str, job_id: str, poll_interval: float = 2.0, timeout: Optional[float] = None, on_status=None) -> Dict[str, Any]:
+    """Polls until the job is done or failed (or the timeout expires) and returns its last status."""
+    deadline = time.monotonic() + timeout if timeout else None
+    while True:
+        status = get_job(service_url, job_id) or {"job_id": job_id, "status": "unknown"}
+        if on_status:
+            on_status(status)
+        if status["status"] in ("done", "failed", "unknown"):
+            return status
+        if deadline and time.monotonic() > deadline:
+            return status
+        time.sleep(poll_interval)
@@ -0,0 +1,256 @@
+import importlib.util
+import re
+import shutil
+from functools import lru_cache
+from typing import Optional, Tuple
+from src.ingestion import as_pil_image
+from src.selection import thermal_likelihood
+
+# Bump when the reading logic changes, so readings stored as artifacts are not reused
+THERMAL_ANALYZER_VERSION = "3"
+# Hotspot - coldspot difference above which dampness is reported (same rule the Vision prompt uses)
+MOISTURE_DELTA_C = 4.0
+# Minimum palette likelihood (src.selection.thermal_likelihood) before a scale bar is searched for
+MIN_THERMAL_LIKELIHOOD = 0.3
+# Images are analyzed at most this wide; the result does not need full resolution
+ANALYSIS_WIDTH = 480
+# Share of the image pixels that must match the scale palette for a confident reading
+MIN_PALETTE_COVERAGE = 0.85
+# RGB distance up to which a pixel counts as a palette colour (leaves room for JPEG artefacts)
+MAX_PALETTE_DISTANCE = 40.0
+
+_TEMPERATURE = r"(-?\d{1,3}(?:[.,]\d+)?)\s*°?\s*([CF]?)(?![a-z])"
+_MAX_RE = re.compile(r"\bMax(?:imum)?\.?\s*(?:Temp(?:erature)?)?\s*[:=]?\s*" + _TEMPERATURE, re.IGNORECASE)
+_MIN_RE = re.compile(r"\bMin(?:imum)?\.?\s*(?:Temp(?:erature)?)?\s*[:=]?\s*" + _TEMPERATURE, re.IGNORECASE)
+# A scale-bar label as OCR reads it: the degree sign often comes out as "o" or "º"
+_LABEL_RE = re.compile(r"(-?\d{1,3}(?:[.,]\d+)?)\s*[°ºo*]?\s*([CF])?(?![a-z])", re.IGNORECASE)
+
+def _to_float(value: str) -> float:
+    return float(value.replace(",", "."))
+
+def _to_celsius(value: str, unit: str) -> float:
+    """A scale readout in °C (readouts without a unit are taken as °C)."""
+    temperature = _to_float(value)
+    return round((temperature - 32) * 5 / 9, 1) if unit.upper() == "F" else temperature
+
+def scale_from_text(text: Optional[str]) -> Optional[Tuple[float, float]]:
+    """
+    (max, min) temperature of the scale from a report page ("Max 31.2 °C  Min 24.6 °C"), in °C
+    (Fahrenheit readouts are converted). Returns None if the page has no readout or several different ones (ambiguous for one image).
+    """
+    if not text:
+        return None
+    maxima = {_to_celsius(v, unit) for v, unit in _MAX_RE.findall(text)}
+    minima = {_to_celsius(v, unit) for v, unit in _MIN_RE.findall(text)}
+    if len(maxima) != 1 or len(minima) != 1:
+        return None
+    high, low = maxima.pop(), minima.pop()
+    return (high, low) if high > low else None
+
+@lru_cache(maxsize=1)
+def _tesseract_available() -> bool:
+    return importlib.util.find_spec("pytesseract") is not None and shutil.which("tesseract") is not None
+
+def parse_label(text: str) -> Optional[Tuple[str, str]]:
+    """(value, unit) of a scale-bar label such as "32.1°C"; unit is "C", "F" or "" when none was read."""
+    match = _LABEL_RE.search(text or "")
+    return (match.group(1), (match.group(2) or "").upper()) if match else None
+
+def _ocr_label(region) -> Optional[Tuple[str, str]]:
+    """Reads a single temperature label (e.g. the value above the scale bar) with Tesseract, unit included."""
+    if region.size == 0 or not _tesseract_available():
+        return None
+    import pytesseract
+    from PIL import Image
+
+    try:
+        # No character whitelist: the unit glyphs have to come through as well
+        text = pytesseract.image_to_string(Image.fromarray(region).resize((region.shape[1] * 3, region.shape[0] * 3)),
+                                           config="--psm 7", timeout=5)
+    except Exception:
+        return None
+    return parse_label(text)
+
+def _longest_run(column) -> Tuple[int, int]:
+    """(start, length) of the longest run of True values in a 1-D boolean array."""
+    import numpy as np
+
+    padded = np.concatenate(([False], column, [False])).astype(np.int8)
+    edges = np.flatnonzero(np.diff(padded))
+    if len(edges) == 0:
+        return 0, 0
+    starts, ends = edges[::2], edges[1::2]
+    best = int(np.argmax(ends - starts))
+    return int(starts[best]), int(ends[best] - starts[best])
+
+def find_scale_bar(rgb, band: int = 5) -> Optional[Tuple[int, int, int, int]]:
+    """
+    Locates a vertical colour scale bar (FLIR style) near the left or right edge.
+    Returns (x, y, width, height) of the bar, or None.
+
+    A bar is a strip of `band` columns whose rows are uniform horizontally, spanning at least
+    40% of the image height, with colours changing gradually (no sharp steps) from top to bottom.
+    """
+    import numpy as np
+
+    height, width, _ = rgb.shape
+    pixels = rgb.astype(np.int16)
+    # Rows where a pixel matches its right neighbour, then windows of `band` matching columns
+    same = (np.abs(np.diff(pixels, axis=1)).sum(axis=2) < 12).astype(np.int32)
+    cumulative = np.concatenate((np.zeros((height, 1), np.int32), np.cumsum(same, axis=1)), axis=1)
+    uniform = (cumulative[:, band - 1:] - cumulative[:, :-(band - 1)]) == band - 1
+
+    edge = max(band, width // 4)
+    best = None
+    for x in list(range(0, edge)) + list(range(uniform.shape[1] - edge, uniform.shape[1])):
+        steps = np.abs(np.diff(pixels[:, x], axis=0)).sum(axis=1)
+        # Sharp vertical steps end a run, so the bar is not merged with a plain background around it
+        column = uniform[:, x].copy()
+        column[1:] &= steps < 60
+        start, length = _longest_run(column)
+        if length < height * 0.4 or (best is not None and length <= best[3]):
+            continue
+        colours = pixels[start:start + length, x]
+        # A gradient: clearly different colours at both ends
+        if np.abs(colours[0] - colours[-1]).sum() < 120:
+            continue
+        # Trim flat ends (background in the bar's end colour, e.g. black next to a black-to-white bar)
+        top = max(0, int(np.argmax(np.abs(colours - colours[0]).sum(axis=1) >= 12)) - 1)
+        bottom = len(colours) - max(0, int(np.argmax(np.abs(colours[::-1] - colours[-1]).sum(axis=1) >= 12)) - 1)
+        if bottom - top < height * 0.4:
+            continue
+        best = (x, start + top, band, bottom - top)
+    return best
+
+def _palette(rgb, bar):
+    """Bar colours from top (hottest) to bottom (coldest), resampled to at most 256 entries."""
+    import numpy as np
+
+    x, y, band, length = bar
+    # Skip the rim of the bar (borders, anti-aliasing)
+    inset = max(1, length // 50)
+    colours = rgb[y + inset:y + length - inset, x:x + band].astype(np.float32).mean(axis=1)
+    samples = np.linspace(0, len(colours) - 1, min(256, len(colours))).round().astype(int)
+    return colours[samples]
+
+def _scale_from_labels(rgb, bar) -> Optional[Tuple[float, float]]:
+    """
+    Reads the Max/Min labels printed above and below the scale bar, in °C. The camera may be set
+    to °F, so a scale whose unit could not be read (or whose labels disagree) is not used.
+    """
+    x, y, band, length = bar
+    height, width, _ = rgb.shape
+    label_height = max(12, height // 12)
+    x0, x1 = max(0, x - width // 10), min(width, x + band + width // 10)
+    high = _ocr_label(rgb[max(0, y - label_height):y, x0:x1])
+    low = _ocr_label(rgb[y + length:min(height, y + length + label_height), x0:x1])
+    if high is None or low is None:
+        return None
+    units = {high[1], low[1]} - {""}
+    if len(units) != 1:
+        return None
+    unit = units.pop()
+    high, low = _to_celsius(high[0], unit), _to_celsius(low[0], unit)
+    return (high, low) if high > low else None
+
+def _location(mask) -> str:
+    """Describes where the largest region of a mask lies ("upper left", "center", ...)."""
+    import cv2
+
+    count, _, stats, centroids = cv2.connectedComponentsWithStats(mask.astype("uint8"), connectivity=8)
+    if count <= 1:
+        return "center"
+    largest = 1 + int(stats[1:, cv2.CC_STAT_AREA].argmax())
+    cx, cy = centroids[largest]
+    height, width = mask.shape
+    vertical = ("upper", "middle", "lower")[min(2, int(3 * cy / height))]
+    horizontal = ("left", "center", "right")[min(2, int(3 * cx / width))]
+    if vertical == "middle":
+        return "center" if horizontal == "center" else horizontal
+    return vertical if horizontal == "center" else f"{vertical} {horizontal}"
+
+def temperature_map(rgb, palette, scale: Tuple[float, float]):
+    """
+    Maps each pixel to a temperature via its nearest palette colour (top of the bar = max).
+    Returns (temperatures, matched) where unmatched pixels (overlays, text) are NaN / False.
+    """
+    import numpy as np
+
+    high, low = scale
+    # Distances are computed once per distinct colour instead of once per pixel
+    flat = rgb.reshape(-1, 3).astype(np.int32)
+    codes, inverse = np.unique((flat[:, 0] << 16) | (flat[:, 1] << 8) | flat[:, 2], return_inverse=True)
+    colours = np.stack([codes >> 16, (codes >> 8) & 255, codes & 255], axis=1)
+    nearest = np.empty(len(colours), dtype=np.int64)
+    nearest_distance = np.empty(len(colours), dtype=np.float32)
+    # Blocks keep the colour x palette distance matrix small for noisy (JPEG) images
+    for start in range(0, len(colours), 4096):
+        diff = colours[start:start + 4096, None, :].astype(np.float32) - palette[None, :, :]
+        distances = np.einsum("ijk,ijk->ij", diff, diff)
+        nearest[start:start + 4096] = distances.argmin(axis=1)
+        nearest_distance[start:start + 4096] = np.sqrt(distances.min(axis=1))
+    fractions = nearest / max(1, len(palette) - 1)
+    temperatures = (high - fractions * (high - low))[inverse.ravel()].reshape(rgb.shape[:2])
+    matched = (nearest_distance <= MAX_PALETTE_DISTANCE)[inverse.ravel()].reshape(rgb.shape[:2])
+    temperatures[~matched] = np.nan
+    return temperatures, matched
+
+def analyze_thermal_image(img, scale: Optional[Tuple[float, float]] = None) -> Optional[dict]:
+    """
+    Reads a FLIR-style thermal image locally: finds the colour scale bar, gets its Max/Min
+    (from `scale`, the source page's text or OCR of the bar labels), maps the colours back to
+    temperatures and locates the hotspot and coldspot.
+
+    Returns None whenever any step is not confident (not a thermal image, no scale bar, no
+    readable scale, too few pixels on the palette); such images should go to Vision instead.
+    Otherwise returns {"max", "min", "hotspot", "coldspot", "delta", "moisture", "observation", ...}.
+    """
+    import numpy as np
+
+    try:
+        if thermal_likelihood(img) < MIN_THERMAL_LIKELIHOOD:
+            return None
+        pil = as_pil_image(img).convert("RGB")
+        if pil.width > ANALYSIS_WIDTH:
+            # NEAREST keeps palette colours intact (no blended in-between colours)
+            pil = pil.resize((ANALYSIS_WIDTH, max(1, round(pil.height * ANALYSIS_WIDTH / pil.width))), 0)
+        rgb = np.asarray(pil)
+        bar = find_scale_bar(rgb)
+        if bar is None:
+            return None
+        scale = scale or scale_from_text(getattr(img, "page_text", None)) or _scale_from_labels(rgb, bar)
+        if scale is None:
+            return None
+
+        x, _, band, _ = bar
+        width = rgb.shape[1]
+        # The scene is everything on the other side of the bar (minus a margin for its labels)
+        margin = max(band, width // 20)
+        scene = rgb[:, :max(0, x - margin)] if x > width / 2 else rgb[:, x + band + margin:]
+        if scene.shape[1] < width // 3:
+            return None
+        temperatures, matched = temperature_map(scene, _palette(rgb, bar), scale)
+        if matched.mean() < MIN_PALETTE_COVERAGE:
+            return None
+    except Exception:
+        # Undecodable or unusual images are left to Vision
+        return None
+
+    hotspot = float(np.nanpercentile(temperatures, 99.5))
+    coldspot = float(np.nanpercentile(temperatures, 0.5))
+    spread = max(hotspot - coldspot, 1e-6)
+    hot_area = _location(temperatures >= hotspot - 0.1 * spread)
+    cold_area = _location(temperatures <= coldspot + 0.1 * spread)
+    delta = hotspot - coldspot
+    moisture = delta > MOISTURE_DELTA_C
+    verdict = f"above {MOISTURE_DELTA_C:g}C, moisture likely" if moisture else "no significant moisture indication"
+    observation = (f"Thermal image (local analysis): scale {scale[1]:.1f}C to {scale[0]:.1f}C; "
+                   f"hotspot {hotspot:.1f}C ({hot_area}), coldspot {coldspot:.1f}C ({cold_area}); "
+                   f"delta {delta:.1f}C, {verdict}.")
+    return {
+        "max": scale[0], "min": scale[1],
+        "hotspot": round(hotspot, 1), "coldspot": round(coldspot, 1), "delta": round(delta, 1),
+        "hotspot_area": hot_area, "coldspot_area": cold_area,
+        "moisture": moisture, "coverage": round(float(matched.mean()), 3),
+        "observation": observation,
+    }
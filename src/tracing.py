@@ -0,0 +1,245 @@
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+# USD per 1M tokens (input, output); used for the estimated cost of LLM calls
+MODEL_PRICES = {
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+}
+# Numeric span attributes that are summed into counters (Prometheus) and run summaries
+SUMMED_ATTRIBUTES = ("bytes", "pages", "images", "prompt_tokens", "completion_tokens", "image_tokens", "cost_usd")
+DURATION_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# Process-wide switch for metrics and JSON logs; per-run summaries work whenever a run is active
+_enabled = os.getenv("DDR_TRACING", "").lower() in ("1", "true", "yes")
+_current_run = contextvars.ContextVar("ddr_trace_run", default=None)
+_logger = logging.getLogger("ddr.trace")
+
+def set_tracing(enabled: bool) -> None:
+    """Turns process-wide metrics and JSON span logs on or off."""
+    global _enabled
+    _enabled = enabled
+
+def tracing_enabled() -> bool:
+    return _enabled
+
+def configure_json_logs(path: Optional[str] = None) -> None:
+    """Writes one JSON line per span to `path` (or stderr for "-"); defaults to DDR_TRACE_LOG."""
+    path = path or os.getenv("DDR_TRACE_LOG")
+    if not path:
+        return
+    handler = logging.StreamHandler() if path == "-" else logging.FileHandler(path, encoding="utf-8")
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    _logger.addHandler(handler)
+    _logger.setLevel(logging.INFO)
+    _logger.propagate = False
+
+def estimate_cost(model: str, prompt_tokens: int = 0, completion_tokens: int = 0) -> float:
+    """Estimated USD cost of a call; 0 for unknown models."""
+    input_price, output_price = MODEL_PRICES.get(model, (0.0, 0.0))
+    return (prompt_tokens * input_price + completion_tokens * output_price) / 1_000_000
+
+class Span:
+    """One timed operation. Attributes are set at creation or later with set()."""
+    __slots__ = ("name", "attrs", "start", "duration", "error")
+
+    def __init__(self, name: str, attrs: dict):
+        self.name = name
+        self.attrs = attrs
+        self.start = time.perf_counter()
+        self.duration = 0.0
+        self.error = None
+
+    def set(self, **attrs) -> None:
+        self.attrs.update(attrs)
+
+    def fail(self, error) -> None:
+        """Marks the span as failed for errors that are handled (e.g. returned as "Error ..." strings)."""
+        self.error = str(error)
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def set(self, **attrs) -> None:
+        pass
+
+    def fail(self, error) -> None:
+        pass
+
+_NOOP_SPAN = _NoopSpan()
+
+class RunTrace:
+    """Collects the spans of one DDR run (all threads and tasks started from it) and summarizes them."""
+
+    def __init__(self, run_id: Optional[str] = None):
+        self.run_id = run_id or uuid.uuid4().hex[:12]
+        self.started = time.perf_counter()
+        self.finished = None
+        self.spans = []
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def add(self, span: Span) -> None:
+        with self._lock:
+            self.spans.append(span)
+
+    def increment(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def summary(self) -> Dict[str, Any]:
+        """Per-span-name count/duration/errors plus summed bytes, pages, images, tokens and cost."""
+        with self._lock:
+            spans = list(self.spans)
+            counters = dict(self.counters)
+        stages = {}
+        totals = {}
+        for span in spans:
+            stage = stages.setdefault(span.name, {"count": 0, "duration_s": 0.0, "errors": 0})
+            stage["count"] += 1
+            stage["duration_s"] += span.duration
+            stage["errors"] += span.error is not None
+            for attr in SUMMED_ATTRIBUTES:
+                value = span.attrs.get(attr)
+                if isinstance(value, (int, float)):
+                    stage[attr] = stage.get(attr, 0) + value
+                    if span.name.startswith("llm."):
+                        totals[attr] = totals.get(attr, 0) + value
+        for stage in stages.values():
+            stage["duration_s"] = round(stage["duration_s"], 4)
+            if "cost_usd" in stage:
+                stage["cost_usd"] = round(stage["cost_usd"], 6)
+        llm = {"calls": sum(s["count"] for name, s in stages.items() if name.startswith("llm.")), **totals, **counters}
+        if "cost_usd" in llm:
+            llm["cost_usd"] = round(llm["cost_usd"], 6)
+        return {
+            "run_id": self.run_id,
+            "duration_s": round((self.finished or time.perf_counter()) - self.started, 4),
+            "stages": stages,
+            "llm": llm,
+        }
+
+class MetricsRegistry:
+    """Process-wide span metrics, exported in the Prometheus text format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._spans = {}
+        self._counters = {}
+
+    def observe(self, span: Span) -> None:
+        with self._lock:
+            entry = self._spans.setdefault(span.name, {"count": 0, "sum": 0.0, "errors": 0, "buckets": [0] * len(DURATION_BUCKETS)})
+            entry["count"] += 1
+            entry["sum"] += span.duration
+            entry["errors"] += span.error is not None
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if span.duration <= bound:
+                    entry["buckets"][i] += 1
+            for attr in SUMMED_ATTRIBUTES:
+                value = span.attrs.get(attr)
+                if isinstance(value, (int, float)):
+                    key = (attr, span.name)
+                    self._counters[key] = self._counters.get(key, 0) + value
+
+    def increment(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            key = (name, "")
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def prometheus_text(self) -> str:
+        with self._lock:
+            spans = {name: dict(entry, buckets=list(entry["buckets"])) for name, entry in self._spans.items()}
+            counters = dict(self._counters)
+        lines = [
+            "# HELP ddr_span_duration_seconds Duration of DDR pipeline stages and LLM calls.",
+            "# TYPE ddr_span_duration_seconds histogram",
+        ]
+        for name, entry in sorted(spans.items()):
+            for bound, count in zip(DURATION_BUCKETS, entry["buckets"]):
+                lines.append(f'ddr_span_duration_seconds_bucket{{span="{name}",le="{bound}"}} {count}')
+            lines.append(f'ddr_span_duration_seconds_bucket{{span="{name}",le="+Inf"}} {entry["count"]}')
+            lines.append(f'ddr_span_duration_seconds_sum{{span="{name}"}} {entry["sum"]:.6f}')
+            lines.append(f'ddr_span_duration_seconds_count{{span="{name}"}} {entry["count"]}')
+        lines += ["# HELP ddr_span_errors_total Spans that ended with an exception.", "# TYPE ddr_span_errors_total counter"]
+        for name, entry in sorted(spans.items()):
+            lines.append(f'ddr_span_errors_total{{span="{name}"}} {entry["errors"]}')
+        for metric in sorted({attr for attr, _ in counters}):
+            lines.append(f"# TYPE ddr_{metric}_total counter")
+            for (attr, name), value in sorted(counters.items()):
+                if attr == metric:
+                    labels = f'{{span="{name}"}}' if name else ""
+                    lines.append(f"ddr_{metric}_total{labels} {value:g}")
+        return "\n".join(lines) + "\n"
+
+METRICS = MetricsRegistry()
+
+@contextmanager
+def start_run(run_id: Optional[str] = None):
+    """Collects every span of the enclosed work into a RunTrace (use .summary() for the sidebar / status)."""
+    run = RunTrace(run_id)
+    token = _current_run.set(run)
+    try:
+        yield run
+    finally:
+        run.finished = time.perf_counter()
+        _current_run.reset(token)
+
+def current_run() -> Optional[RunTrace]:
+    return _current_run.get()
+
+@contextmanager
+def span(name: str, **attrs):
+    """
+    Times the enclosed block. Yields a span whose attributes can be filled in with .set().
+    When tracing is disabled and no run is active this is a no-op.
+    """
+    run = _current_run.get()
+    if not _enabled and run is None:
+        yield _NOOP_SPAN
+        return
+    current = Span(name, attrs)
+    try:
+        yield current
+    except GeneratorExit:
+        # A consumer stopped reading a streaming generator early; not a failure
+        raise
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current.duration = time.perf_counter() - current.start
+        _finish(current, run)
+
+def _finish(current: Span, run: Optional[RunTrace]) -> None:
+    if run is not None:
+        run.add(current)
+    if _enabled:
+        METRICS.observe(current)
+        if _logger.isEnabledFor(logging.INFO):
+            record = {"ts": time.time(), "span": current.name, "duration_ms": round(current.duration * 1000, 3),
+                      "run_id": run.run_id if run else None, **current.attrs}
+            if current.error:
+                record["error"] = current.error
+            _logger.info(json.dumps(record, default=str))
+
+def increment(name: str, value: float = 1) -> None:
+    """Counts an event (e.g. a cache hit) in the current run and the metrics registry."""
+    run = _current_run.get()
+    if run is not None:
+        run.increment(name, value)
+    if _enabled:
+        METRICS.increment(name, value)
+
+def bind_context(fn):
+    """Wraps fn so it runs in a copy of the caller's context (keeps the current run in pool threads)."""
+    context = contextvars.copy_context()
+    # A context can only be entered by one thread at a time, so each call runs in its own copy
+    return lambda *args, **kwargs: context.copy().run(fn, *args, **kwargs)
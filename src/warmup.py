@@ -0,0 +1,45 @@
+import importlib
+import os
+import threading
+from typing import Iterable, Optional
+from src.tracing import span
+
+# Backends that src/ imports lazily, in the order the pipeline first needs them
+HEAVY_MODULES = (
+    "pdfplumber",
+    "numpy",
+    "langchain_openai",
+    "langchain_core.messages",
+    "cv2",
+    "xhtml2pdf.pisa",
+    "docx",
+)
+
+_thread = None
+_lock = threading.Lock()
+
+def warmup_enabled() -> bool:
+    return os.getenv("DDR_WARMUP", "1").lower() not in ("0", "false", "no")
+
+def _import_all(modules: Iterable[str]) -> None:
+    for name in modules:
+        with span("warmup.import", module=name) as import_span:
+            try:
+                importlib.import_module(name)
+            except Exception as e:
+                # Optional backends may be missing; the stage that needs one reports it
+                import_span.fail(e)
+
+def start_warmup(modules: Iterable[str] = HEAVY_MODULES) -> Optional[threading.Thread]:
+    """
+    Imports the heavy backends in a daemon thread (once per process), so the first report does not
+    pay for them while startup stays fast. Returns the thread, or None when DDR_WARMUP=0.
+    """
+    global _thread
+    if not warmup_enabled():
+        return None
+    with _lock:
+        if _thread is None:
+            _thread = threading.Thread(target=_import_all, args=(tuple(modules),), name="ddr-warmup", daemon=True)
+            _thread.start()
+        return _thread
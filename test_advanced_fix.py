@@ -1,6 +1,6 @@
 import os
 import sys
-from src.generation import generate_pdf
+from src.generation import generate_pdf, normalize_markdown
 
 # Worst-case malformed Markdown based on user reports
 WORST_CASE_MARKDOWN = """
@@ -21,7 +21,7 @@ The inspection revealed multiple areas with dampness at skirting levels, tile ho
 
 def test_pdf():
     print("Generating PDF from worst-case malformed Markdown...")
-    pdf_bytes = generate_pdf(WORST_CASE_MARKDOWN)
+    pdf_bytes = generate_pdf(normalize_markdown(WORST_CASE_MARKDOWN))
     
     if pdf_bytes:
         with open("test_advanced_fix.pdf", "wb") as f:
@@ -0,0 +1,57 @@
+from src.chunking import merge_analyses
+
+FIRST_CHUNK = {
+    "report_header": {"Property Name": "Not Available", "Inspection Date": "12.03.2024"},
+    "issue_summary": "Dampness in the hall.",
+    "observations": [
+        {"Area": "Hall", "Issue": "Skirting dampness", "Thermal Finding": "Not Available"},
+    ],
+    "root_causes": ["Gaps in tile grouting"],
+    "severity_assessment": {"score": "N/A", "scale": "Not Available", "reasoning": ""},
+    "recommended_actions": ["Re-grout bathroom tiles"],
+    "additional_notes": "",
+    "missing_info": "Not Available",
+}
+
+SECOND_CHUNK = {
+    "report_header": {"Property Name": "Flat 103", "Inspection Date": "dd.mm.yyyy"},
+    "issue_summary": "Hollowness in the kitchen.",
+    "observations": [
+        {"Area": " hall ", "Issue": "Skirting Dampness", "Thermal Finding": "Cold spot, 4.1 °C below ambient"},
+        {"Area": "Kitchen", "Issue": "Tile hollowness", "Thermal Finding": "Not Available"},
+        "not an observation",
+    ],
+    "root_causes": ["gaps in tile grouting", "Plumbing leak"],
+    "severity_assessment": {"score": "6", "scale": "1-10", "reasoning": "Moisture is spreading"},
+    "recommended_actions": ["Re-grout bathroom tiles", "Fix the plumbing leak"],
+    "additional_notes": "Dampness in the hall.",
+    "missing_info": "Not Available",
+}
+
+def test_merge():
+    print("Merging chunk analyses...")
+    merged = merge_analyses([FIRST_CHUNK, SECOND_CHUNK])
+
+    # Header fields take the first real value
+    assert merged["report_header"] == {"Property Name": "Flat 103", "Inspection Date": "12.03.2024"}
+
+    # The same (Area, Issue) is one observation, with fields filled in from later chunks
+    assert [(obs["Area"], obs["Issue"]) for obs in merged["observations"]] == [("Hall", "Skirting dampness"), ("Kitchen", "Tile hollowness")]
+    assert merged["observations"][0]["Thermal Finding"] == "Cold spot, 4.1 °C below ambient"
+
+    assert merged["root_causes"] == ["Gaps in tile grouting", "Plumbing leak"]
+    assert merged["recommended_actions"] == ["Re-grout bathroom tiles", "Fix the plumbing leak"]
+    assert merged["severity_assessment"]["score"] == "6"
+    assert merged["issue_summary"] == "Dampness in the hall. Hollowness in the kitchen."
+    assert merged["additional_notes"] == "Dampness in the hall."
+    assert merged["missing_info"] == ""
+    print(f"Success! {len(merged['observations'])} observations, severity {merged['severity_assessment']['score']}")
+
+def test_merge_without_severity():
+    merged = merge_analyses([{"observations": []}, {}])
+    assert merged["observations"] == []
+    assert merged["severity_assessment"] == {"score": "Not Available", "scale": "Not Available", "reasoning": ""}
+
+if __name__ == "__main__":
+    test_merge()
+    test_merge_without_severity()
@@ -1,6 +1,6 @@
 import os
 import sys
-from src.generation import generate_pdf
+from src.generation import generate_pdf, normalize_markdown
 
 # Intentional malformed Markdown (no newline before header)
 MALFORMED_MARKDOWN = """
@@ -16,7 +16,7 @@ This is a paragraph that ends without a newline## 2. AREA-WISE OBSERVATIONS
 
 def test_pdf():
     print("Generating test PDF with malformed headers...")
-    pdf_bytes = generate_pdf(MALFORMED_MARKDOWN)
+    pdf_bytes = generate_pdf(normalize_markdown(MALFORMED_MARKDOWN))
     
     if pdf_bytes:
         with open("test_formatting_fix.pdf", "wb") as f:
@@ -0,0 +1,62 @@
+from src.generation import build_document, generate_ddr_markdown, normalize_markdown, render_html
+
+CLEAN_MARKDOWN = """# Report
+Some *italic*, **bold** and `code` text.
+
+## 1. Section
+- Hall
+  - Skirting dampness
+1. Grouting
+
+| Area | Issue |
+|---|---|
+| **Hall** | Dampness |
+
+---
+**Generated by AI DDR System**
+"""
+
+# LLM-style glitches: header merged into a paragraph, bullets run together, duplicate '#'
+MALFORMED_MARKDOWN = """Summary of the issues found## 2. AREA-WISE OBSERVATIONS
+- **Hall:** dampness- **Kitchen:** hollowness
+# # 3. PROBABLE ROOT CAUSE
+#
+## 4. SEVERITY ASSESSMENT
+"""
+
+def _headings(blocks) -> list:
+    return [(block["level"], "".join(text for text, *_ in block["inlines"])) for block in blocks if block["type"] == "heading"]
+
+def test_parser():
+    print("Parsing clean Markdown...")
+    blocks = build_document(CLEAN_MARKDOWN)
+    assert [block["type"] for block in blocks] == ["heading", "paragraph", "heading", "list", "list", "table", "hr", "paragraph"]
+    assert _headings(blocks) == [(1, "Report"), (2, "1. Section")]
+    assert blocks[1]["lines"][0] == [("Some ", False, False, False), ("italic", False, True, False), (", ", False, False, False),
+                                     ("bold", True, False, False), (" and ", False, False, False), ("code", False, False, True),
+                                     (" text.", False, False, False)]
+    bullets = blocks[3]
+    assert not bullets["ordered"] and bullets["items"][0]["children"][0]["items"][0]["inlines"] == [("Skirting dampness", False, False, False)]
+    assert blocks[4]["ordered"]
+    assert blocks[5]["header"] == [[("Area", False, False, False)], [("Issue", False, False, False)]]
+    assert blocks[5]["rows"] == [[[("Hall", True, False, False)], [("Dampness", False, False, False)]]]
+    assert "<hr />" in render_html(blocks)
+    print("Success! Blocks:", [block["type"] for block in blocks])
+
+def test_normalization():
+    print("Normalizing LLM-style Markdown...")
+    assert normalize_markdown(CLEAN_MARKDOWN) == CLEAN_MARKDOWN
+
+    repaired = normalize_markdown(MALFORMED_MARKDOWN)
+    blocks = build_document(repaired)
+    assert _headings(blocks) == [(2, "2. AREA-WISE OBSERVATIONS"), (1, "3. PROBABLE ROOT CAUSE"), (2, "4. SEVERITY ASSESSMENT")]
+    bullets = [block for block in blocks if block["type"] == "list"][0]
+    assert len(bullets["items"]) == 2
+
+    # Free-form LLM reports are repaired, reports filled from the template are not touched
+    assert generate_ddr_markdown({"report_content": MALFORMED_MARKDOWN}, "") == repaired
+    print("Success! Headings:", _headings(blocks))
+
+if __name__ == "__main__":
+    test_parser()
+    test_normalization()
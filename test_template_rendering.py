@@ -0,0 +1,24 @@
+from src.generation import build_document, normalize_markdown, render_html
+
+TEMPLATE_PATH = "assets/main_ddr_template.txt"
+
+def test_template():
+    print("Rendering the DDR template...")
+    with open(TEMPLATE_PATH, "r", encoding="utf-8") as f:
+        template = f.read()
+
+    # Clean markdown must come out of the LLM repairs unchanged
+    assert normalize_markdown(template) == template
+
+    blocks = build_document(template)
+    levels = [block["level"] for block in blocks if block["type"] == "heading"]
+    assert levels == [1, 2, 2, 2, 2, 2, 2, 2], levels
+
+    html_content = render_html(blocks)
+    assert html_content.count("<hr />") == 2
+    assert "<strong>Generated by AI DDR System</strong>" in html_content
+    assert "<p>--" not in html_content
+    print(f"Success! Heading levels: {levels}")
+
+if __name__ == "__main__":
+    test_template()
@@ -0,0 +1,38 @@
+from src.ingestion import compact_pages
+from src.thermal import parse_label, scale_from_text
+
+def _page(number: int, findings: list) -> str:
+    readings = [f"Reading {number}-{i}" for i in range(4)]
+    return "\n".join(["ACME Inspections Pvt Ltd", "Site Report"] + readings + findings + readings + [f"Page {number} of 3"])
+
+def test_compact_pages():
+    print("Compacting report pages...")
+    pages = [_page(1, ["Hall skirting shows dampness"]), _page(2, ["Hall skirting shows dampness"]), _page(3, [])]
+    result = compact_pages(pages)
+
+    # The header and footer are kept where they first appear only
+    assert result["pages"][0].startswith("ACME Inspections Pvt Ltd\nSite Report\n")
+    assert result["pages"][0].endswith("\nPage 1 of 3")
+    assert all("ACME" not in page and "Page " not in page for page in result["pages"][1:])
+    # A finding repeated in the body of several pages is content
+    assert [page.count("Hall skirting shows dampness") for page in result["pages"]] == [1, 1, 0]
+    assert result["chars_after"] < result["chars_before"]
+    print(f"Success! Ratio {result['ratio']:.2f}, {result['repeated_lines']} repeated lines dropped")
+
+def test_thermal_scale():
+    print("Parsing thermal scale readouts...")
+    assert scale_from_text("Max 31.2 °C  Min 24.6 °C") == (31.2, 24.6)
+    assert scale_from_text("Max 88.2 °F  Min 76.3 °F") == (31.2, 24.6)
+    # Several different readouts on one page are ambiguous
+    assert scale_from_text("Max 31 Min 24 Max 33") is None
+    assert scale_from_text("") is None
+
+    assert parse_label("32.1°C") == ("32.1", "C")
+    assert parse_label("90.5 f") == ("90.5", "F")
+    assert parse_label("27.4") == ("27.4", "")
+    assert parse_label("no reading") is None
+    print("Success!")
+
+if __name__ == "__main__":
+    test_compact_pages()
+    test_thermal_scale()